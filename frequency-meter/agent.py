@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Acquisition agent executable: measures the devices of this host, without
+user interface, and forwards their samples to the aggregator of the
+application (started with --aggregator-port).
+"""
+# Standard libraries
+import argparse
+import logging
+import logging.config
+import signal
+import socket
+import sys
+# Third party libraries
+from PyQt5 import QtCore
+# Local libraries
+from main import LOGGING
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+            description="Frequency meter acquisition agent")
+    parser.add_argument("--aggregator", required=True, metavar="HOST:PORT",
+                        help="address of the application aggregator")
+    parser.add_argument("--name", default=socket.gethostname(),
+                        help="agent name, prefix of its devices in the "
+                             "application (the host name by default)")
+    parser.add_argument("--device", action="append", required=True,
+                        metavar="FILE", dest="devices",
+                        help="device file of a device to measure; can be "
+                             "given several times")
+    parser.add_argument("--channels", default="1",
+                        help="comma separated channels measured in every "
+                             "device, starting at 1")
+    parser.add_argument("--impedance",
+                        help="input impedance, the first of every device by "
+                             "default")
+    parser.add_argument("--fetch-time", type=float, default=0.1,
+                        help="period (s) to fetch the devices")
+    parser.add_argument("--sample-time", type=float, default=0.1,
+                        help="gate time (s) of the devices")
+    parser.add_argument("--batch-interval", type=float, default=0.1,
+                        help="maximum time (s) a sample waits to be sent")
+    parser.add_argument("--backlog", type=int, default=100000,
+                        help="samples kept while the aggregator is "
+                             "unreachable")
+    parser.add_argument("--threaded", action="store_true",
+                        help="run the measurement timer in its own thread")
+    parser.add_argument("--log-level", default="INFO",
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    return parser.parse_args(argv)
+
+
+def configure_logging(args):
+    logging.config.dictConfig(LOGGING)
+    handler = logging.StreamHandler()
+    handler.setLevel(args.log_level)
+    handler.setFormatter(logging.Formatter(
+            LOGGING['formatters']['simple']['format']))
+    logging.getLogger('view').addHandler(handler)
+    return
+
+
+def run(args):
+    # Local libraries
+    from view import freqmeterdevice
+    from view import measurement_engine
+    from view import remote
+
+    logger = logging.getLogger("view")
+    # The measurement timers need a Qt event loop, but no user interface
+    app = QtCore.QCoreApplication(sys.argv)
+    devices = []
+    for path in args.devices:
+        device = freqmeterdevice.FreqMeter.get_freq_meter(path)
+        if device is None:
+            logger.error("Unknown vendor in {}".format(path))
+            return 1
+        if not device.connect() or not device.is_ready():
+            logger.error("Unable to connect to device {}".format(
+                    device.get_name()))
+            return 1
+        logger.info("Connected to device {}".format(device.get_name()))
+        devices.append(device)
+
+    engine = measurement_engine.MeasurementEngine(threaded=args.threaded,
+                                                  adaptive=True)
+    agent = remote.AcquisitionAgent(
+            args.name, remote.parse_address(args.aggregator), engine,
+            args.batch_interval, args.backlog)
+    channels = [int(channel) - 1 for channel in args.channels.split(",")]
+    agent.start(devices, args.fetch_time, args.sample_time, channels,
+                args.impedance)
+
+    # Quit on Ctrl+C or SIGTERM. The timer lets the interpreter run the
+    # signal handlers while Qt waits for events.
+    signal.signal(signal.SIGINT, lambda *_: app.quit())
+    signal.signal(signal.SIGTERM, lambda *_: app.quit())
+    wakeup = QtCore.QTimer()
+    wakeup.timeout.connect(lambda: None)
+    wakeup.start(200)
+    result = app.exec_()
+    agent.stop()
+    for device in devices:
+        device.disconnect()
+    return result
+
+
+if __name__ == '__main__':
+    arguments = parse_arguments()
+    configure_logging(arguments)
+    sys.exit(run(arguments))
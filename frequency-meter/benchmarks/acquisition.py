@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Acquisition throughput and scaling benchmark.
+
+N simulated Uvigo meters are launched in local ports and measured with
+every engine configuration, sweeping the number of meters and the fetch
+period. Run it from the frequency-meter folder:
+
+    python -m benchmarks.acquisition --output acquisition.json
+"""
+# Standard libraries
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+# Third party libraries
+from PyQt5 import QtCore
+import yaml
+# Local libraries
+from benchmarks import common
+from view import freqmeterdevice
+from view import instrumentation
+from view import measurement_engine
+from view import simulator
+
+# Engine configurations compared, as MeasurementEngine arguments
+ENGINES = {
+    "sequential": {"threaded": False, "adaptive": False},
+    "threaded": {"threaded": True, "adaptive": False},
+    "adaptive": {"threaded": False, "adaptive": True},
+}
+# A run is saturated when it fetches less than this fraction of the
+# requested fetches
+SATURATION = 0.9
+
+
+def write_device_file(directory, index, address, mode):
+    """Write the device file of a simulated meter. Return its path."""
+    name = "Simulator-{}".format(index)
+    data = {
+        "channels": {
+            "Quantity": "1",
+            "SigTypes": {"S1": "coarse", "S2": "fine", "S3": "fineCDT",
+                         "S4": ""},
+            "Signals": "3",
+        },
+        "communications": {
+            "Properties": {"CommProp1": address[0],
+                           "CommProp2": str(address[1]),
+                           "CommProp3": "", "CommProp4": ""},
+            "Protocol": "TCP/IP",
+        },
+        "general": {"FirmVersion": "", "Model": "", "Name": name,
+                    "Serial_N": "", "Vendor": "Uvigo"},
+        "impedance": {"R1MOhm": "True", "R50Ohm": "True"},
+        "acquisition": {"Mode": mode},
+    }
+    path = os.path.join(directory, "{}.yml".format(name))
+    with open(path, "w") as openfile:
+        yaml.dump(data, openfile, default_flow_style=False)
+    return path
+
+
+class FetchProbe(object):
+    """Record the start time and the latency of every fetch of a device."""
+    def __init__(self, device):
+        self.starts = []
+        self.latencies = []
+        self.__store_freq = device.store_freq
+        device.store_freq = self.store_freq
+
+    def store_freq(self):
+        start = time.perf_counter()
+        result = self.__store_freq()
+        self.starts.append(start)
+        self.latencies.append(time.perf_counter() - start)
+        return result
+
+
+def stdev(values):
+    return statistics.pstdev(values) if len(values) > 1 else 0.0
+
+
+def run_session(app, engine_name, device_files, period, duration):
+    """Measure the devices with an engine for duration seconds."""
+    devices = []
+    for path in device_files:
+        device = freqmeterdevice.FreqMeter.get_freq_meter(path)
+        if not device.connect():
+            raise RuntimeError("Unable to connect to {}".format(path))
+        devices.append(device)
+    probes = [FetchProbe(device) for device in devices]
+    engine = measurement_engine.MeasurementEngine(**ENGINES[engine_name])
+    for device in devices:
+        device.start_measurement(period, 0, "50Ω")
+    cpu = time.process_time()
+    start = time.perf_counter()
+    engine.start(devices, period)
+    QtCore.QTimer.singleShot(int(duration * 1000), app.quit)
+    app.exec_()
+    engine.stop()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+    missed_ticks = sum(schedule.missed_ticks
+                       for schedule in engine.get_schedules())
+    for device in devices:
+        device.stop_measurement()
+        device.disconnect()
+
+    fetches = sum(len(probe.starts) for probe in probes)
+    latencies = [latency for probe in probes for latency in probe.latencies]
+    intervals = [later - earlier for probe in probes
+                 for earlier, later in zip(probe.starts, probe.starts[1:])]
+    sample_intervals = []
+    for device in devices:
+        timestamps = device.get_measurement_data()[0].get_timestamps()
+        sample_intervals.extend((later - earlier) / 1e9 for earlier, later
+                                in zip(timestamps, timestamps[1:]))
+    requested = len(devices) / period
+    fetch_rate = fetches / elapsed
+    return {
+        "engine": engine_name,
+        "devices": len(devices),
+        "period_s": period,
+        "duration_s": elapsed,
+        "requested_fetch_rate_hz": requested,
+        "fetch_rate_hz": fetch_rate,
+        "sample_rate_hz": sum(device.get_effective_rate()
+                              for device in devices),
+        "samples": sum(device.get_sample_count() for device in devices),
+        "stale_fetches": sum(device.get_stale_count() for device in devices),
+        "missed_ticks": missed_ticks,
+        "fetch_latency_s": common.summarize(latencies),
+        "fetch_interval_s": common.summarize(intervals),
+        "fetch_jitter_s": stdev(intervals),
+        "timestamp_jitter_s": stdev(sample_intervals),
+        "cpu_percent": 100 * cpu / elapsed,
+        "rss_bytes": instrumentation.rss_bytes(),
+        "saturated": fetch_rate < SATURATION * requested,
+    }
+
+
+def find_saturation(runs):
+    """
+    Return, for every engine and period, the smallest number of devices
+    whose run was saturated, None if none was.
+    """
+    saturation = {}
+    for run in runs:
+        key = "{}@{}s".format(run["engine"], run["period_s"])
+        saturation.setdefault(key, None)
+        if run["saturated"] and (saturation[key] is None or
+                                 run["devices"] < saturation[key]):
+            saturation[key] = run["devices"]
+    return saturation
+
+
+def run(argv=None):
+    parser = argparse.ArgumentParser(
+            description="Benchmark the acquisition from simulated meters")
+    parser.add_argument("--devices", type=int, nargs="+",
+                        default=[1, 2, 4, 8, 16],
+                        help="numbers of simulated meters")
+    parser.add_argument("--periods", type=float, nargs="+",
+                        default=[0.1, 0.05, 0.01],
+                        help="fetch periods (and gate times), in seconds")
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES),
+                        choices=list(ENGINES))
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="reply latency of the simulators, in seconds")
+    parser.add_argument("--mode", default="poll",
+                        choices=["poll", "buffered", "stream"],
+                        help="acquisition mode of the meters")
+    parser.add_argument("--duration", type=float, default=5.0,
+                        help="length of every run, in seconds")
+    parser.add_argument("--output", help="JSON file, stdout by default")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    app = QtCore.QCoreApplication(sys.argv[:1])
+    servers = simulator.start_simulators(max(args.devices), port=0,
+                                         latency=args.latency)
+    runs = []
+    with tempfile.TemporaryDirectory() as directory:
+        device_files = [
+            write_device_file(directory, index, server.server_address,
+                              args.mode)
+            for index, server in enumerate(servers)]
+        for engine_name in args.engines:
+            for period in args.periods:
+                for count in sorted(args.devices):
+                    runs.append(run_session(app, engine_name,
+                                            device_files[:count], period,
+                                            args.duration))
+                    sys.stderr.write(
+                            "{engine}: {devices} devices every {period_s} s,"
+                            " {fetch_rate_hz:.1f} of "
+                            "{requested_fetch_rate_hz:.1f} fetches/s\n"
+                            "".format(**runs[-1]))
+    for server in servers:
+        server.shutdown()
+    results = {
+        "latency_s": args.latency,
+        "mode": args.mode,
+        "runs": runs,
+        "saturation_devices": find_saturation(runs),
+    }
+    common.write_results("acquisition", results, args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run())
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Helpers shared by the benchmarks"""
+# Standard libraries
+import datetime
+import json
+import platform
+import subprocess
+import sys
+
+
+def percentile(values, percent):
+    """Return the nearest-rank percentile of a list of values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, int(round(percent / 100 * len(ordered))) - 1)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def summarize(values):
+    """Return the statistics of a list of measured values."""
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "min": min(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+                ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+                universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(benchmark, results, output=None):
+    """
+    Write the results of a benchmark as JSON, with the environment they
+    were obtained in, to the output file or to stdout.
+    """
+    report = {
+        "benchmark": benchmark,
+        "date": datetime.datetime.now().isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if output:
+        with open(output, "w") as openfile:
+            json.dump(report, openfile, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    return report
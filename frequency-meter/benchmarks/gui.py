@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Startup and interaction benchmarks of the main window.
+
+The window runs on the offscreen Qt platform, with Test devices. Run it
+from the frequency-meter folder, where the device files are found:
+
+    python -m benchmarks.gui --output gui.json
+"""
+# Standard libraries
+import argparse
+import array
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+# Third party libraries
+from PyQt5 import QtCore, QtWidgets
+# Local libraries
+from benchmarks import common
+from model import measurement_store
+from view import instrumentation
+from view import startup
+
+logger = logging.getLogger("view")
+
+# Sample period of the generated history, in ns
+SAMPLE_PERIOD = 100000000
+
+
+def run_startup_child():
+    """
+    Start the application until the plot is shown, and print the time of
+    every startup stage as JSON. Run in a fresh interpreter by
+    measure_startup.
+    """
+    stages = {}
+    start = time.perf_counter()
+
+    def stage(name):
+        stages[name] = time.perf_counter() - start
+        if name == "plot canvas built":
+            # Let the canvas be painted before quitting
+            QtCore.QTimer.singleShot(0, app.quit)
+        return
+
+    app = QtWidgets.QApplication(sys.argv[:1])
+    stage("application created")
+    form = startup.MainWindow()
+    stage("main window built")
+    form.canvas_ready.connect(lambda: stage("plot canvas built"))
+    form.show()
+    stage("main window shown")
+    app.exec_()
+    stage("first paint")
+    json.dump(stages, sys.stdout)
+    return 0
+
+
+def measure_startup(runs):
+    """Measure the cold startup until the first paint of the plot."""
+    totals = []
+    stages = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.check_output(
+                [sys.executable, "-m", "benchmarks.gui", "--startup-child"],
+                universal_newlines=True)
+        totals.append(time.perf_counter() - start)
+        stages.append(json.loads(output))
+    return {
+        "total_s": common.summarize(totals),
+        "stages_s": {name: common.summarize([run[name] for run in stages])
+                     for name in stages[0]},
+    }
+
+
+def connect_device(window, device_name):
+    """Connect a device in the first slot. Return the connection time."""
+    slot = window._MainWindow__slots[0]
+    slot.selector.setCurrentText(device_name)
+    start = time.perf_counter()
+    window._MainWindow__connect_device(0)
+    elapsed = time.perf_counter() - start
+    if slot.get_device_name() != device_name:
+        raise RuntimeError("Unable to connect to {}".format(device_name))
+    return elapsed
+
+
+def measure_connect(window, device_name, repeat):
+    times = []
+    for _ in range(repeat):
+        times.append(connect_device(window, device_name))
+        window._MainWindow__disconnect_device(0)
+    return {"connect_s": common.summarize(times)}
+
+
+def fill_history(device, size):
+    """Fill the measurements of the first channel with size samples."""
+    series = device.get_measurement_data()[0]
+    start = measurement_store.now_ns()
+    timestamps = array.array('q', range(start, start + size*SAMPLE_PERIOD,
+                                        SAMPLE_PERIOD))
+    block = [random.gauss(10, 1) for _ in range(min(size, 1000))]
+    columns = []
+    for _ in series.get_signals():
+        column = array.array('d', block) * (size // len(block))
+        column.extend(block[:size - len(column)])
+        columns.append(column)
+    series.extend(timestamps, columns)
+    return series
+
+
+def measure_history(window, device, sizes, repeat, save_max):
+    """
+    Measure, for every history length, the plot frame time, the memory
+    taken by every sample and the throughput of saving the data.
+    """
+    slot = window._MainWindow__slots[0]
+    for control in slot.signal_controls:
+        if control.isEnabled():
+            control.setChecked(True)
+    results = []
+    save_file = tempfile.NamedTemporaryFile(suffix=".txt", delete=False)
+    save_file.close()
+    save_dialog = QtWidgets.QFileDialog.getSaveFileName
+    QtWidgets.QFileDialog.getSaveFileName = staticmethod(
+            lambda *args, **kwargs: (save_file.name, ""))
+    try:
+        for size in sizes:
+            # Free the previous history before measuring the memory
+            device.start_measurement(0.1, [0], device.get_impedances()[0])
+            device.stop_measurement()
+            rss = instrumentation.rss_bytes()
+            fill_history(device, size)
+            result = {
+                "samples": size,
+                "memory_per_sample_bytes":
+                    (instrumentation.rss_bytes() - rss) / size,
+            }
+            # Frames are rendered out of the GUI thread while measuring;
+            # the whole drawing is measured on the interactive plot
+            frame_times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                window._MainWindow__draw_canvas()
+                QtWidgets.QApplication.processEvents()
+                frame_times.append(time.perf_counter() - start)
+            result["frame_s"] = common.summarize(frame_times)
+            if size <= save_max:
+                start = time.perf_counter()
+                window._MainWindow__save_data()
+                elapsed = time.perf_counter() - start
+                result["save_s"] = elapsed
+                result["save_samples_per_s"] = size / elapsed
+                result["save_bytes_per_s"] = (
+                        os.path.getsize(save_file.name) / elapsed)
+            results.append(result)
+            logger.info("Measured a history of {} samples".format(size))
+    finally:
+        QtWidgets.QFileDialog.getSaveFileName = save_dialog
+        os.remove(save_file.name)
+    return results
+
+
+def run(argv=None):
+    parser = argparse.ArgumentParser(
+            description="Benchmark the startup and the plot of the main "
+                        "window, with Test devices")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1000, 10000, 100000, 1000000, 10000000],
+                        help="history lengths, in samples")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="repetitions of every measurement")
+    parser.add_argument("--startup-runs", type=int, default=3,
+                        help="cold startups measured")
+    parser.add_argument("--save-max", type=int, default=1000000,
+                        help="longest history saved to a file")
+    parser.add_argument("--device", default="Test-device1",
+                        help="device file used, a Test device")
+    parser.add_argument("--output", help="JSON file, stdout by default")
+    parser.add_argument("--startup-child", action="store_true",
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.startup_child:
+        return run_startup_child()
+
+    logging.basicConfig(level=logging.WARNING)
+    results = {"startup": measure_startup(args.startup_runs)}
+    app = QtWidgets.QApplication(sys.argv[:1])
+    window = startup.MainWindow()
+    window.show()
+    # Build the plot canvas
+    app.processEvents()
+    results["connect"] = measure_connect(window, args.device, args.repeat)
+    connect_device(window, args.device)
+    device = window._MainWindow__devices[0]
+    results["history"] = measure_history(window, device, args.sizes,
+                                         args.repeat, args.save_max)
+    window._MainWindow__disconnect_device(0)
+    common.write_results("gui", results, args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run())
@@ -1,8 +1,14 @@
 #!/usr/bin/env python3
 """Application main executable, for initializing the whole program"""
 # Standard libraries
+import argparse
+import cProfile
 import logging.config
+import logging.handlers
+import pstats
+import queue
 import sys
+import time
 
 LOGGING = {
     'version': 1,
@@ -14,25 +20,195 @@ LOGGING = {
         'simple': {
             'format': '%(asctime)s %(levelname)8s: %(message)s'
         },
-    },
-    'handlers': {
-        'file_view': {
-            'level': 'DEBUG',
-            'formatter': 'verbose',
-            'class': 'logging.FileHandler',
-            'filename': 'tmp.log',
-            'delay': True
+        # Tab separated fields, with the epoch time, for parsing the logs
+        'compact': {
+            'format': '%(created).6f\t%(levelname).1s\t%(threadName)s\t'
+                      '%(module)s:%(lineno)d\t%(message)s'
         },
     },
     'loggers': {
         'view': {
-            'handlers': ['file_view'],
+            'handlers': [],
             'level': 'DEBUG'
         },
     }
 }
 
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+            description="Frequency meter application")
+    parser.add_argument("--log-file", default="tmp.log",
+                        help="file where the application log is written")
+    parser.add_argument("--log-format", default="verbose",
+                        choices=["verbose", "compact"],
+                        help="compact writes tab separated fields")
+    parser.add_argument("--log-rotate", default="none",
+                        choices=["none", "size", "time"],
+                        help="rotate the log file by size or by time")
+    parser.add_argument("--log-max-bytes", type=int, default=10*1024*1024,
+                        help="size of a log file when rotating by size")
+    parser.add_argument("--log-when", default="midnight",
+                        help="rotation interval when rotating by time, as "
+                             "in logging.handlers.TimedRotatingFileHandler")
+    parser.add_argument("--log-backups", type=int, default=5,
+                        help="number of rotated log files kept")
+    parser.add_argument("--metrics-port", type=int,
+                        help="serve the acquisition metrics, in Prometheus "
+                             "format, on this port")
+    parser.add_argument("--metrics-host", default="127.0.0.1",
+                        help="interface where the metrics are served")
+    parser.add_argument("--publish", metavar="ADDRESS",
+                        help="publish the live samples on HOST:PORT, or on "
+                             "the Unix socket unix:PATH")
+    parser.add_argument("--publish-format", default="json",
+                        choices=["json", "binary"],
+                        help="encoding of the published samples")
+    parser.add_argument("--publish-queue", type=int, default=1000,
+                        help="samples queued for every subscriber")
+    parser.add_argument("--publish-drop", default="oldest",
+                        choices=["oldest", "newest", "disconnect"],
+                        help="what is done when a subscriber queue is full")
+    parser.add_argument("--engine", default="timer",
+                        choices=["timer", "threaded", "process"],
+                        help="fetch the devices on the main thread, on a "
+                             "thread of their own, or in worker processes")
+    parser.add_argument("--aggregator-port", type=int,
+                        help="receive the samples of acquisition agents "
+                             "(agent.py) on this port")
+    parser.add_argument("--aggregator-host", default="0.0.0.0",
+                        help="interface where the agents are received")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="report the time spent at startup, until the "
+                             "plot is ready, and the slowest calls")
+    return parser.parse_args(argv)
+
+
+def create_file_handler(args):
+    """Create the handler writing the log file, rotating it if requested."""
+    if args.log_rotate == "size":
+        handler = logging.handlers.RotatingFileHandler(
+                args.log_file, maxBytes=args.log_max_bytes,
+                backupCount=args.log_backups, delay=True)
+    elif args.log_rotate == "time":
+        handler = logging.handlers.TimedRotatingFileHandler(
+                args.log_file, when=args.log_when,
+                backupCount=args.log_backups, delay=True)
+    else:
+        handler = logging.FileHandler(args.log_file, delay=True)
+    handler.setLevel(logging.DEBUG)
+    handler.setFormatter(logging.Formatter(
+            LOGGING['formatters'][args.log_format]['format']))
+    return handler
+
+
+def configure_logging(args):
+    """
+    Configure the application logger.
+
+    The records are only queued by the thread that logs them; a
+    QueueListener thread writes them to the log file, so the acquisition
+    never waits for the disk. Return the started listener.
+    """
+    logging.config.dictConfig(LOGGING)
+    log_queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(
+            log_queue, create_file_handler(args), respect_handler_level=True)
+    logging.getLogger('view').addHandler(
+            logging.handlers.QueueHandler(log_queue))
+    listener.start()
+    return listener
+
+
+def create_publisher(args):
+    """Create and start the live samples publisher, if requested."""
+    if not args.publish:
+        return None
+    # Local libraries
+    from view import publisher
+
+    if args.publish.startswith("unix:"):
+        address = args.publish[len("unix:"):]
+    else:
+        host, _, port = args.publish.rpartition(":")
+        address = (host or "127.0.0.1", int(port))
+    sample_publisher = publisher.SamplePublisher(
+            address, args.publish_format, args.publish_queue,
+            args.publish_drop)
+    sample_publisher.start()
+    return sample_publisher
+
+
+def create_aggregator(args):
+    """Create and start the acquisition agents aggregator, if requested."""
+    if args.aggregator_port is None:
+        return None
+    # Local libraries
+    from view import remote
+
+    aggregator = remote.Aggregator((args.aggregator_host,
+                                    args.aggregator_port))
+    aggregator.start()
+    return aggregator
+
+
+class StartupProfile(object):
+    """
+    Profile of the application startup.
+
+    The time of every startup stage is recorded, and the calls made until
+    the plot is ready are profiled. The report is printed on stderr.
+    """
+    # Number of calls shown in the report
+    CALLS = 30
+
+    def __init__(self):
+        self.__start = time.perf_counter()
+        self.__last = self.__start
+        self.__stages = []
+        self.__profiler = cProfile.Profile()
+        self.__profiler.enable()
+
+    def stage(self, name):
+        """Record the end of a startup stage."""
+        now = time.perf_counter()
+        self.__stages.append((name, now - self.__last, now - self.__start))
+        self.__last = now
+        if name == "plot canvas built":
+            self.report()
+        return
+
+    def report(self):
+        self.__profiler.disable()
+        sys.stderr.write("Startup stages:\n")
+        for name, duration, elapsed in self.__stages:
+            sys.stderr.write("  {:<24} {:8.1f} ms {:8.1f} ms\n".format(
+                    name, duration*1000, elapsed*1000))
+        stats = pstats.Stats(self.__profiler, stream=sys.stderr)
+        stats.sort_stats("cumulative").print_stats(self.CALLS)
+        return
+
+
 if __name__ == '__main__':
+    arguments = parse_arguments()
+    profile = StartupProfile() if arguments.profile_startup else None
     from view import startup
-    logging.config.dictConfig(LOGGING)
-    sys.exit(startup.run())
+    if profile:
+        profile.stage("modules imported")
+    log_listener = configure_logging(arguments)
+    sample_publisher = create_publisher(arguments)
+    aggregator = create_aggregator(arguments)
+    try:
+        metrics_address = None
+        if arguments.metrics_port is not None:
+            metrics_address = (arguments.metrics_host, arguments.metrics_port)
+        sys.exit(startup.run(profile.stage if profile else None,
+                             metrics_address, sample_publisher, aggregator,
+                             arguments.engine))
+    finally:
+        if aggregator:
+            aggregator.stop()
+        if sample_publisher:
+            sample_publisher.stop()
+        # Write the queued records before exiting
+        log_listener.stop()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Columnar storage of the measurements"""
+# Standard libraries
+import array
+import bisect
+from collections import OrderedDict
+import datetime
+import time
+
+
+def now_ns():
+    """Return the host time as integer nanoseconds since the epoch."""
+    return time.time_ns()
+
+
+def to_datetime(timestamp):
+    """Convert a nanoseconds timestamp to a local datetime."""
+    return datetime.datetime.fromtimestamp(timestamp / 1e9)
+
+
+class MeasurementSeries(object):
+    """
+    Measurements of one channel of a device, stored by columns.
+
+    The timestamps are int64 nanoseconds since the epoch and every signal
+    is an array of doubles, so storing a sample creates no Python objects
+    and a column can be handed to the plot as it is.
+    The timestamp is appended after the signal values, so the length of
+    the timestamps column is the number of complete samples, even while
+    the series is being read from another thread.
+    """
+    def __init__(self, signals):
+        self.__signals = list(signals)
+        self.__timestamps = array.array('q')
+        self.__columns = OrderedDict(
+                (signal, array.array('d')) for signal in self.__signals)
+        self.__mirror = None
+
+    def __len__(self):
+        return len(self.__timestamps)
+
+    def get_signals(self):
+        return self.__signals
+
+    def set_mirror(self, mirror):
+        """
+        Also store every new sample in mirror, an object with the append
+        method of the series, such as a shared memory ring. None stops
+        mirroring.
+        """
+        self.__mirror = mirror
+        return
+
+    def append(self, timestamp, values):
+        """Store a sample: its timestamp (ns) and the signal values."""
+        for column, value in zip(self.__columns.values(), values):
+            column.append(value)
+        self.__timestamps.append(timestamp)
+        if self.__mirror is not None:
+            self.__mirror.append(timestamp, values)
+        return
+
+    def extend(self, timestamps, columns):
+        """
+        Store several samples at once: their timestamps (ns) and a
+        sequence of values for every signal, in the order of the signals.
+        """
+        start = len(self)
+        for column, values in zip(self.__columns.values(), columns):
+            column.extend(values)
+        self.__timestamps.extend(timestamps)
+        if self.__mirror is not None:
+            for index in range(start, len(self)):
+                self.__mirror.append(*self.get_sample_values(index))
+        return
+
+    def get_memory_size(self):
+        """Return the bytes taken by the stored samples."""
+        size = self.__timestamps.itemsize * len(self.__timestamps)
+        for column in self.__columns.values():
+            size += column.itemsize * len(column)
+        return size
+
+    def get_timestamps(self, start=0, stop=None):
+        """Return the timestamps (ns) of the samples in [start, stop)."""
+        if stop is None:
+            stop = len(self)
+        return self.__timestamps[start:stop]
+
+    def get_signal(self, signal, start=0, stop=None):
+        """Return the values of a signal for the samples in [start, stop)."""
+        if stop is None:
+            stop = len(self)
+        return self.__columns[signal][start:stop]
+
+    def find_index(self, timestamp):
+        """
+        Return the index of the first sample not older than timestamp
+        (ns), with a binary search, as the samples are stored in order.
+        """
+        return bisect.bisect_left(self.__timestamps, timestamp, 0, len(self))
+
+    def get_window(self, start, stop=None):
+        """
+        Return the [first, last) indexes of the samples taken from start
+        to stop, timestamps in ns, or to the last sample.
+        """
+        first = self.find_index(start)
+        last = len(self) if stop is None else self.find_index(stop)
+        return first, max(first, last)
+
+    def get_sample_values(self, index):
+        """Return the timestamp and the list of values of a sample."""
+        return (self.__timestamps[index],
+                [column[index] for column in self.__columns.values()])
+
+    def get_sample(self, index):
+        """Return the timestamp and a {signal: value} dict of a sample."""
+        return (self.__timestamps[index],
+                {signal: column[index]
+                 for signal, column in self.__columns.items()})
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Shared memory rings mirroring the measurements, for local consumers.
+
+Every ring holds the last capacity samples of a channel, by columns, in
+a multiprocessing shared memory block:
+- a HEADER_SIZE bytes header: the MAGIC, the layout version, the number
+  of signals, the capacity, the sequence (number of samples written
+  since the start, as uint64) and a JSON schema with the device, the
+  channel and the signal names;
+- the timestamps column, as int64 ns since the epoch;
+- a float64 column for every signal.
+
+Sample n is stored in the position n % capacity of every column. The
+writer stores the values before incrementing the sequence, so readers
+only see complete samples, and readers check the sequence again after
+reading, to detect samples overwritten meanwhile.
+"""
+# Standard libraries
+import json
+import re
+import struct
+import time
+
+MAGIC = b"FMRING01"
+VERSION = 1
+HEADER_SIZE = 4096
+# Offsets of the header fields
+_FIELDS = struct.Struct("<8sIIQQI")
+_SEQUENCE_OFFSET = 24
+# Rings written by this process
+_owned = set()
+
+
+def ring_name(device, channel):
+    """Return the shared memory name of the ring of a device channel."""
+    return "freqmeter_{}_ch{}".format(re.sub(r"\W", "_", device),
+                                      channel + 1)
+
+
+def _get_shared_memory():
+    # Python 3.8 or newer
+    from multiprocessing import shared_memory
+    return shared_memory
+
+
+class SharedRingWriter(object):
+    """Writer of a shared memory ring. It owns the shared memory block."""
+    def __init__(self, name, signals, capacity=100000, schema=None):
+        self.__signals = list(signals)
+        self.__capacity = capacity
+        size = HEADER_SIZE + 8 * capacity * (1 + len(self.__signals))
+        shared_memory = _get_shared_memory()
+        try:
+            self.__memory = shared_memory.SharedMemory(
+                    name=name, create=True, size=size)
+        except FileExistsError:
+            # Left by a writer that did not close it
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self.__memory = shared_memory.SharedMemory(
+                    name=name, create=True, size=size)
+        schema = dict(schema or {}, signals=self.__signals,
+                      timestamp="int64 ns since the epoch")
+        encoded = json.dumps(schema).encode()
+        if _FIELDS.size + len(encoded) > HEADER_SIZE:
+            raise ValueError("Ring schema too long")
+        buffer = self.__memory.buf
+        _FIELDS.pack_into(buffer, 0, MAGIC, VERSION, len(self.__signals),
+                          capacity, 0, len(encoded))
+        buffer[_FIELDS.size:_FIELDS.size+len(encoded)] = encoded
+        self.__sequence = buffer[_SEQUENCE_OFFSET:_SEQUENCE_OFFSET+8].cast(
+                'Q')
+        columns = [buffer[HEADER_SIZE + 8*capacity*index:
+                          HEADER_SIZE + 8*capacity*(index+1)]
+                   for index in range(1 + len(self.__signals))]
+        self.__timestamps = columns[0].cast('q')
+        self.__columns = [column.cast('d') for column in columns[1:]]
+        self.__written = 0
+        _owned.add(self.__memory.name)
+
+    def get_name(self):
+        return self.__memory.name
+
+    def append(self, timestamp, values):
+        """Store a sample: its timestamp (ns) and the signal values."""
+        position = self.__written % self.__capacity
+        self.__timestamps[position] = timestamp
+        for column, value in zip(self.__columns, values):
+            column[position] = value
+        self.__written += 1
+        self.__sequence[0] = self.__written
+        return
+
+    def close(self):
+        """Release and remove the ring."""
+        self.__sequence.release()
+        self.__timestamps.release()
+        for column in self.__columns:
+            column.release()
+        self.__memory.close()
+        self.__memory.unlink()
+        _owned.discard(self.__memory.name)
+        return
+
+
+class SharedRingReader(object):
+    """
+    Reader of a shared memory ring, attached by name.
+
+    latest returns NumPy views of the shared memory, without copies,
+    unless the requested samples wrap around the end of the ring. The
+    views keep showing the shared memory, so the samples in them are
+    overwritten once the writer goes capacity samples further; copy them
+    to keep them. The views must be released before closing the reader.
+    """
+    def __init__(self, name):
+        shared_memory = _get_shared_memory()
+        self.__memory = shared_memory.SharedMemory(name=name)
+        buffer = self.__memory.buf
+        magic, version, signals, capacity, _, schema_length = \
+            _FIELDS.unpack_from(buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            self.__memory.close()
+            raise ValueError("{} is not a measurement ring".format(name))
+        if self.__memory.name not in _owned:
+            try:
+                # The ring belongs to the writer, it must not be removed
+                # when the reader exits
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(self.__memory._name,
+                                            "shared_memory")
+            except (ImportError, AttributeError, KeyError):
+                pass
+        self.capacity = capacity
+        self.schema = json.loads(bytes(
+                buffer[_FIELDS.size:_FIELDS.size+schema_length]).decode())
+        self.signals = self.schema["signals"]
+        self.__sequence = buffer[_SEQUENCE_OFFSET:_SEQUENCE_OFFSET+8].cast(
+                'Q')
+        self.__arrays = None
+
+    def __get_arrays(self):
+        if self.__arrays is None:
+            import numpy
+            buffer = self.__memory.buf
+            self.__arrays = [numpy.frombuffer(
+                    buffer, dtype=numpy.int64 if index == 0 else numpy.float64,
+                    count=self.capacity,
+                    offset=HEADER_SIZE + 8*self.capacity*index)
+                for index in range(1 + len(self.signals))]
+        return self.__arrays
+
+    def get_sequence(self):
+        """Return the number of samples written since the start."""
+        return self.__sequence[0]
+
+    def wait(self, sequence, timeout=None, interval=0.0001):
+        """
+        Wait until the ring holds more than sequence samples. Return the
+        new sequence, or the current one after the timeout (s).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            current = self.get_sequence()
+            if current > sequence:
+                return current
+            if deadline is not None and time.monotonic() >= deadline:
+                return current
+            time.sleep(interval)
+
+    def latest(self, count):
+        """
+        Return the timestamps and a {signal: values} dict of the last
+        count samples (or less, if the ring holds less), oldest first.
+        """
+        arrays = self.__get_arrays()
+        while True:
+            sequence = self.get_sequence()
+            count = min(count, sequence, self.capacity)
+            start = (sequence - count) % self.capacity
+            end = start + count
+            if end <= self.capacity:
+                columns = [array[start:end] for array in arrays]
+            else:
+                import numpy
+                columns = [numpy.concatenate(
+                        (array[start:], array[:end - self.capacity]))
+                    for array in arrays]
+            # Retry if the writer overwrote the oldest samples meanwhile
+            if self.get_sequence() - (sequence - count) <= self.capacity:
+                break
+        return columns[0], dict(zip(self.signals, columns[1:]))
+
+    def close(self):
+        self.__arrays = None
+        self.__sequence.release()
+        self.__memory.close()
+        return
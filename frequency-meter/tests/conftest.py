@@ -0,0 +1,8 @@
+#!/usr/bin/env python3
+"""Test configuration: import the application packages as main.py does"""
+# Standard libraries
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+        __file__))))
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Tests of the framing of the TCP/IP client"""
+# Standard libraries
+import socket
+import threading
+import time
+import unittest
+# Local libraries
+from view import clientprotocol
+
+
+class FakeDevice(object):
+    """
+    TCP server accepting one client, which sends the given chunks, one at
+    a time, and optionally keeps pushing records until it is closed.
+    """
+    def __init__(self, chunks=(), push=None):
+        self.__chunks = list(chunks)
+        self.__push = push
+        self.__server = socket.socket()
+        self.__server.bind(("127.0.0.1", 0))
+        self.__server.listen(1)
+        self.port = self.__server.getsockname()[1]
+        self.__stopping = threading.Event()
+        self.__thread = threading.Thread(target=self.__serve, daemon=True)
+        self.__thread.start()
+
+    def __serve(self):
+        connection, _ = self.__server.accept()
+        try:
+            for chunk in self.__chunks:
+                connection.sendall(chunk)
+                time.sleep(0.01)
+            while self.__push and not self.__stopping.is_set():
+                connection.sendall(self.__push)
+        except OSError:
+            pass
+        self.__stopping.wait()
+        connection.close()
+        return
+
+    def close(self):
+        self.__stopping.set()
+        self.__server.close()
+        self.__thread.join(5)
+        return
+
+
+class Records(list):
+    """Stream callback keeping the records, which start with a digit"""
+    def __call__(self, record):
+        if not record[:1].isdigit():
+            return False
+        self.append(record)
+        return True
+
+
+class TCPIPClientTest(unittest.TestCase):
+    def connect(self, device):
+        client = clientprotocol.TCPIPClient("127.0.0.1", device.port)
+        self.assertTrue(client.connect())
+        self.addCleanup(device.close)
+        return client
+
+    def test_read_block(self):
+        client = self.connect(FakeDevice([b"#15hello"]))
+        self.assertEqual(client.read_block(), (True, "hello"))
+
+    def test_read_block_split_in_chunks(self):
+        # Header and data split across several receptions
+        client = self.connect(FakeDevice([b"#", b"21", b"2abcdef", b"ghijkl"]))
+        self.assertEqual(client.read_block(), (True, "abcdefghijkl"))
+
+    def test_read_block_without_header(self):
+        client = self.connect(FakeDevice([b"hello"]))
+        self.assertFalse(client.read_block()[0])
+
+    def test_stream_records_split_in_chunks(self):
+        client = self.connect(FakeDevice([b"1,0.1,10", b".5\n1,0.2,", b"11\n",
+                                          b"1,0.3"]))
+        records = Records()
+        self.assertTrue(client.start_stream(records))
+        deadline = time.monotonic() + 2
+        while len(records) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        client.stop_stream()
+        # The incomplete last record is not delivered
+        self.assertEqual(records, ["1,0.1,10.5", "1,0.2,11"])
+
+    def test_replies_while_streaming(self):
+        client = self.connect(FakeDevice([b"1,0.1,10.5\nOK\n1,0.2,", b"11\n"]))
+        records = Records()
+        self.assertTrue(client.start_stream(records))
+        self.assertEqual(client.read(), (True, "OK"))
+        deadline = time.monotonic() + 2
+        while len(records) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(client.read(), (False, ""))
+        client.stop_stream()
+        self.assertEqual(records, ["1,0.1,10.5", "1,0.2,11"])
+
+    def test_stop_stream_while_device_keeps_pushing(self):
+        client = self.connect(FakeDevice(push=b"1,0.1,10.5\n" * 100))
+        self.assertTrue(client.start_stream(lambda record: True))
+        time.sleep(0.1)
+        start = time.monotonic()
+        client.stop_stream()
+        self.assertLess(time.monotonic() - start,
+                        client.DRAIN_TIME + 2 * client.TIMEOUT)
+        self.assertTrue(client.is_stream_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
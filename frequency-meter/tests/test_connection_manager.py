@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""Tests of the supervision of the connected devices"""
+# Standard libraries
+import importlib.util
+import threading
+import time
+import unittest
+
+HAS_QT = importlib.util.find_spec("PyQt5") is not None
+if HAS_QT:
+    # Local libraries
+    from view.connection_manager import ConnectionManager
+
+    class FastConnectionManager(ConnectionManager):
+        """Supervision with short times, so the tests run quickly"""
+        PROBE_INTERVAL = 0.01
+        MIN_BACKOFF = 0.01
+        MAX_BACKOFF = 0.05
+
+
+class FakeDevice(object):
+    """Device whose link is up or down at will"""
+    def __init__(self):
+        self.reachable = True
+        self.failures = 0
+        self.resumed = 0
+        self.reconnects = 0
+
+    def get_name(self):
+        return "fake"
+
+    def get_device_path(self):
+        return "fake.yml"
+
+    def is_detached(self):
+        return False
+
+    def is_connected(self):
+        return self.reachable
+
+    def connect(self):
+        return self.reachable
+
+    def is_ready(self):
+        return True
+
+    def get_failure_count(self):
+        return self.failures
+
+    def probe(self):
+        return self.reachable
+
+    def reconnect(self):
+        if not self.reachable:
+            return False
+        self.reconnects += 1
+        self.failures = 0
+        return True
+
+    def resume_measurement(self):
+        self.resumed += 1
+        return True
+
+    def get_reconnect_count(self):
+        return self.reconnects
+
+
+@unittest.skipUnless(HAS_QT, "PyQt5 is not installed")
+class ConnectionManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.manager = FastConnectionManager()
+        self.states = []
+        self.manager.device_state_changed.connect(
+                lambda slot, device, up: self.states.append(up))
+        self.device = FakeDevice()
+        self.manager.watch(0, self.device)
+        self.health = self.manager.get_health(self.device)
+
+    def tearDown(self):
+        self.manager.shutdown()
+
+    def supervise_until(self, condition, timeout=5.0):
+        """Run the supervision, as its timer does, until condition holds"""
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            self.manager._ConnectionManager__supervise()
+            time.sleep(0.005)
+        # Let the running probe or reconnection end
+        while self.health.busy:
+            time.sleep(0.005)
+
+    def test_lost_idle_device_backs_off(self):
+        self.device.reachable = False
+        self.supervise_until(lambda: self.states == [False])
+        backoffs = []
+
+        def backoff_capped():
+            backoffs.append(self.health.backoff)
+            return self.health.backoff >= FastConnectionManager.MAX_BACKOFF
+        self.supervise_until(backoff_capped)
+        self.assertEqual(sorted(backoffs), backoffs)
+        self.assertGreater(backoffs[-1], backoffs[0])
+        self.assertEqual(self.device.reconnects, 0)
+        self.device.reachable = True
+        self.supervise_until(lambda: self.states == [False, True])
+        self.assertTrue(self.health.up)
+        self.assertEqual(self.health.backoff,
+                         FastConnectionManager.MIN_BACKOFF)
+        self.assertEqual(self.device.reconnects, 1)
+        self.assertEqual(self.device.resumed, 0)
+
+    def test_failed_fetches_resume_measurement(self):
+        self.manager.set_measuring(True)
+        self.device.failures = FastConnectionManager.MAX_FAILURES
+        self.supervise_until(lambda: self.states == [False, True])
+        self.assertEqual(self.device.reconnects, 1)
+        self.assertEqual(self.device.resumed, 1)
+
+    def test_connect_device(self):
+        connected = threading.Event()
+        failed = []
+        self.manager.device_connected.connect(
+                lambda slot, device: connected.set())
+        self.manager.connect_failed.connect(
+                lambda slot, name, reason: failed.append(reason))
+        self.device.reachable = False
+        self.manager.connect_device(1, self.device)
+        deadline = time.monotonic() + 5.0
+        while not failed:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.005)
+        self.assertEqual(failed, ["unreachable"])
+        self.device.reachable = True
+        self.manager.connect_device(1, self.device)
+        self.assertTrue(connected.wait(5.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
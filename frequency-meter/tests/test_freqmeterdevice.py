@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""Tests of the devices, and of their connection to the simulated meter"""
+# Standard libraries
+import time
+import unittest
+# Local libraries
+from view import freqmeterdevice
+from view import simulator
+
+
+def device_data(mode, port=0):
+    """Return the configuration of a Uvigo meter on a local port."""
+    return {
+        "general": {"Name": "sim-{}".format(mode), "Vendor": "Uvigo"},
+        "communications": {
+            "Protocol": "TCP/IP",
+            "Properties": {
+                "CommProp1": "127.0.0.1",
+                "CommProp2": str(port),
+                "CommProp3": "", "CommProp4": ""}},
+        "acquisition": {"Mode": mode, "BufferDepth": "50"},
+    }
+
+
+class StaleSampleTest(unittest.TestCase):
+    """Repeated samples are dropped before storing them."""
+    GATE_TIME = 0.1
+    # Host time of the first sample (ns)
+    START = 1000 * 10**9
+
+    def get_device(self, mode):
+        device = freqmeterdevice.UviFreqMeter(None, device_data(mode))
+        device.prepare_measurement(self.GATE_TIME, [0, 1], None)
+        return device
+
+    def at(self, seconds):
+        return self.START + int(seconds * 1e9)
+
+    def test_poll_repeated_within_gate(self):
+        device = self.get_device("poll")
+        device.store_samples([
+            (0, self.at(0), [1.0, 2.0]),
+            # The same gate fetched again
+            (0, self.at(0.05), [1.0, 2.0]),
+            # A new gate
+            (0, self.at(0.06), [1.5, 2.0]),
+            # Other channel
+            (1, self.at(0.06), [1.5, 2.0]),
+            # Same values, but a whole gate later
+            (0, self.at(0.16), [1.5, 2.0]),
+        ])
+        self.assertEqual(device.get_stale_count(), 1)
+        self.assertEqual(device.get_sample_count(), 4)
+        self.assertEqual(list(device.get_measurement_data()[0]
+                              .get_timestamps()),
+                         [self.at(0), self.at(0.06), self.at(0.16)])
+
+    def check_device_time_order(self, mode):
+        device = self.get_device(mode)
+        device.store_samples([
+            (0, self.at(0.1), [1.0]),
+            (0, self.at(0.2), [2.0]),
+            # Resent after connecting again
+            (0, self.at(0.2), [2.0]),
+            (0, self.at(0.1), [1.0]),
+            # Other channel, behind the first one
+            (1, self.at(0.05), [3.0]),
+            # Same values as the last sample, but newer
+            (0, self.at(0.3), [2.0]),
+        ])
+        self.assertEqual(device.get_stale_count(), 2)
+        self.assertEqual(device.get_sample_count(), 4)
+        self.assertEqual(list(device.get_measurement_data()[0]
+                              .get_timestamps()),
+                         [self.at(0.1), self.at(0.2), self.at(0.3)])
+        return
+
+    def test_buffered_out_of_order(self):
+        self.check_device_time_order("buffered")
+
+    def test_stream_out_of_order(self):
+        self.check_device_time_order("stream")
+
+    def test_counters_cleared_on_start(self):
+        device = self.get_device("poll")
+        device.store_samples([(0, self.at(0), [1.0]),
+                              (0, self.at(0.01), [1.0])])
+        device.prepare_measurement(self.GATE_TIME, [0], None)
+        self.assertEqual(device.get_stale_count(), 0)
+        # The last sample of the previous measurement is forgotten
+        device.store_samples([(0, self.at(0.02), [1.0])])
+        self.assertEqual(device.get_sample_count(), 1)
+
+
+class SimulatorTestCase(unittest.TestCase):
+    """Devices connected to a simulated meter on a local port."""
+    GATE_TIME = 0.01
+    LATENCY = 0.0
+
+    def setUp(self):
+        self.server = simulator.SimulatorServer(("127.0.0.1", 0),
+                                                self.LATENCY)
+        self.server.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def get_device(self, mode):
+        device = freqmeterdevice.UviFreqMeter(
+                None, device_data(mode, self.server.server_address[1]))
+        self.assertTrue(device.connect())
+        self.addCleanup(device.disconnect)
+        return device
+
+    def fetch(self, device, duration=0.3):
+        """Fetch for duration seconds, return the samples stored."""
+        count = device.get_sample_count()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            device.store_freq()
+            time.sleep(self.GATE_TIME)
+        return device.get_sample_count() - count
+
+
+class ReconnectTest(SimulatorTestCase):
+    """Devices connected again while measuring keep storing samples."""
+    def check_reconnect(self, mode):
+        device = self.get_device(mode)
+        device.start_measurement(self.GATE_TIME, [0], None)
+        self.assertGreater(self.fetch(device), 0)
+        self.assertTrue(device.reconnect())
+        self.assertTrue(device.resume_measurement())
+        stale = device.get_stale_count()
+        self.assertGreater(self.fetch(device), 0)
+        self.assertEqual(device.get_stale_count(), stale)
+        self.assertEqual(device.get_reconnect_count(), 1)
+        device.stop_measurement()
+        return
+
+    def test_reconnect_buffered(self):
+        self.check_reconnect("buffered")
+
+    def test_reconnect_stream(self):
+        self.check_reconnect("stream")
+
+    def test_reconnect_poll(self):
+        self.check_reconnect("poll")
+
+
+class MultiChannelTest(SimulatorTestCase):
+    """Both channels of the meter are measured in the same session."""
+    GATE_TIME = 0.002
+    LATENCY = 0.005
+
+    def check_channels(self, mode):
+        device = self.get_device(mode)
+        device.start_measurement(self.GATE_TIME, [0, 1], None)
+        with self.assertNoLogs("view", "WARNING"):
+            self.fetch(device)
+        device.stop_measurement()
+        data = device.get_measurement_data()
+        self.assertGreater(len(data[0]), 0)
+        self.assertGreater(len(data[1]), 0)
+        # Both channels start with their first gate, but each one is
+        # stamped from its own INIT, at least a round trip apart
+        skew = data[1].get_timestamps()[0] - data[0].get_timestamps()[0]
+        self.assertGreaterEqual(skew / 1e9, self.LATENCY)
+        return
+
+    def test_channels_stream(self):
+        self.check_channels("stream")
+
+    def test_channels_buffered(self):
+        self.check_channels("buffered")
+
+
+class DroppedConnectionTest(SimulatorTestCase):
+    """A connection closed by the meter is counted as failed fetches."""
+    def test_drop_while_polling(self):
+        device = self.get_device("poll")
+        device.start_measurement(self.GATE_TIME, [0], None)
+        device.store_freq()
+        self.assertEqual(device.get_failure_count(), 0)
+        count = device.get_sample_count()
+        self.server.drop_clients()
+        for _ in range(3):
+            device.store_freq()
+        self.assertEqual(device.get_failure_count(), 3)
+        self.assertEqual(device.get_sample_count(), count)
+        # The supervision connects it again
+        self.assertTrue(device.reconnect())
+        self.assertEqual(device.get_failure_count(), 0)
+        self.assertTrue(device.resume_measurement())
+        device.store_freq()
+        self.assertEqual(device.get_sample_count(), count + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Tests of the latency instrumentation"""
+# Standard libraries
+import threading
+import unittest
+# Local libraries
+from view import instrumentation
+
+LatencyHistogram = instrumentation.LatencyHistogram
+
+
+class LatencyHistogramTest(unittest.TestCase):
+    def test_small_values_are_exact(self):
+        for value in range(2 * LatencyHistogram.SUB_BUCKETS):
+            index = LatencyHistogram._index(value)
+            self.assertEqual(LatencyHistogram._lower_bound(index), value)
+
+    def test_bucket_bounds(self):
+        # Every value is in the bucket whose bounds contain it, with a
+        # relative error below 1/SUB_BUCKETS
+        for value in [33, 100, 1000, 12345, 10**6, 10**9, 3600 * 10**9]:
+            index = LatencyHistogram._index(value)
+            low = LatencyHistogram._lower_bound(index)
+            high = LatencyHistogram._lower_bound(index + 1)
+            self.assertLessEqual(low, value)
+            self.assertLess(value, high)
+            self.assertLess((high - low) / low,
+                            1 / LatencyHistogram.SUB_BUCKETS + 1e-9)
+
+    def test_indexes_are_increasing(self):
+        indexes = [LatencyHistogram._index(value) for value in range(5000)]
+        self.assertEqual(indexes, sorted(indexes))
+
+    def test_statistics(self):
+        histogram = LatencyHistogram()
+        for value in range(1, 101):
+            histogram.record(value * 1000)
+        self.assertEqual(histogram.count, 100)
+        self.assertEqual(histogram.min, 1000)
+        self.assertEqual(histogram.max, 100000)
+        self.assertEqual(histogram.total, 5050000)
+        for percent in (50, 90, 99):
+            value = histogram.percentile(percent)
+            exact = percent * 1000
+            self.assertGreaterEqual(value, exact)
+            self.assertLess(value,
+                            exact * (1 + 1 / LatencyHistogram.SUB_BUCKETS))
+        self.assertEqual(histogram.percentile(100), 100000)
+
+    def test_empty_and_reset(self):
+        histogram = LatencyHistogram()
+        self.assertIsNone(histogram.percentile(50))
+        self.assertEqual(histogram.get_summary(), {"count": 0})
+        histogram.record(10)
+        histogram.reset()
+        self.assertEqual(histogram.get_summary(), {"count": 0})
+
+    def test_negative_values_are_zero(self):
+        histogram = LatencyHistogram()
+        histogram.record(-5)
+        self.assertEqual((histogram.min, histogram.max), (0, 0))
+
+    def test_cumulative_counts(self):
+        histogram = LatencyHistogram()
+        for value in (5, 10, 20, 1000):
+            histogram.record(value)
+        self.assertEqual(histogram.get_cumulative_counts([4, 10, 31, 10**6]),
+                         [0, 2, 3, 4])
+
+
+class StageTracerTest(unittest.TestCase):
+    def test_concurrent_records(self):
+        tracer = instrumentation.StageTracer(capacity=1000)
+        records = 5000
+
+        def record(source):
+            for start in range(records):
+                tracer.record(source, "fetch", start, start + 100)
+            return
+
+        threads = [threading.Thread(target=record, args=(source,))
+                   for source in ("a", "b", "a", "b")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        histograms = tracer.get_histograms()
+        self.assertEqual(histograms[("a", "fetch")].count, 2 * records)
+        self.assertEqual(histograms[("b", "fetch")].count, 2 * records)
+        events = tracer.get_events()
+        self.assertEqual(len(events), 1000)
+        self.assertTrue(all(event[4] == 100 for event in events))
+
+    def test_clear(self):
+        tracer = instrumentation.StageTracer(capacity=10)
+        tracer.record("a", "read", 0, 10)
+        tracer.clear()
+        self.assertEqual(tracer.get_events(), [])
+        self.assertEqual(tracer.get_histograms(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""Tests of the fetch schedules of the devices"""
+# Standard libraries
+import importlib.util
+import statistics
+import time
+import unittest
+
+HAS_QT = importlib.util.find_spec("PyQt5") is not None
+if HAS_QT:
+    # Local libraries
+    from view.measurement_engine import DeviceSchedule
+
+
+class GateDevice(object):
+    """
+    Device completing a gate every gate_time seconds, whose fetches take
+    latency seconds and reach it halfway.
+    """
+    def __init__(self, gate_time, latency, mode="poll", fetch_time=None):
+        self.__gate_time = gate_time
+        self.__latency = latency
+        self.__mode = mode
+        self.__fetch_time = fetch_time
+        self.__start = None
+        self.__gates = 0
+        self.samples = 0
+        self.stale = 0
+        # Time (s) from the end of the gate to the fetch of its sample
+        self.lags = []
+
+    def get_name(self):
+        return "gate"
+
+    def get_gate_time(self):
+        return self.__gate_time
+
+    def get_fetch_time(self, default):
+        if self.__fetch_time is None:
+            return default
+        return self.__fetch_time
+
+    def is_buffered(self):
+        return self.__mode == "buffered"
+
+    def is_streaming(self):
+        return self.__mode == "stream"
+
+    def start(self, epoch):
+        self.__start = epoch
+        return
+
+    def store_freq(self):
+        arrival = time.monotonic() + self.__latency / 2
+        time.sleep(self.__latency)
+        gates = int((arrival - self.__start) / self.__gate_time)
+        if gates > self.__gates:
+            self.__gates = gates
+            self.samples += 1
+            self.lags.append(arrival - self.__start
+                             - gates * self.__gate_time)
+        else:
+            self.stale += 1
+        return
+
+    def get_sample_count(self):
+        return self.samples
+
+
+@unittest.skipUnless(HAS_QT, "PyQt5 is not installed")
+class DeviceScheduleTest(unittest.TestCase):
+    GATE_TIME = 0.02
+    LATENCY = 0.002
+
+    def run_schedule(self, schedule, device, gates):
+        """Fetch the device when due, during the given number of gates."""
+        epoch = time.monotonic()
+        device.start(epoch)
+        schedule.start(epoch)
+        fetches = []
+        while time.monotonic() < epoch + gates * self.GATE_TIME:
+            delay = schedule.next_due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            fetches.append(schedule.next_due - epoch)
+            schedule.fetch()
+        return fetches
+
+    def test_adaptive_converges_to_gate_end(self):
+        device = GateDevice(self.GATE_TIME, self.LATENCY)
+        # The period is only used by the first fetches
+        schedule = DeviceSchedule(device, self.GATE_TIME / 4, adaptive=True)
+        self.assertTrue(schedule.adaptive)
+        fetches = self.run_schedule(schedule, device, 100)
+        # Once converged, every fetch finds a new sample, just after the
+        # end of its gate
+        settled = fetches[len(fetches) // 2:]
+        period = statistics.median(
+                later - earlier
+                for earlier, later in zip(settled, settled[1:]))
+        self.assertAlmostEqual(period, self.GATE_TIME,
+                               delta=0.2 * self.GATE_TIME)
+        lags = device.lags[len(device.lags) // 2:]
+        self.assertLess(statistics.median(lags), 0.25 * self.GATE_TIME)
+        self.assertAlmostEqual(schedule.latency, self.LATENCY,
+                               delta=self.LATENCY)
+
+    def test_fixed_keeps_the_grid(self):
+        device = GateDevice(self.GATE_TIME, self.LATENCY)
+        period = self.GATE_TIME / 4
+        schedule = DeviceSchedule(device, period)
+        self.assertFalse(schedule.adaptive)
+        fetches = self.run_schedule(schedule, device, 20)
+        for due in fetches:
+            self.assertAlmostEqual(due / period, round(due / period))
+        # Fetching faster than the gates reads stale samples
+        self.assertGreater(device.stale, device.samples)
+
+    def test_not_adaptive(self):
+        for device in (GateDevice(self.GATE_TIME, 0, mode="buffered"),
+                       GateDevice(self.GATE_TIME, 0, mode="stream"),
+                       GateDevice(self.GATE_TIME, 0, fetch_time=0.1)):
+            self.assertFalse(DeviceSchedule.is_adaptive(device, True))
+            self.assertFalse(DeviceSchedule(device, 0.1, True).adaptive)
+        device = GateDevice(self.GATE_TIME, 0)
+        self.assertTrue(DeviceSchedule.is_adaptive(device, True))
+        self.assertFalse(DeviceSchedule.is_adaptive(device, False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""Tests of the measurement series"""
+# Standard libraries
+import time
+import unittest
+# Local libraries
+from model import measurement_store
+
+
+class MeasurementSeriesTest(unittest.TestCase):
+    def setUp(self):
+        self.series = measurement_store.MeasurementSeries(["coarse", "fine"])
+        # Samples every 10 ns, from 100 to 190 ns
+        self.series.extend(range(100, 200, 10),
+                           [range(10), [value / 2 for value in range(10)]])
+
+    def test_extend_and_append(self):
+        self.series.append(200, [10, 5.0])
+        self.assertEqual(len(self.series), 11)
+        self.assertEqual(self.series.get_sample(10),
+                         (200, {"coarse": 10.0, "fine": 5.0}))
+        self.assertEqual(list(self.series.get_signal("fine", 8)),
+                         [4.0, 4.5, 5.0])
+
+    def test_find_index(self):
+        self.assertEqual(self.series.find_index(0), 0)
+        self.assertEqual(self.series.find_index(100), 0)
+        self.assertEqual(self.series.find_index(101), 1)
+        self.assertEqual(self.series.find_index(190), 9)
+        self.assertEqual(self.series.find_index(1000), 10)
+
+    def test_window_to_the_last_sample(self):
+        start, stop = self.series.get_window(155)
+        self.assertEqual((start, stop), (6, 10))
+        self.assertEqual(list(self.series.get_timestamps(start, stop)),
+                         [160, 170, 180, 190])
+
+    def test_window_with_stop(self):
+        self.assertEqual(self.series.get_window(120, 150), (2, 5))
+
+    def test_window_out_of_the_samples(self):
+        self.assertEqual(self.series.get_window(500), (10, 10))
+        self.assertEqual(self.series.get_window(0, 50), (0, 0))
+        # A stop before the start gives an empty window
+        self.assertEqual(self.series.get_window(150, 120), (5, 5))
+
+    def test_empty_series(self):
+        series = measurement_store.MeasurementSeries(["coarse"])
+        self.assertEqual(series.get_window(0), (0, 0))
+
+    def test_now_ns(self):
+        before = time.time_ns()
+        timestamp = measurement_store.now_ns()
+        self.assertIsInstance(timestamp, int)
+        self.assertLessEqual(before, timestamp)
+        self.assertLessEqual(timestamp, time.time_ns())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Tests of the live samples publisher"""
+# Standard libraries
+import json
+import socket
+import struct
+import time
+import unittest
+# Local libraries
+from view import publisher
+
+
+class EncodingTest(unittest.TestCase):
+    def test_binary_round_trip(self):
+        frame = publisher.encode_binary("FPGA-ñ", 1, 1234567890123456789,
+                                        [10e6, -0.5, 2.25])
+        length, = struct.unpack_from("<I", frame)
+        self.assertEqual(length, len(frame) - 4)
+        self.assertEqual(publisher.decode_binary(frame[4:]),
+                         ("FPGA-ñ", 2, 1234567890123456789,
+                          [10e6, -0.5, 2.25]))
+
+    def test_binary_without_values(self):
+        frame = publisher.encode_binary("dev", 0, 0, [])
+        self.assertEqual(publisher.decode_binary(frame[4:]),
+                         ("dev", 1, 0, []))
+
+    def test_json(self):
+        line = publisher.encode_json("dev", 0, 5, (1.5, 2.0))
+        self.assertTrue(line.endswith(b"\n"))
+        self.assertEqual(json.loads(line.decode()),
+                         {"device": "dev", "channel": 1, "timestamp": 5,
+                          "values": [1.5, 2.0]})
+
+
+class SubscriberTest(unittest.TestCase):
+    def test_drop_oldest(self):
+        subscriber = publisher.Subscriber("a", 2, "oldest")
+        for frame in (b"1", b"2", b"3"):
+            subscriber.offer(frame)
+        self.assertEqual(subscriber.take(0), [b"2", b"3"])
+        self.assertEqual(subscriber.dropped, 1)
+
+    def test_drop_newest(self):
+        subscriber = publisher.Subscriber("a", 2, "newest")
+        for frame in (b"1", b"2", b"3"):
+            subscriber.offer(frame)
+        self.assertEqual(subscriber.take(0), [b"1", b"2"])
+
+    def test_disconnect(self):
+        subscriber = publisher.Subscriber("a", 2, "disconnect")
+        for frame in (b"1", b"2", b"3"):
+            subscriber.offer(frame)
+        self.assertTrue(subscriber.closed)
+
+
+class StalledSubscriberTest(unittest.TestCase):
+    def test_stalled_subscriber_is_disconnected(self):
+        self.addCleanup(setattr, publisher.SubscriberHandler, "SEND_TIMEOUT",
+                        publisher.SubscriberHandler.SEND_TIMEOUT)
+        publisher.SubscriberHandler.SEND_TIMEOUT = 0.2
+        sample_publisher = publisher.SamplePublisher(
+                ("127.0.0.1", 0), "binary", queue_size=10,
+                drop_policy="disconnect")
+        sample_publisher.start()
+        self.addCleanup(sample_publisher.stop)
+        # A subscriber that never reads
+        client = socket.create_connection(sample_publisher.get_address())
+        self.addCleanup(client.close)
+        deadline = time.monotonic() + 2
+        while (not sample_publisher.get_subscribers() and
+               time.monotonic() < deadline):
+            time.sleep(0.01)
+        values = [0.0] * 200
+        deadline = time.monotonic() + 10
+        while (sample_publisher.get_subscribers() and
+               time.monotonic() < deadline):
+            sample_publisher.publish("dev", 0, 0, values)
+            time.sleep(0.0005)
+        self.assertEqual(sample_publisher.get_subscribers(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""Tests of the acquisition agents and the aggregator"""
+# Standard libraries
+import socket
+import threading
+import time
+import unittest
+# Local libraries
+from view import freqmeterdevice
+from view import remote
+from test_freqmeterdevice import device_data
+
+
+class LocalFreqMeter(freqmeterdevice.UviFreqMeter):
+    """Meter of an agent, whose samples are stored by the test"""
+    def start_measurement(self, sample_time, channels, impedance):
+        self.prepare_measurement(sample_time, channels, impedance)
+        return
+
+    def stop_measurement(self):
+        return
+
+
+class FakeEngine(object):
+    """Measurement engine of an agent, which fetches nothing"""
+    def start(self, devices, fetch_time, periods=None):
+        return
+
+    def stop(self):
+        return
+
+
+class Relay(object):
+    """
+    TCP relay between an agent and the aggregator, whose connections can
+    be cut as a broken network link.
+    """
+    def __init__(self, target):
+        self.__target = target
+        self.__server = socket.socket()
+        self.__server.bind(("127.0.0.1", 0))
+        self.__server.listen(1)
+        self.address = self.__server.getsockname()
+        self.__connections = []
+        self.__lock = threading.Lock()
+        threading.Thread(target=self.__accept, daemon=True).start()
+
+    def __accept(self):
+        while True:
+            try:
+                client, _ = self.__server.accept()
+            except OSError:
+                return
+            upstream = socket.create_connection(self.__target)
+            with self.__lock:
+                self.__connections.extend([client, upstream])
+            for source, sink in ((client, upstream), (upstream, client)):
+                threading.Thread(target=self.__pump, args=(source, sink),
+                                 daemon=True).start()
+
+    @staticmethod
+    def __pump(source, sink):
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+                sink.sendall(data)
+        except OSError:
+            pass
+        return
+
+    def cut(self):
+        with self.__lock:
+            connections = self.__connections
+            self.__connections = []
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            connection.close()
+        return
+
+    def close(self):
+        self.__server.close()
+        self.cut()
+        return
+
+
+class RemoteTestCase(unittest.TestCase):
+    def setUp(self):
+        self.aggregator = remote.Aggregator(("127.0.0.1", 0))
+        self.aggregator.start()
+        self.addCleanup(self.aggregator.stop)
+
+    def wait_until(self, condition, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        return
+
+    def get_remote_device(self, name):
+        """Wait for the device of an agent, and start receiving it."""
+        self.wait_until(lambda: self.aggregator.get_device(name))
+        device = self.aggregator.get_device(name)
+        self.assertTrue(device.connect())
+        device.start_measurement(0.1, [0], None)
+        return device
+
+
+class AggregatorTest(RemoteTestCase):
+    """Messages of an agent connected with a plain socket."""
+    HELLO = {"type": "hello", "agent": "raw", "devices": [{
+        "name": "meter", "vendor": "Uvigo", "channels": 2,
+        "signals": ["coarse", "fine"], "impedances": ["50Ω"],
+        "gate_time": 0.1}]}
+
+    def connect_agent(self):
+        connection = socket.create_connection(self.aggregator.get_address())
+        self.addCleanup(connection.close)
+        connection.sendall(remote.encode_message(self.HELLO))
+        return connection
+
+    @staticmethod
+    def send_batch(connection, timestamps):
+        connection.sendall(remote.encode_message({
+            "type": "batch", "device": "meter", "channel": 1,
+            "timestamps": timestamps,
+            "values": [[float(timestamp) for timestamp in timestamps],
+                       [0.0] * len(timestamps)]}))
+        return
+
+    def test_reconnected_agent(self):
+        connection = self.connect_agent()
+        device = self.get_remote_device("raw/meter")
+        self.assertEqual(device.get_channels(), 2)
+        self.assertEqual(device.get_signals(), ["coarse", "fine"])
+        self.send_batch(connection, [100, 200])
+        self.wait_until(lambda: device.get_pending_count() == 2)
+        device.store_freq()
+        self.assertEqual(device.get_sample_count(), 2)
+        connection.close()
+        self.wait_until(lambda: not device.is_online())
+        # Connected again, it sends again the samples of the broken batch
+        connection = self.connect_agent()
+        self.wait_until(device.is_online)
+        self.assertIs(self.aggregator.get_device("raw/meter"), device)
+        self.assertEqual(self.aggregator.get_device_names(), ["raw/meter"])
+        self.send_batch(connection, [100, 200, 300])
+        self.wait_until(lambda: device.get_pending_count() == 3)
+        device.store_freq()
+        self.assertEqual(device.get_sample_count(), 3)
+        self.assertEqual(device.get_stale_count(), 2)
+        series = device.get_measurement_data()[0]
+        self.assertEqual(list(series.get_timestamps()), [100, 200, 300])
+        self.assertEqual(list(series.get_signal("coarse")),
+                         [100.0, 200.0, 300.0])
+
+
+class AgentTest(RemoteTestCase):
+    """Agents forwarding the samples of their devices."""
+    def get_agent(self, address, backlog=100000):
+        agent = remote.AcquisitionAgent("agent", address, FakeEngine(),
+                                        batch_interval=0.01, backlog=backlog)
+        agent.RETRY_TIME = 0.05
+        device = LocalFreqMeter(None, device_data("poll"))
+        agent.start([device], 0.1, 0.1)
+        self.addCleanup(agent.stop)
+        return agent, device
+
+    def test_backlog(self):
+        # Nothing listens on the port, the samples are kept
+        agent, device = self.get_agent(("127.0.0.1", 1), backlog=3)
+        device.store_samples([(0, timestamp, [timestamp, 0.0, 0.0])
+                              for timestamp in range(1, 6)])
+        self.assertEqual(agent.get_pending_count(), 3)
+        self.assertEqual(agent.get_dropped_count(), 2)
+        # Samples of a failed batch go back before the queued ones, and
+        # the oldest are dropped
+        agent._AcquisitionAgent__restore_samples(
+                [("sim-poll", 0, 0, [0.0, 0.0, 0.0])])
+        self.assertEqual(agent.get_pending_count(), 3)
+        self.assertEqual(agent.get_dropped_count(), 3)
+
+    def test_forward_across_reconnection(self):
+        relay = Relay(self.aggregator.get_address())
+        self.addCleanup(relay.close)
+        agent, device = self.get_agent(relay.address)
+        received = self.get_remote_device("agent/sim-poll")
+        device.store_samples([(0, 1000, [1.0, 2.0, 3.0]),
+                              (0, 2000, [4.0, 5.0, 6.0])])
+        self.wait_until(lambda: received.get_pending_count() == 2)
+        received.store_freq()
+        series = received.get_measurement_data()[0]
+        self.assertEqual(list(series.get_timestamps()), [1000, 2000])
+        self.assertEqual(list(series.get_signal("fineCDT")), [3.0, 6.0])
+        relay.cut()
+        self.wait_until(lambda: not received.is_online())
+        # The agent notices the broken link when sending, and connects
+        # again, which registers the same device again
+        timestamp = 3000
+
+        def forwarded():
+            nonlocal timestamp
+            device.store_samples([(0, timestamp, [timestamp, 0.0, 0.0])])
+            timestamp += 1000
+            received.store_freq()
+            return received.is_online() and len(series) > 2
+        self.wait_until(forwarded)
+        self.assertIs(self.aggregator.get_device("agent/sim-poll"),
+                      received)
+        self.assertEqual(self.aggregator.get_device_names(),
+                         ["agent/sim-poll"])
+        timestamps = list(series.get_timestamps())
+        self.assertEqual(timestamps, sorted(set(timestamps)))
+
+
+if __name__ == '__main__':
+    unittest.main()
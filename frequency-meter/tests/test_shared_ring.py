@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Tests of the shared memory rings"""
+# Standard libraries
+import os
+import unittest
+# Local libraries
+from model import shared_ring
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class SharedRingTest(unittest.TestCase):
+    def setUp(self):
+        name = shared_ring.ring_name("test-{}".format(os.getpid()), 0)
+        self.writer = shared_ring.SharedRingWriter(
+                name, ["coarse", "fine"], capacity=4,
+                schema={"device": "test", "channel": 1})
+        self.addCleanup(self.writer.close)
+        self.reader = shared_ring.SharedRingReader(self.writer.get_name())
+        self.addCleanup(self.reader.close)
+
+    def test_ring_name(self):
+        self.assertEqual(shared_ring.ring_name("FPGA freq-meter", 1),
+                         "freqmeter_FPGA_freq_meter_ch2")
+
+    def test_header(self):
+        self.assertEqual(self.reader.capacity, 4)
+        self.assertEqual(self.reader.signals, ["coarse", "fine"])
+        self.assertEqual(self.reader.schema["device"], "test")
+        self.assertEqual(self.reader.schema["channel"], 1)
+
+    def test_sequence(self):
+        self.assertEqual(self.reader.get_sequence(), 0)
+        self.writer.append(10, [1.0, 2.0])
+        self.assertEqual(self.reader.get_sequence(), 1)
+        self.assertEqual(self.reader.wait(0, timeout=0), 1)
+        self.assertEqual(self.reader.wait(1, timeout=0.01), 1)
+
+    def test_not_a_ring(self):
+        from multiprocessing import shared_memory
+        memory = shared_memory.SharedMemory(create=True,
+                                            size=shared_ring.HEADER_SIZE)
+        self.addCleanup(memory.unlink)
+        self.addCleanup(memory.close)
+        with self.assertRaises(ValueError):
+            shared_ring.SharedRingReader(memory.name)
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_latest_wraps_around(self):
+        for index in range(6):
+            self.writer.append(index, [index, index / 2])
+        timestamps, values = self.reader.latest(3)
+        self.assertEqual(list(timestamps), [3, 4, 5])
+        self.assertEqual(list(values["fine"]), [1.5, 2.0, 2.5])
+        timestamps, _ = self.reader.latest(10)
+        self.assertEqual(list(timestamps), [2, 3, 4, 5])
+
+
+if __name__ == '__main__':
+    unittest.main()
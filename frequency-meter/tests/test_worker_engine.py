@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Tests of the measurement engine with worker processes"""
+# Standard libraries
+import importlib.util
+import os
+import tempfile
+import threading
+import time
+import unittest
+# Third party libraries
+import yaml
+# Local libraries
+from view import freqmeterdevice
+from view import simulator
+from test_freqmeterdevice import device_data
+
+HAS_QT = importlib.util.find_spec("PyQt5") is not None
+if HAS_QT:
+    # Local libraries
+    from view import worker_engine
+
+
+@unittest.skipUnless(HAS_QT, "PyQt5 is not installed")
+class ProcessMeasurementEngineTest(unittest.TestCase):
+    """A device file measured by a worker process of the simulated meter."""
+    GATE_TIME = 0.01
+
+    def setUp(self):
+        self.server = simulator.SimulatorServer(("127.0.0.1", 0))
+        self.server.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        # Commands received by the meter, from any connection
+        self.commands = []
+        lock = threading.Lock()
+        handle = self.server.meter.handle
+
+        def record(command):
+            with lock:
+                self.commands.append(command.strip().upper())
+            return handle(command)
+        self.server.meter.handle = record
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "sim.yml")
+        with open(self.path, "w") as openfile:
+            yaml.dump(device_data("poll", self.server.server_address[1]),
+                      openfile, default_flow_style=False)
+
+    def test_worker_measures_handed_over_device(self):
+        device = freqmeterdevice.FreqMeter.get_freq_meter(self.path)
+        self.assertTrue(device.connect())
+        self.addCleanup(device.disconnect)
+        engine = worker_engine.ProcessMeasurementEngine(batch_interval=0.02)
+        self.assertTrue(engine.hands_over(device))
+        # As the application does for handed over devices
+        device.prepare_measurement(self.GATE_TIME, [0], None)
+        engine.start([device], self.GATE_TIME)
+        self.assertTrue(device.is_detached())
+        self.assertFalse(device.is_connected())
+        deadline = time.monotonic() + 30
+        while device.get_sample_count() < 10:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.05)
+        engine.stop()
+        # The device is taken back, and only the worker configured it
+        self.assertFalse(device.is_detached())
+        self.assertTrue(device.is_connected())
+        self.assertTrue(device.is_ready())
+        self.assertEqual(self.commands.count("INIT"), 1)
+        timestamps = list(device.get_measurement_data()[0].get_timestamps())
+        self.assertGreaterEqual(len(timestamps), 10)
+        self.assertEqual(timestamps, sorted(timestamps))
+        rates = engine.get_sample_rates()
+        self.assertGreater(rates[device.get_name()], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -368,6 +368,8 @@ class CalibWindow(QtWidgets.QDialog, calibration_interface.Ui_CalibWindow):
         Stop coarse calibration.
         """
         self.m_engine.stop()
+        self.target_device.stop_measurement()
+        self.reference_device.stop_measurement()
         logger.debug("Measurement stopped")
         self.__plot_update.stop()
         logger.debug("Plotting stopped")
@@ -425,8 +427,7 @@ class CalibWindow(QtWidgets.QDialog, calibration_interface.Ui_CalibWindow):
             if channel.isChecked():
                 selected_channel = j
         channel_measurements = target_data[selected_channel]
-        target_f = [measurement["coarse"]
-            for measurement in channel_measurements.values()]
+        target_f = list(channel_measurements.get_signal("coarse"))
         self.ax_coarse.plot(target_f, label="Target: {} Ch-{}".format(
             self.target_device_selector.currentText(), selected_channel+1))
 
@@ -436,8 +437,8 @@ class CalibWindow(QtWidgets.QDialog, calibration_interface.Ui_CalibWindow):
             if channel.isChecked():
                 selected_channel = j
         channel_measurements = reference_data[selected_channel]
-        reference_f = [measurement[self.reference_device.get_signals()[0]]
-            for measurement in channel_measurements.values()]
+        reference_f = list(channel_measurements.get_signal(
+            self.reference_device.get_signals()[0]))
         self.ax_coarse.plot(reference_f, label="Reference: {} Ch-{}".format(
             self.target_device_selector.currentText(), selected_channel+1))
 
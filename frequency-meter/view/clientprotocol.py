@@ -1,25 +1,52 @@
 # Standard libraries
 import abc
+import logging
+import queue
 import socket
-# Third party libraries
-import visa
+import threading
+import time
+# Local libraries
+from view import instrumentation
+
+logger = logging.getLogger("view")
+
+# PyVISA resource manager, shared by all the VISA clients. PyVISA is only
+# imported when the first VISA device is connected.
+_resource_manager = None
+_resource_manager_lock = threading.Lock()
+
+
+def get_resource_manager():
+    """
+    Return the shared PyVISA resource manager, creating it on first use.
+
+    Return None if PyVISA is not available.
+    """
+    global _resource_manager
+    with _resource_manager_lock:
+        if _resource_manager is None:
+            try:
+                import visa
+            except ImportError:
+                logger.error("PyVISA is not installed, VISA devices are not "
+                             "available")
+                return None
+            _resource_manager = visa.ResourceManager("@py")
+    return _resource_manager
 
 
 class Client(abc.ABC):
+    # Source of the stages recorded by the latency instrumentation
+    trace_source = "client"
+
     @staticmethod
     def get_client(communications):
-        if communications["Protocol"] == "TCP/IP":
-            return TCPIPClient(communications["Properties"]['CommProp1'],
-                               communications["Properties"]['CommProp2'])
-        elif communications["Protocol"] == "VISA-TCP/IP":
-            return VISATCPIPClient(communications["Properties"]['CommProp1'],
-                                   communications["Properties"]['CommProp2'],
-                                   communications["Properties"]['CommProp3'],
-                                   communications["Properties"]['CommProp4'])
-        elif communications["Protocol"] == "Test":
-            return TestClient()
-        else:
+        protocol = PROTOCOLS.get(communications["Protocol"])
+        if protocol is None:
             return None
+        client_class, properties = protocol
+        return client_class(*[communications["Properties"][prop]
+                              for prop in properties])
 
     @abc.abstractmethod
     def connect(self):
@@ -37,14 +64,47 @@ class Client(abc.ABC):
     def read(self):
         return ""
 
+    def read_block(self):
+        """
+        Read a reply that may not fit in a single read, as bulk data.
+
+        By default it is the same as read(); clients whose transport does
+        not keep message boundaries override it.
+        """
+        return self.read()
+
+    def start_stream(self, on_record):
+        """
+        Start consuming records pushed by the device.
+
+        on_record is called, from a background reader, with every record
+        received, and returns False if it is not a record but the reply of
+        a command. Return False if the client does not support streaming.
+        """
+        return False
+
+    def stop_stream(self):
+        """Stop consuming pushed records."""
+        return True
+
+    def is_stream_alive(self):
+        """Return False if a started stream ended on its own."""
+        return True
+
 
 class TCPIPClient(Client):
     TIMEOUT = 0.2
+    # Maximum time (s) discarding the records in flight after a stream
+    DRAIN_TIME = 1.0
 
     def __init__(self, ip, port):
         self.__ip = ip
         self.__port = int(port)
         self.__socket = None
+        self.__reader = None
+        self.__streaming = False
+        # Replies of the commands sent while streaming
+        self.__replies = queue.Queue()
 
     def connect(self):
         self.__socket = socket.socket(family=socket.AF_INET,
@@ -52,7 +112,8 @@ class TCPIPClient(Client):
         self.__socket.settimeout(self.TIMEOUT)
         try:
             self.__socket.connect((self.__ip, self.__port))
-        except (socket.timeout, ConnectionRefusedError) as error:
+        except OSError:
+            # Timed out, refused or unreachable
             self.__socket.close()
             self.__socket = None
             return False
@@ -60,8 +121,13 @@ class TCPIPClient(Client):
         return True
 
     def disconnect(self):
+        self.stop_stream()
         if self.__socket:
-            self.__socket.send(b"EXIT")
+            try:
+                self.__socket.send(b"EXIT")
+            except OSError:
+                # The connection is already broken
+                pass
             self.__socket.close()
             self.__socket = None
         return True
@@ -69,12 +135,24 @@ class TCPIPClient(Client):
     def write(self, command):
         if not self.__socket:
             return False
+        tracer = instrumentation.tracer
+        start = instrumentation.monotonic_ns() if tracer.enabled else None
         self.__socket.send(str.encode(command))
+        if start is not None:
+            tracer.record(self.trace_source, "write", start)
         return True
 
     def read(self):
         if not self.__socket:
             return False, ""
+        if self.__reader:
+            # The socket is read by the stream reader
+            try:
+                return True, self.__replies.get(timeout=self.TIMEOUT)
+            except queue.Empty:
+                return False, ""
+        tracer = instrumentation.tracer
+        start = instrumentation.monotonic_ns() if tracer.enabled else None
         # Read back the answer from the server.
         try:
             reply = self.__socket.recv(4000)
@@ -82,10 +160,115 @@ class TCPIPClient(Client):
             reply = ""
             success = False
         else:
+            if not reply:
+                # The device closed the connection
+                return False, ""
+            if start is not None:
+                # Device turnaround and reception
+                received = instrumentation.monotonic_ns()
+                tracer.record(self.trace_source, "read", start, received)
             reply = reply.decode('utf-8')
+            if start is not None:
+                tracer.record(self.trace_source, "decode", received)
             success = True
         return success, reply
 
+    def read_block(self):
+        """
+        Read an IEEE 488.2 definite length block: #<n><length><data>.
+
+        The block header is parsed and the socket read until the whole
+        data is received. Only the data is returned.
+        """
+        if not self.__socket:
+            return False, ""
+        tracer = instrumentation.tracer
+        start = instrumentation.monotonic_ns() if tracer.enabled else None
+        data = b""
+        try:
+            while len(data) < 2 or len(data) < 2 + int(data[1:2]):
+                data += self.__recv()
+            if data[:1] != b"#":
+                return False, ""
+            header_length = 2 + int(data[1:2])
+            length = int(data[2:header_length] or 0)
+            while len(data) < header_length + length:
+                data += self.__recv()
+        except (socket.timeout, ConnectionError, ValueError):
+            return False, ""
+        if start is not None:
+            received = instrumentation.monotonic_ns()
+            tracer.record(self.trace_source, "read", start, received)
+        reply = data[header_length:header_length+length].decode('utf-8')
+        if start is not None:
+            tracer.record(self.trace_source, "decode", received)
+        return True, reply
+
+    def start_stream(self, on_record):
+        """
+        Start a background reader for the records pushed by the device.
+
+        Records are newline terminated. Commands can still be sent while
+        streaming; the device terminates their replies too, and the lines
+        that on_record does not take as records are returned by read().
+        """
+        if not self.__socket:
+            return False
+        self.__replies = queue.Queue()
+        self.__streaming = True
+        self.__reader = threading.Thread(target=self.__read_stream,
+                                         args=(on_record,), daemon=True)
+        self.__reader.start()
+        return True
+
+    def stop_stream(self):
+        if not self.__reader:
+            return True
+        self.__streaming = False
+        self.__reader.join()
+        self.__reader = None
+        # Discard the records that were in flight, so that they are not
+        # taken as the reply of the next command. The device should have
+        # been told to stop pushing them; if it keeps on, give up at the
+        # deadline.
+        deadline = time.monotonic() + self.DRAIN_TIME
+        try:
+            while (time.monotonic() < deadline and
+                   self.__socket.recv(65536)):
+                pass
+        except (socket.timeout, OSError):
+            pass
+        return True
+
+    def is_stream_alive(self):
+        return self.__reader is None or self.__streaming
+
+    def __read_stream(self, on_record):
+        pending = b""
+        while self.__streaming:
+            try:
+                chunk = self.__socket.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            if not chunk:
+                break
+            pending += chunk
+            *records, pending = pending.split(b"\n")
+            for record in records:
+                record = record.decode('utf-8')
+                if not on_record(record):
+                    self.__replies.put(record)
+        self.__streaming = False
+        return
+
+    def __recv(self):
+        chunk = self.__socket.recv(65536)
+        if not chunk:
+            raise ConnectionResetError("Connection closed by the device")
+        return chunk
+
 
 class VISATCPIPClient(Client):
     def __init__(self, ethernet_board, host_ip, lan_device, gpib_address):
@@ -96,7 +279,9 @@ class VISATCPIPClient(Client):
         self.__resource = None
 
     def connect(self):
-        rm = visa.ResourceManager("@py")
+        rm = get_resource_manager()
+        if rm is None:
+            return False
         visa_address = 'TCPIP{}::{}::{},{}::INSTR'.format(
                 self.__ethernet_board,
                 self.__host_ip,
@@ -112,11 +297,20 @@ class VISATCPIPClient(Client):
         return True
 
     def write(self, command):
+        tracer = instrumentation.tracer
+        start = instrumentation.monotonic_ns() if tracer.enabled else None
         self.__resource.write(command)
+        if start is not None:
+            tracer.record(self.trace_source, "write", start)
         return True
 
     def read(self):
-        return True, self.__resource.read()
+        tracer = instrumentation.tracer
+        start = instrumentation.monotonic_ns() if tracer.enabled else None
+        reply = self.__resource.read()
+        if start is not None:
+            tracer.record(self.trace_source, "read", start)
+        return True, reply
 
 
 class TestClient(Client):
@@ -134,3 +328,13 @@ class TestClient(Client):
 
     def read(self):
         return True, 0.0
+
+
+# Client of every protocol of the device files, and the communication
+# properties passed to it
+PROTOCOLS = {
+    "TCP/IP": (TCPIPClient, ("CommProp1", "CommProp2")),
+    "VISA-TCP/IP": (VISATCPIPClient, ("CommProp1", "CommProp2", "CommProp3",
+                                      "CommProp4")),
+    "Test": (TestClient, ()),
+}
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Connection of the devices in the background, and their supervision.
+
+The connections are opened by a pool of threads, several devices at a
+time, so an unreachable device does not freeze the user interface nor
+delays the other devices. Once connected, every device is watched:
+- While measuring, from its fetches: a device with MAX_FAILURES failed
+  fetches in a row, or whose stream ended, is connected again. It is
+  not queried meanwhile, so the fetches keep their schedule.
+- Otherwise, with a cheap query (*IDN?) every PROBE_INTERVAL seconds.
+A lost device is connected again with an exponential backoff, from
+MIN_BACKOFF to MAX_BACKOFF seconds, while the other devices keep being
+measured. The fetches of a device are skipped while it is being probed
+or connected again.
+"""
+# Standard libraries
+from concurrent import futures
+import logging
+import random
+import time
+# Third party libraries
+from PyQt5 import QtCore
+
+logger = logging.getLogger("view")
+
+
+class DeviceHealth(object):
+    """Supervision state of a connected device."""
+    def __init__(self, device, slot, backoff, next_check):
+        self.device = device
+        self.slot = slot
+        self.up = True
+        # A probe or a reconnection is running
+        self.busy = False
+        self.backoff = backoff
+        self.next_check = next_check
+
+
+class ConnectionManager(QtCore.QObject):
+    """
+    Connects devices in background threads and keeps them connected.
+
+    The results are sent with Qt signals, so their slots run in the GUI
+    thread.
+    """
+    # Slot and device connected and ready
+    device_connected = QtCore.pyqtSignal(int, object)
+    # Slot, device name and reason of a failed connection
+    connect_failed = QtCore.pyqtSignal(int, str, str)
+    # Slot and supervised device, and if it is connected now
+    device_state_changed = QtCore.pyqtSignal(int, object, bool)
+    # Devices connected at the same time
+    MAX_PARALLEL = 8
+    # Time (s) between the probes of an idle device
+    PROBE_INTERVAL = 2.0
+    # Failed fetches in a row of a lost device
+    MAX_FAILURES = 3
+    # Limits of the time (s) between the reconnections of a lost device
+    MIN_BACKOFF = 0.5
+    MAX_BACKOFF = 30.0
+    # Period (ms) of the supervision
+    CHECK_PERIOD = 250
+
+    def __init__(self, parent=None):
+        QtCore.QObject.__init__(self, parent)
+        self.__pool = futures.ThreadPoolExecutor(
+                max_workers=self.MAX_PARALLEL,
+                thread_name_prefix="connection")
+        # Supervised devices, by device
+        self.__health = {}
+        self.__measuring = False
+        self.__timer = QtCore.QTimer(self)
+        self.__timer.timeout.connect(self.__supervise)
+        self.__timer.start(self.CHECK_PERIOD)
+
+    def connect_device(self, slot, device):
+        """
+        Connect a device in the background. device_connected or
+        connect_failed is emitted when done.
+        """
+        self.__pool.submit(self.__connect, slot, device)
+        return
+
+    def __connect(self, slot, device):
+        name = device.get_name()
+        try:
+            if not device.connect():
+                self.connect_failed.emit(slot, name, "unreachable")
+                return
+            if not device.is_ready():
+                device.disconnect()
+                self.connect_failed.emit(slot, name, "not ready")
+                return
+        except Exception as error:
+            # Whatever the client raises on a broken connection
+            self.connect_failed.emit(slot, name, str(error))
+            return
+        self.device_connected.emit(slot, device)
+        return
+
+    def watch(self, slot, device):
+        """Supervise a connected device, until forget is called."""
+        self.__health[device] = DeviceHealth(
+                device, slot, self.MIN_BACKOFF,
+                time.monotonic() + self.PROBE_INTERVAL)
+        return
+
+    def forget(self, device):
+        """Stop supervising a device."""
+        self.__health.pop(device, None)
+        return
+
+    def set_measuring(self, measuring):
+        """
+        Set if the devices are being measured, so their health is taken
+        from their fetches instead of probing them.
+        """
+        self.__measuring = measuring
+        now = time.monotonic()
+        for health in self.__health.values():
+            if health.up:
+                health.next_check = now + self.PROBE_INTERVAL
+        return
+
+    def get_health(self, device):
+        """Return the supervision state of a device, None if not watched."""
+        return self.__health.get(device)
+
+    def shutdown(self):
+        """Stop the supervision, without waiting for the running tasks."""
+        self.__timer.stop()
+        self.__health.clear()
+        self.__pool.shutdown(wait=False)
+        return
+
+    def __supervise(self):
+        now = time.monotonic()
+        for health in list(self.__health.values()):
+            device = health.device
+            # Remote devices are kept by their agent, and detached ones
+            # by a worker process
+            if (health.busy or device.get_device_path() is None
+                    or device.is_detached()):
+                continue
+            if health.up:
+                if self.__measuring:
+                    if (device.is_connected() and
+                            device.get_failure_count() < self.MAX_FAILURES):
+                        continue
+                    self.__set_down(health, now)
+                elif now >= health.next_check:
+                    health.busy = True
+                    self.__pool.submit(self.__probe, health)
+                    continue
+            if not health.up and now >= health.next_check:
+                health.busy = True
+                self.__pool.submit(self.__reconnect, health,
+                                   self.__measuring)
+        return
+
+    def __set_down(self, health, now):
+        health.up = False
+        health.backoff = self.MIN_BACKOFF
+        health.next_check = now
+        logger.warning("Lost the connection to device {}".format(
+                health.device.get_name()))
+        self.device_state_changed.emit(health.slot, health.device, False)
+        return
+
+    def __probe(self, health):
+        try:
+            if health.device.probe():
+                health.next_check = time.monotonic() + self.PROBE_INTERVAL
+            else:
+                self.__set_down(health, time.monotonic())
+        finally:
+            health.busy = False
+        return
+
+    def __reconnect(self, health, measuring):
+        device = health.device
+        try:
+            if not device.reconnect():
+                logger.debug("Device {} not reachable, next attempt in "
+                             "{:.1f} s".format(device.get_name(),
+                                               health.backoff))
+                health.next_check = time.monotonic() + health.backoff
+                # Jitter keeps the devices of a broken link from being
+                # connected again all at once
+                health.backoff = min(self.MAX_BACKOFF, health.backoff *
+                                     random.uniform(1.5, 2.5))
+                return
+            if measuring and not device.resume_measurement():
+                logger.error("Unable to resume the measurement of device {}"
+                             "".format(device.get_name()))
+            health.up = True
+            health.backoff = self.MIN_BACKOFF
+            health.next_check = time.monotonic() + self.PROBE_INTERVAL
+            logger.info("Connected again to device {} ({} reconnections)"
+                        "".format(device.get_name(),
+                                  device.get_reconnect_count()))
+            self.device_state_changed.emit(health.slot, device, True)
+        finally:
+            health.busy = False
+        return
@@ -22,6 +22,9 @@ class DevManagerWindow(QtWidgets.QDialog, device_interface.Ui_DevManagerWindow):
                                        self.S3label, self.S4label]
         self.__signal_type_labels = [self.signal1_type, self.signal2_type,
                                      self.signal3_type, self.signal4_type]
+        # Acquisition section of the opened device, not shown in the form
+        # but kept when saving it
+        self.__acquisition = None
         # Vendor change event
         self.VendorSelector.currentIndexChanged.connect(self.__on_vendor_change)
         # Protocol change event
@@ -109,11 +112,12 @@ class DevManagerWindow(QtWidgets.QDialog, device_interface.Ui_DevManagerWindow):
         # Open the specified file and parse it with yaml.
         with open(file, 'r') as conf_file:
             try:
-                dev_data = yaml.load(conf_file)
+                dev_data = yaml.safe_load(conf_file)
             except yaml.parser.ParserError:
                 err_text = "<font color='red'>Can open only 'YML' files!</font>"
                 self.ErrorLabel.setText(err_text)
                 return
+        self.__acquisition = dev_data.get('acquisition')
         # Load general properties to interface.
         self.DevNameText.setText(dev_data['general']['Name'])
         v_index = self.VendorSelector.findText(dev_data['general']['Vendor'])
@@ -190,6 +194,14 @@ class DevManagerWindow(QtWidgets.QDialog, device_interface.Ui_DevManagerWindow):
                 R1MOhm=str(self.impedance_1m.isChecked()),
                 ),
             )
+        # Keep the acquisition settings of the opened device, or else of
+        # the overwritten one
+        acquisition = self.__acquisition
+        if acquisition is None:
+            acquisition = self.__read_acquisition(
+                    'resources/devices/{}.yml'.format(dev_name))
+        if acquisition:
+            dev_data['acquisition'] = acquisition
         # If the file already exists, remove and create it again with the
         # form data.
         try:
@@ -202,6 +214,15 @@ class DevManagerWindow(QtWidgets.QDialog, device_interface.Ui_DevManagerWindow):
         self.close()
         return
 
+    @staticmethod
+    def __read_acquisition(path):
+        """Return the acquisition section of a device file, if any."""
+        try:
+            with open(path, 'r') as conf_file:
+                return (yaml.safe_load(conf_file) or {}).get('acquisition')
+        except (OSError, yaml.YAMLError):
+            return None
+
     def __on_protocol_change(self):
         """
         Update the communication labels/boxes texts and visible status.
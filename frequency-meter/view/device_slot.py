@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""Device slot panel of the main window"""
+# Standard libraries
+import functools
+
+# Third party libraries
+from PyQt5 import QtCore, QtWidgets
+
+
+class DeviceSlot(QtWidgets.QGroupBox):
+    """
+    Group box with the controls of one device slot of the main window.
+
+    It is built at runtime, so any number of slots can be added and
+    removed. The widgets keep the object names of the Qt Designer device
+    panels (device<n>, device<n>_selector, device<n>_channel<k>, ...).
+    The selection of the controls is cached as plain Python state, kept
+    up to date from their toggled signals, so the measurement and the
+    plot read it without walking the widget tree.
+    """
+    # Maximum number of channels, impedances and signals of a device
+    CONTROLS = 4
+
+    def __init__(self, index, parent=None):
+        QtWidgets.QGroupBox.__init__(self, parent)
+        self.index = index
+        # Cached state of the slot
+        self.__device_name = None
+        self.__channels = []
+        self.__impedance = None
+        self.__signal_names = []
+        self.__signals = []
+        name = "device{}".format(index)
+        self.setObjectName(name)
+        self.setTitle("Device {}".format(index+1))
+        self.setSizePolicy(QtWidgets.QSizePolicy.Preferred,
+                           QtWidgets.QSizePolicy.Preferred)
+        layout = QtWidgets.QHBoxLayout(self)
+        # Device selection and connection
+        control = QtWidgets.QGridLayout()
+        control.setObjectName("{}_control".format(name))
+        self.selector = QtWidgets.QComboBox(self)
+        self.selector.setObjectName("{}_selector".format(name))
+        control.addWidget(self.selector, 0, 0, 1, 1)
+        self.connect_button = QtWidgets.QPushButton("Connect", self)
+        self.connect_button.setMinimumSize(QtCore.QSize(90, 0))
+        self.connect_button.setObjectName("{}_connect".format(name))
+        control.addWidget(self.connect_button, 1, 0, 1, 1)
+        layout.addLayout(control)
+        # Measurement selectors
+        self.channels_group, self.channel_controls = self.__add_selector(
+                layout, "Channels", "channels", "channel",
+                QtWidgets.QRadioButton)
+        for i, control in enumerate(self.channel_controls):
+            control.setText(str(i+1))
+            # Several channels of a device can be measured at once
+            control.setAutoExclusive(False)
+        self.impedances_group, self.impedance_controls = self.__add_selector(
+                layout, "Impedance", "impedances", "impedance",
+                QtWidgets.QRadioButton)
+        self.signals_group, self.signal_controls = self.__add_selector(
+                layout, "Signals", "signals", "signal", QtWidgets.QCheckBox)
+        # Keep the cached state in sync with the controls
+        for i, control in enumerate(self.channel_controls):
+            control.toggled.connect(
+                    functools.partial(self.__on_channel_toggled, i))
+        for i, control in enumerate(self.impedance_controls):
+            control.toggled.connect(
+                    functools.partial(self.__on_impedance_toggled, i))
+        for control in self.signal_controls:
+            control.toggled.connect(self.__on_signal_toggled)
+
+    def __add_selector(self, layout, title, group_name, control_name,
+                       control_class):
+        name = self.objectName()
+        group = QtWidgets.QGroupBox(title, self)
+        group.setObjectName("{}_{}".format(name, group_name))
+        group.setEnabled(False)
+        group.setMinimumSize(QtCore.QSize(120, 0))
+        group_layout = QtWidgets.QVBoxLayout(group)
+        controls = []
+        for i in range(self.CONTROLS):
+            control = control_class(group)
+            control.setObjectName("{}_{}{}".format(name, control_name, i))
+            # Hidden controls keep their space, so the panel does not jump
+            policy = control.sizePolicy()
+            policy.setRetainSizeWhenHidden(True)
+            control.setSizePolicy(policy)
+            control.setEnabled(False)
+            control.setVisible(False)
+            group_layout.addWidget(control)
+            controls.append(control)
+        layout.addWidget(group)
+        return group, controls
+
+    def __on_channel_toggled(self, channel, checked):
+        if checked and channel not in self.__channels:
+            self.__channels = sorted(self.__channels + [channel])
+        elif not checked and channel in self.__channels:
+            self.__channels = [c for c in self.__channels if c != channel]
+        return
+
+    def __on_impedance_toggled(self, index, checked):
+        if checked:
+            self.__impedance = self.impedance_controls[index].text()
+        elif self.__impedance == self.impedance_controls[index].text():
+            self.__impedance = None
+        return
+
+    def __on_signal_toggled(self, checked):
+        self.__signals = [
+            name for name, control in zip(self.__signal_names,
+                                          self.signal_controls)
+            if control.isChecked()]
+        return
+
+    def get_device_name(self):
+        """Return the name of the connected device, None if there is not."""
+        return self.__device_name
+
+    def get_channels(self):
+        """Return the selected channels (starting at 0), in order."""
+        return self.__channels
+
+    def get_impedance(self):
+        return self.__impedance
+
+    def get_signals(self):
+        """Return the names of the checked signals."""
+        return self.__signals
+
+    def show_device(self, name, device):
+        """Show the controls of the channels, impedances and signals of a
+        connected device."""
+        self.__device_name = name
+        self.connect_button.setText("Disconnect")
+        self.connect_button.setEnabled(True)
+        self.selector.setEnabled(False)
+        for group in (self.channels_group, self.impedances_group,
+                      self.signals_group):
+            group.setEnabled(True)
+        # Show available channels
+        channels = device.get_channels()
+        for i, control in enumerate(self.channel_controls):
+            control.setEnabled(i < channels)
+            control.setVisible(i < channels)
+        # Select the first channel by default
+        self.channel_controls[0].setChecked(True)
+        # Show available impedances
+        impedances = device.get_impedances()
+        for i, control in enumerate(self.impedance_controls):
+            control.setText(impedances[i] if i < len(impedances) else "")
+            control.setEnabled(i < len(impedances))
+            control.setVisible(i < len(impedances))
+        self.impedance_controls[0].setChecked(True)
+        # Show available signals
+        self.__signal_names = list(device.get_signals())
+        for i, control in enumerate(self.signal_controls):
+            signals = len(self.__signal_names)
+            control.setText(self.__signal_names[i] if i < signals else "")
+            control.setEnabled(i < signals)
+            control.setVisible(i < signals)
+        return
+
+    def show_connecting(self):
+        """Lock the slot while its device is connected in the background."""
+        self.connect_button.setText("Connecting...")
+        self.connect_button.setEnabled(False)
+        self.selector.setEnabled(False)
+        return
+
+    def show_online(self, online):
+        """Show if the connection to the device was lost."""
+        title = "Device {}".format(self.index+1)
+        self.setTitle(title if online else "{} (offline)".format(title))
+        return
+
+    def clear_device(self):
+        """Hide the device controls after disconnecting the device."""
+        self.connect_button.setText("Connect")
+        self.connect_button.setEnabled(True)
+        self.show_online(True)
+        self.selector.setEnabled(True)
+        for group in (self.channels_group, self.impedances_group,
+                      self.signals_group):
+            group.setEnabled(False)
+        for control in (self.channel_controls + self.impedance_controls +
+                        self.signal_controls):
+            control.setChecked(False)
+            control.setEnabled(False)
+            control.setVisible(False)
+        for control in self.signal_controls:
+            control.setText("")
+        self.__signal_names = []
+        self.__signals = []
+        self.__device_name = None
+        return
+
+    def set_locked(self, locked):
+        """Lock the slot configuration while measuring. The signals can
+        still be chosen, as they only affect the plot."""
+        self.selector.setEnabled(not locked and self.__device_name is None)
+        self.connect_button.setEnabled(not locked)
+        self.channels_group.setEnabled(not locked and
+                                       self.__device_name is not None)
+        self.impedances_group.setEnabled(not locked and
+                                         self.__device_name is not None)
+        return
@@ -1,24 +1,35 @@
 #!/usr/bin/env python3
 # Standard libraries
 import abc
-from collections import OrderedDict
-import datetime
+from collections import deque
 import logging
 import random
+import threading
+import time
 # Third party libraries
 import yaml
 # Local application
+from model import measurement_store
+from model import shared_ring
 from view import clientprotocol
+from view import instrumentation
+from view import simulator
 
 
 logger = logging.getLogger("view")
 
 
 class FreqMeter(abc.ABC):
+    # Devices that can be described in a device file
+    configurable = True
+
     @staticmethod
     def get_vendors():
         vendors = {}
         for freq_meter_class in FreqMeter.__subclasses__():
+            # Devices without configuration file
+            if not freq_meter_class.configurable:
+                continue
             vendors[freq_meter_class.get_vendor_name()] = {
                 "channels": freq_meter_class.get_channels(),
                 "signals": freq_meter_class.get_signals(),
@@ -30,7 +41,7 @@ class FreqMeter(abc.ABC):
     @staticmethod
     def get_freq_meter(dev_path):
         with open(dev_path, 'r') as read_file:
-            data = yaml.load(read_file)
+            data = yaml.safe_load(read_file)
             vendor = data["general"]["Vendor"]
         if vendor == "Uvigo":
             return UviFreqMeter(dev_path)
@@ -66,25 +77,86 @@ class FreqMeter(abc.ABC):
     def get_impedances(cls):
         return []
 
-    def __init__(self, dev_path):
-        # Read and load the device configuration file
-        with open(dev_path, 'r') as read_file:
-            self._dev_data = yaml.load(read_file)
+    def __init__(self, dev_path, dev_data=None):
+        """
+        dev_path: device configuration file.
+        dev_data: device configuration, for devices without a file.
+        """
+        if dev_data is None:
+            # Read and load the device configuration file
+            with open(dev_path, 'r') as read_file:
+                dev_data = yaml.safe_load(read_file)
+        self._dev_path = dev_path
+        self._dev_data = dev_data
         self.__name = self._dev_data["general"]["Name"]
         # Communication
-        self.__client = clientprotocol.Client.get_client(
-                self._dev_data['communications'])
+        self.__client = self._create_client()
+        if self.__client is not None:
+            self.__client.trace_source = self.__name
         self.__connected = False
-        self._active_channel = None
+        # Successful connections, to count the reconnections
+        self.__connections = 0
+        # Consecutive failed fetches
+        self.__failures = 0
+        # The connection is handed over to a worker process
+        self.__detached = False
+        # Serializes the use of the connection by the fetches, the health
+        # probes and the reconnections
+        self.__io_lock = threading.RLock()
+        # Acquisition mode: "poll" asks for the last sample on every fetch,
+        # "buffered" lets the instrument keep BufferDepth samples, which
+        # are drained with a single bulk query, and "stream" makes the
+        # instrument push every sample as soon as it is measured.
+        # FetchTime and SampleTime override the session times for this
+        # device, so each device can be sampled at its own rate.
+        acquisition = self._dev_data.get("acquisition", {})
+        self._acquisition_mode = acquisition.get("Mode", "poll")
+        self._buffer_depth = int(acquisition.get("BufferDepth", 1000))
+        self._fetch_time = acquisition.get("FetchTime")
+        self._sample_time = acquisition.get("SampleTime")
+        # Devices with the same Worker are fetched by the same worker
+        # process of the process engine, instead of one process each
+        self._worker = acquisition.get("Worker")
+        # SharedMemory mirrors the last SharedMemoryDepth samples of every
+        # measured channel in a shared memory ring, for local consumers
+        self._shared_memory = acquisition.get("SharedMemory",
+                                              "False") == "True"
+        self._shared_memory_depth = int(acquisition.get("SharedMemoryDepth",
+                                                        100000))
+        self.__rings = []
+        self._active_channels = []
+        self._measurement_settings = None
+        # Host time (ns) of the INIT of each channel, the origin of the
+        # device times
+        self._start_times = {}
+        self._gate_time = None
+        # Samples received by the stream reader, waiting to be stored
+        self._pending_samples = deque()
+        # Callables notified of every stored sample
+        self.__sample_listeners = []
         self._measurement_data = self.__init_measurement_data()
+        self.__init_sample_counters()
+
+    def __init_sample_counters(self):
+        # Last stored (timestamp, values) of each channel
+        self._last_samples = {}
+        self._first_timestamp = None
+        self._last_timestamp = None
+        self._sample_count = 0
+        self._stale_count = 0
 
     def __init_measurement_data(self):
         measurement_data = []
         for _ in range(self.get_channels()):
-            signal_measurements = OrderedDict()
-            measurement_data.append(signal_measurements)
+            measurement_data.append(
+                    measurement_store.MeasurementSeries(self.get_signals()))
         return measurement_data
 
+    def _create_client(self):
+        """Return the client of the communications protocol."""
+        return clientprotocol.Client.get_client(
+                self._dev_data['communications'])
+
     def get_name(self):
         return self.__name
 
@@ -97,20 +169,167 @@ class FreqMeter(abc.ABC):
 
         NOTE: The only validated protocol is TCP/IP.
         """
-        self.__connected = self.__client.connect()
+        with self.__io_lock:
+            self.__connected = self.__client.connect()
+            if self.__connected:
+                self.__connections += 1
+                self.__failures = 0
+        return self.__connected
+
+    def probe(self):
+        """
+        Check the connection with a cheap query. Return True if the device
+        answers. Not to be used while measuring, as replies of streaming
+        devices are not read then.
+        """
+        with self.__io_lock:
+            try:
+                return self.__connected and self.is_ready()
+            except Exception as error:
+                # Whatever the client raises on a broken connection
+                logger.debug("Probe of {} failed: {}".format(self.__name,
+                                                             error))
+                return False
+
+    def reconnect(self):
+        """
+        Close the connection and open it again. Return True if the device
+        answers again. The fetches are skipped meanwhile.
+        """
+        with self.__io_lock:
+            self.__connected = False
+            try:
+                self.__close_client()
+            except Exception:
+                # The connection is already broken
+                pass
+            try:
+                connected = self.connect() and self.is_ready()
+            except Exception as error:
+                logger.debug("Reconnection to {} failed: {}".format(
+                        self.__name, error))
+                connected = False
+            self.__connected = connected
+        return connected
+
+    def resume_measurement(self):
+        """
+        Configure the device again after connecting again, keeping the
+        samples stored so far.
+        """
+        if self._measurement_settings is None:
+            return True
+        with self.__io_lock:
+            return self._arm_measurement()
+
+    def get_failure_count(self):
+        """Return the number of consecutive failed fetches."""
+        return self.__failures
+
+    def detach(self):
+        """
+        Close the connection, so another process can open its own. It is
+        not counted as a reconnection when attach opens it again.
+        """
+        with self.__io_lock:
+            self.__detached = True
+            self.__close_client()
+            self.__connected = False
+        return
+
+    def attach(self):
+        """Open again the connection closed by detach."""
+        with self.__io_lock:
+            self.__connected = self.__client.connect()
+            self.__detached = False
         return self.__connected
 
+    def is_detached(self):
+        return self.__detached
+
+    def get_device_path(self):
+        """Return the device file, or None for devices without file."""
+        return self._dev_path
+
+    def get_worker(self):
+        """Return the worker process group of the device, if any."""
+        return self._worker
+
+    def get_reconnect_count(self):
+        """Return the number of times the device was connected again."""
+        return max(0, self.__connections - 1)
+
+    def __close_client(self):
+        """
+        Close the connection. A streaming device is aborted first, so it
+        stops pushing records while the stream reader is stopped.
+        """
+        if self.is_streaming():
+            try:
+                self.__client.write("ABOR")
+            except OSError:
+                # The connection is already broken
+                pass
+        return self.__client.disconnect()
+
     def disconnect(self):
         """Disconnect from the device server."""
-        self.__connected = not self.__client.disconnect()
+        with self.__io_lock:
+            self.__connected = not self.__close_client()
+        self.close_shared_rings()
         return self.__connected
 
+    def __open_rings(self):
+        """Mirror the series of the active channels in shared memory."""
+        self.close_shared_rings()
+        for channel in self._active_channels:
+            name = shared_ring.ring_name(self.__name, channel)
+            try:
+                ring = shared_ring.SharedRingWriter(
+                        name, self.get_signals(), self._shared_memory_depth,
+                        {"device": self.__name, "channel": channel + 1})
+            except (ImportError, OSError, ValueError) as error:
+                logger.warning("Shared memory ring {} not available: "
+                               "{}".format(name, error))
+                continue
+            self._measurement_data[channel].set_mirror(ring)
+            self.__rings.append(ring)
+            logger.info("{} channel {} mirrored in shared memory {}".format(
+                    self.__name, channel + 1, name))
+        return
+
+    def close_shared_rings(self):
+        """Remove the shared memory rings of the device."""
+        for ring in self.__rings:
+            ring.close()
+        self.__rings = []
+        return
+
+    def get_shared_rings(self):
+        """Return the names of the shared memory rings of the device."""
+        return [ring.get_name() for ring in self.__rings]
+
     def _send(self, cmd, read=False):
-        success = self.__client.write(cmd)
-        if success and read:
-            return self.__client.read()
-        else:
-            return success, ""
+        tracer = instrumentation.tracer
+        start = instrumentation.monotonic_ns() if tracer.enabled else None
+        with self.__io_lock:
+            success = self.__client.write(cmd)
+            if success and read:
+                reply = self.__client.read()
+            else:
+                reply = success, ""
+        if start is not None:
+            tracer.record(self.__name, "send", start)
+        return reply
+
+    def _query_block(self, cmd):
+        """Send a query whose reply is a bulk data block."""
+        with self.__io_lock:
+            success = self.__client.write(cmd)
+            if success:
+                return self.__client.read_block()
+            else:
+                return success, ""
 
     def is_connected(self):
         """Return the state of the connection."""
@@ -126,29 +345,307 @@ class FreqMeter(abc.ABC):
     def reset(self):
         return self._send("*RST")
 
+    def _start_stream(self):
+        """Consume the records pushed by the device in the background."""
+        self._pending_samples.clear()
+        return self.__client.start_stream(self._on_record)
+
+    def _stop_stream(self):
+        return self.__client.stop_stream()
+
+    def _on_record(self, record):
+        """
+        Parse a pushed record. Called from the stream reader.
+
+        The record holds the channel number (starting at 1), the device
+        time and the signal values. Return False if the line is not a
+        record, but the reply of a command.
+        """
+        try:
+            channel, device_time, *values = [
+                float(value) for value in record.split(",")]
+            channel = int(channel) - 1
+            timestamp = self._device_timestamp(channel, device_time)
+        except (ValueError, KeyError):
+            return False
+        self._pending_samples.append((channel, timestamp, values))
+        return True
+
+    def get_gate_time(self):
+        """Return the gate time (s) of the running measurement."""
+        return self._gate_time
+
+    def get_fetch_time(self, default):
+        """Return the fetch period (s) configured for the device."""
+        if self._fetch_time is None:
+            return default
+        return float(self._fetch_time)
+
+    def get_sample_time(self, default):
+        """Return the sample (gate) time (s) configured for the device."""
+        if self._sample_time is None:
+            return default
+        return float(self._sample_time)
+
+    def is_buffered(self):
+        """Return True if the instrument buffers the gate results."""
+        return self._acquisition_mode == "buffered"
+
+    def is_streaming(self):
+        """Return True if the instrument pushes the gate results."""
+        return self._acquisition_mode == "stream"
+
+    def get_measurement_settings(self):
+        """
+        Return the sample time, channels and impedance of the running
+        measurement, as passed to start_measurement.
+        """
+        return self._measurement_settings
+
+    def set_shared_memory(self, enabled):
+        """Enable or disable the shared memory rings of next measurements."""
+        self._shared_memory = enabled
+        return
+
+    def get_active_channels(self):
+        """Return the channels measured in the running measurement."""
+        return self._active_channels
+
     @abc.abstractmethod
-    def start_measurement(self, sample_time, channel, impedance):
+    def start_measurement(self, sample_time, channels, impedance):
+        """
+        Configure the device and start measuring.
+
+        channels is the index of the channel to measure, or a list of
+        indexes for measuring several channels in the same session.
+        """
+        if isinstance(channels, int):
+            channels = [channels]
         self._measurement_data = self.__init_measurement_data()
-        self._active_channel = channel
+        self._active_channels = list(channels)
+        self._measurement_settings = (sample_time, list(channels), impedance)
+        self._start_times = dict.fromkeys(channels,
+                                          measurement_store.now_ns())
+        self._gate_time = sample_time
+        self.__init_sample_counters()
+        if self._shared_memory:
+            self.__open_rings()
+        return
+
+    def prepare_measurement(self, sample_time, channels, impedance):
+        """
+        Take the settings of a measurement and clear the stored samples,
+        as start_measurement, without configuring the device, when it is
+        measured by another process.
+        """
+        FreqMeter.start_measurement(self, sample_time, channels, impedance)
+        return
+
+    def _arm_measurement(self):
+        """
+        Configure the device with the measurement settings and start it.
+        Return True on success.
+        """
+        return True
+
+    def stop_measurement(self):
+        """Stop the measurement started by start_measurement."""
         return
 
     def store_freq(self):
-        success, reply = self._fetch_freq()
+        """
+        Fetch and store the new samples. Nothing is done while the device
+        is disconnected, or being connected again or probed.
+        """
+        if not self.__connected:
+            return
+        if not self.__io_lock.acquire(blocking=False):
+            return
+        try:
+            self.__fetch_and_store()
+        except (OSError, ValueError) as error:
+            # A broken connection, or a reply that is not a sample
+            self.__failures += 1
+            logger.error("Couldn't fetch frequency from {}: {}".format(
+                    self.__name, error))
+        finally:
+            self.__io_lock.release()
+        return
+
+    def __fetch_and_store(self):
+        tracer = instrumentation.tracer
+        start = instrumentation.monotonic_ns() if tracer.enabled else None
+        if not self._sample_ready():
+            self._stale_count += 1
+            return
+        success, samples = self._fetch_samples()
         if not success:
-            logger.error("Couldn't fetch frequency")
+            self.__failures += 1
+            logger.error("Couldn't fetch frequency from {}".format(
+                    self.__name))
             return
-        fetch_time = datetime.datetime.now()
-        logger.debug("Fetch time: {}".format(
-                fetch_time.strftime("%H:%M:%S.%f")))
-        values = reply.split(",")
-        values = [float(value) for value in values]
-        signals = self.get_signals()
-        measurement = {}
-        for index, value in enumerate(values):
-            measurement[signals[index]] = value
-        self._measurement_data[self._active_channel][fetch_time] = measurement
+        self.__failures = 0
+        if start is not None:
+            fetched = instrumentation.monotonic_ns()
+            tracer.record(self.__name, "fetch", start, fetched)
+        self.store_samples(samples)
+        if start is not None:
+            end = instrumentation.monotonic_ns()
+            tracer.record(self.__name, "store", fetched, end)
+            tracer.record(self.__name, "store_freq", start, end)
+        return
+
+    def store_samples(self, samples):
+        """
+        Store a list of (channel, timestamp, values) samples, dropping the
+        stale ones. Used by store_freq, and by the engines that fetch the
+        device somewhere else.
+        """
+        for channel, timestamp, values in samples:
+            if self._is_stale(channel, timestamp, values):
+                self._stale_count += 1
+                logger.debug("Dropped stale sample from {} Ch-{}".format(
+                        self.__name, channel+1))
+                continue
+            self._measurement_data[channel].append(timestamp, values)
+            if self._first_timestamp is None:
+                self._first_timestamp = timestamp
+            self._last_timestamp = timestamp
+            self._last_samples[channel] = (timestamp, values)
+            self._sample_count += 1
+            for listener in self.__sample_listeners:
+                listener(self.__name, channel, timestamp, values)
         return
 
+    def _sample_ready(self):
+        """
+        Return False if the device reports that no new sample exists yet.
+
+        Devices with a status register override it, so the fetch is
+        skipped instead of reading the previous sample again.
+        """
+        return True
+
+    def _is_stale(self, channel, timestamp, values):
+        """
+        Return True if the sample repeats the last one of the channel.
+
+        Samples stamped by the device are stale if they are not newer than
+        the last stored sample. Samples stamped by the host are stale if
+        they repeat the last values before a whole gate time has elapsed.
+        """
+        if channel not in self._last_samples:
+            return False
+        last_timestamp, last_values = self._last_samples[channel]
+        if self.is_buffered() or self.is_streaming():
+            return timestamp <= last_timestamp
+        elapsed = (timestamp - last_timestamp) / 1e9
+        return values == last_values and elapsed < self._gate_time
+
+    def add_sample_listener(self, listener):
+        """
+        Call listener(device_name, channel, timestamp, values) with every
+        stored sample, from the thread that stores it.
+        """
+        self.__sample_listeners = self.__sample_listeners + [listener]
+        return
+
+    def remove_sample_listener(self, listener):
+        self.__sample_listeners = [
+            stored for stored in self.__sample_listeners
+            if stored != listener]
+        return
+
+    def get_sample_count(self):
+        """Return the number of samples stored since the start, counting
+        all the channels."""
+        return self._sample_count
+
+    def get_stale_count(self):
+        """Return the number of fetches dropped as stale since the start."""
+        return self._stale_count
+
+    def get_pending_count(self):
+        """Return the number of streamed samples waiting to be stored."""
+        return len(self._pending_samples)
+
+    def get_last_timestamp(self):
+        """Return the timestamp (ns) of the last stored sample, if any."""
+        return self._last_timestamp
+
+    def get_effective_rate(self):
+        """Return the rate (Hz) of the samples actually stored."""
+        if self._sample_count < 2:
+            return 0.0
+        span = (self._last_timestamp - self._first_timestamp) / 1e9
+        if span <= 0:
+            return 0.0
+        return (self._sample_count - 1) / span
+
+    def _fetch_samples(self):
+        """
+        Fetch the new samples as a list of (channel, timestamp, values).
+
+        By default a single sample of each active channel is fetched and
+        stamped with the host time; with several active channels, each
+        one is selected before fetching it. Buffered devices override it
+        for draining all the pending samples with one bulk query. When
+        streaming, the samples already received by the stream reader are
+        taken, without any round trip.
+        """
+        samples = []
+        if self.is_streaming():
+            while self._pending_samples:
+                samples.append(self._pending_samples.popleft())
+            if not samples and not self.__client.is_stream_alive():
+                # The stream ended with the connection
+                return False, samples
+            return True, samples
+        for channel in self._active_channels:
+            if len(self._active_channels) > 1:
+                self._select_channel(channel)
+            success, reply = self._fetch_freq()
+            if not success:
+                return False, samples
+            fetch_time = measurement_store.now_ns()
+            logger.debug("Fetch time: {}".format(
+                    measurement_store.to_datetime(fetch_time).strftime(
+                            "%H:%M:%S.%f")))
+            tracer = instrumentation.tracer
+            start = instrumentation.monotonic_ns() if tracer.enabled else None
+            values = [float(value) for value in reply.split(",")]
+            if start is not None:
+                tracer.record(self.__name, "parse", start)
+            samples.append((channel, fetch_time, values))
+        return True, samples
+
+    def _select_channel(self, channel):
+        """Select the channel the next fetch applies to."""
+        return
+
+    def _parse_records(self, reply, channel):
+        """
+        Parse a bulk reply of semicolon separated records of a channel.
+
+        Each record holds the device time, in seconds since the start of
+        the measurement, followed by the signal values.
+        """
+        tracer = instrumentation.tracer
+        start = instrumentation.monotonic_ns() if tracer.enabled else None
+        samples = []
+        for record in filter(None, reply.split(";")):
+            values = [float(value) for value in record.split(",")]
+            samples.append((channel,
+                            self._device_timestamp(channel, values[0]),
+                            values[1:]))
+        if start is not None:
+            tracer.record(self.__name, "parse", start)
+        return samples
+
+    def _device_timestamp(self, channel, device_time):
+        """Convert a device time (s) of a channel to a host timestamp (ns)."""
+        return self._start_times[channel] + int(device_time * 1e9)
+
     @abc.abstractmethod
     def _fetch_freq(self):
         return False, ""
@@ -178,16 +675,66 @@ class UviFreqMeter(FreqMeter):
     def get_impedances(cls):
         return ["50Ω", "1MΩ"]
 
-    def start_measurement(self, sample_time, channel, impedance):
-        super(UviFreqMeter, self).start_measurement(sample_time, channel,
+    def start_measurement(self, sample_time, channels, impedance):
+        super(UviFreqMeter, self).start_measurement(sample_time, channels,
                                                     impedance)
+        self._arm_measurement()
+        return
+
+    def _arm_measurement(self):
+        sample_time = self._measurement_settings[0]
+        # Both channels are independent, configure each of them and then
+        # arm them
+        for index, channel in enumerate(self._active_channels):
+            self._select_channel(channel)
+            if index == 0:
+                self.reset()
+            if self.is_buffered():
+                self._send("SENS:MODE:BUFFER {}".format(self._buffer_depth),
+                           True)
+            elif self.is_streaming():
+                self._send("SENS:MODE:STREAM", True)
+            else:
+                self._send("SENS:MODE:SAVELAST", True)
+            self._send("SENS:FREQ:ALL:ARM:TIM {}".format(sample_time), True)
+            self._send("INPUT:ATT 6", True)
+            self._send("INPUT:COUP AC", True)
+        # An armed streaming channel pushes its records at once, so they
+        # are read by the stream reader, which passes the replies on
+        if self.is_streaming() and not self._start_stream():
+            logger.error("Unable to start streaming from {}".format(
+                    self.get_name()))
+            return False
+        for channel in self._active_channels:
+            self._select_channel(channel)
+            # The device time of the channel starts at its INIT, also
+            # when the measurement is resumed after connecting again
+            self._start_times[channel] = measurement_store.now_ns()
+            self._send("INIT", True)
+        return True
+
+    def stop_measurement(self):
+        if self.is_streaming():
+            self._send("ABOR")
+            self._stop_stream()
+        return
+
+    def _select_channel(self, channel):
         self._send("CHANNEL {}".format(channel+1), True)
-        self.reset()
-        self._send("SENS:MODE:SAVELAST", True)
-        self._send("SENS:FREQ:ALL:ARM:TIM {}".format(sample_time), True)
-        self._send("INPUT:ATT 6", True)
-        self._send("INPUT:COUP AC", True)
-        self._send("INIT", True)
+
+    def _fetch_samples(self):
+        if not self.is_buffered():
+            return super(UviFreqMeter, self)._fetch_samples()
+        samples = []
+        for channel in self._active_channels:
+            if len(self._active_channels) > 1:
+                self._select_channel(channel)
+            success, reply = self._query_block("FETCH:FREQ:BUFF?")
+            if not success:
+                return False, samples
+            samples.extend(self._parse_records(reply, channel))
+        logger.debug("Fetched {} buffered samples".format(len(samples)))
+        return True, samples
 
     def _fetch_freq(self):
         return self._send("FETCH:FREQ:ALL", True)
@@ -253,6 +800,8 @@ class UviFreqMeter(FreqMeter):
 
 
 class AgilentFreqMeter(FreqMeter):
+    MEASURING_BIT = 1 << 4
+
     @classmethod
     def get_vendor_name(cls):
         return "Agilent"
@@ -273,9 +822,17 @@ class AgilentFreqMeter(FreqMeter):
     def get_impedances(cls):
         return ["50Ω", "1MΩ"]
 
-    def start_measurement(self, sample_time, channel, impedance):
-        super(AgilentFreqMeter, self).start_measurement(sample_time, channel,
+    def start_measurement(self, sample_time, channels, impedance):
+        super(AgilentFreqMeter, self).start_measurement(sample_time, channels,
                                                         impedance)
+        self._arm_measurement()
+        return
+
+    def _arm_measurement(self):
+        sample_time = self._measurement_settings[0]
+        # Only one channel can be measured at a time, so several channels
+        # are measured in turns. Index of the channel being measured:
+        self.__measured = 0
         # self.reset()
         # self._send("*CLS")
         # self._send("*SRE 0")
@@ -306,8 +863,35 @@ class AgilentFreqMeter(FreqMeter):
         self._send(":FREQ:ARM:STAR:SOUR IMM")
         self._send(":FREQ:ARM:STOP:SOUR TIM")
         self._send(":FREQ:ARM:STOP:TIM {}".format(0.25*sample_time))
-        self._send(":FUNC 'FREQ {}".format(channel+1))
+        self._send(":FUNC 'FREQ {}".format(self._active_channels[0]+1))
         self._send("INIT")
+        self._gate_time = 0.25*sample_time
+        return True
+
+    def _sample_ready(self):
+        # The Operation Status Condition register bit 4 is set while
+        # measuring (53131A Programming guide, Operation Status Register)
+        success, reply = self._send(":STAT:OPER:COND?", True)
+        if not success:
+            return True
+        try:
+            return not int(reply) & self.MEASURING_BIT
+        except ValueError:
+            return True
+
+    def _fetch_samples(self):
+        channel = self._active_channels[self.__measured]
+        success, reply = self._send("FETCH:FREQ?", True)
+        if len(self._active_channels) > 1:
+            # Switch to the next channel before starting a new measurement
+            self.__measured = (self.__measured+1) % len(self._active_channels)
+            self._send(":FUNC 'FREQ {}".format(
+                    self._active_channels[self.__measured]+1))
+        self._send("INIT")
+        if not success:
+            return False, []
+        values = [float(value) for value in reply.split(",")]
+        return True, [(channel, measurement_store.now_ns(), values)]
 
     def _fetch_freq(self):
         result = self._send("FETCH:FREQ?", True)
@@ -336,11 +920,61 @@ class TestFreqMeter(FreqMeter):
     def get_impedances(cls):
         return ["50Ω", "1MΩ"]
 
-    def start_measurement(self, sample_time, channel, impedance):
-        super(TestFreqMeter, self).start_measurement(sample_time, channel,
+    def __init__(self, dev_path):
+        super(TestFreqMeter, self).__init__(dev_path)
+        # The buffered and streaming modes are emulated with in-process
+        # simulated channels
+        self.__simulators = [simulator.SimulatedChannel(frequency=10, noise=1)
+                             for _ in range(self.get_channels())]
+        self.__pusher = None
+
+    def start_measurement(self, sample_time, channels, impedance):
+        super(TestFreqMeter, self).start_measurement(sample_time, channels,
                                                      impedance)
+        if self.is_buffered() or self.is_streaming():
+            for channel in self._active_channels:
+                self.__simulators[channel].reset()
+                self.__simulators[channel].configure(sample_time,
+                                                     self._buffer_depth)
+                self._start_times[channel] = measurement_store.now_ns()
+                self.__simulators[channel].init()
+        if self.is_streaming():
+            self.__pusher = threading.Thread(target=self.__push_records,
+                                             daemon=True)
+            self.__pusher.start()
+        return
+
+    def stop_measurement(self):
+        if self.is_streaming():
+            for channel in self._active_channels:
+                self.__simulators[channel].abort()
+            self.__pusher.join()
         return
 
+    def __push_records(self):
+        """Emulate the records pushed by a streaming device."""
+        simulators = [(channel, self.__simulators[channel])
+                      for channel in self._active_channels]
+        while any(sim.is_running() for _, sim in simulators):
+            time.sleep(max(self.get_gate_time(), 0.001))
+            for channel, sim in simulators:
+                for device_time, values in sim.fetch_buffer():
+                    self._on_record(simulator.format_record(
+                            channel+1, device_time, values))
+        return
+
+    def _fetch_samples(self):
+        if not self.is_buffered():
+            return super(TestFreqMeter, self)._fetch_samples()
+        samples = []
+        for channel in self._active_channels:
+            samples.extend(
+                    (channel, self._device_timestamp(channel, device_time),
+                     values)
+                    for device_time, values
+                    in self.__simulators[channel].fetch_buffer())
+        return True, samples
+
     def _fetch_freq(self):
         values = []
         for index in range(3):
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""Latency instrumentation of the stages of the fetch path"""
+# Standard libraries
+import array
+import itertools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+
+try:
+    monotonic_ns = time.monotonic_ns
+except AttributeError:
+    def monotonic_ns():
+        return int(time.monotonic() * 1e9)
+
+
+def rss_bytes():
+    """Return the resident memory of the process, in bytes."""
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Peak memory, where the current one is not available
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+class LatencyHistogram(object):
+    """
+    Log-linear histogram of latencies in nanoseconds, as HDR histograms.
+
+    Every power of two range is split in SUB_BUCKETS linear buckets, so
+    values are recorded with a relative error below 1/SUB_BUCKETS, from
+    nanoseconds to hours, in a fixed array of counters.
+    Recording is not synchronized: a histogram written from several
+    threads must be protected by their caller, as StageTracer does.
+    """
+    SUB_BITS = 4
+    SUB_BUCKETS = 1 << SUB_BITS
+    BUCKETS = (64 - SUB_BITS) * SUB_BUCKETS
+
+    def __init__(self):
+        self.__counts = array.array('q', [0]) * self.BUCKETS
+        self.reset()
+
+    def reset(self):
+        for index in range(self.BUCKETS):
+            self.__counts[index] = 0
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        return
+
+    @classmethod
+    def _index(cls, value):
+        if value < 2 * cls.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - cls.SUB_BITS - 1
+        return ((shift + 1) * cls.SUB_BUCKETS +
+                (value >> shift) - cls.SUB_BUCKETS)
+
+    @classmethod
+    def _lower_bound(cls, index):
+        if index < 2 * cls.SUB_BUCKETS:
+            return index
+        shift = index // cls.SUB_BUCKETS - 1
+        return (cls.SUB_BUCKETS + index % cls.SUB_BUCKETS) << shift
+
+    def record(self, value):
+        """Record a latency, in ns."""
+        value = max(0, value)
+        self.__counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        return
+
+    def percentile(self, percent):
+        """
+        Return the latency (ns) below which percent % of the values are,
+        as the upper bound of its bucket.
+        """
+        if not self.count:
+            return None
+        target = max(1, percent / 100 * self.count)
+        accumulated = 0
+        for index, count in enumerate(self.__counts):
+            accumulated += count
+            if accumulated >= target:
+                return min(self._lower_bound(index + 1) - 1, self.max)
+        return self.max
+
+    def get_cumulative_counts(self, bounds):
+        """
+        Return the number of values up to every bound (ns), for bounds in
+        increasing order. A bucket is counted up to a bound if its upper
+        bound is not above it.
+        """
+        counts = []
+        accumulated = 0
+        index = 0
+        for bound in bounds:
+            while (index < self.BUCKETS and
+                   self._lower_bound(index + 1) - 1 <= bound):
+                accumulated += self.__counts[index]
+                index += 1
+            counts.append(accumulated)
+        return counts
+
+    def get_summary(self):
+        """Return the count and the main statistics, in ns."""
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "min": self.min,
+            "mean": self.total / self.count,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "p999": self.percentile(99.9),
+            "max": self.max,
+        }
+
+
+class StageTracer(object):
+    """
+    Recorder of the duration of the stages of the fetch path.
+
+    Every stage is recorded with its source (the device name), start time
+    (monotonic ns), duration and thread, in a ring preallocated with
+    capacity events, and added to the latency histogram of its source and
+    stage. Recording is disabled by default; the hooks only check the
+    enabled flag then. Events are recorded under a lock, as they come
+    from the fetch threads, the stream readers and the GUI thread.
+    """
+    CAPACITY = 65536
+
+    def __init__(self, capacity=CAPACITY):
+        self.enabled = False
+        self.__capacity = capacity
+        self.__lock = threading.Lock()
+        # Names of the sources, stages and threads, and their ids
+        self.__sources = []
+        self.__stages = []
+        self.__threads = []
+        self.__source_ids = {}
+        self.__stage_ids = {}
+        self.__thread_ids = {}
+        # Ring of events, one array per field
+        self.__source = array.array('h', [0]) * capacity
+        self.__stage = array.array('h', [0]) * capacity
+        self.__thread = array.array('h', [0]) * capacity
+        self.__start = array.array('q', [0]) * capacity
+        self.__duration = array.array('q', [0]) * capacity
+        self.__counter = itertools.count()
+        self.__written = 0
+        self.__histograms = {}
+
+    def __get_id(self, names, ids, name):
+        try:
+            return ids[name]
+        except KeyError:
+            with self.__lock:
+                if name not in ids:
+                    names.append(name)
+                    ids[name] = len(names) - 1
+            return ids[name]
+
+    def record(self, source, stage, start, end=None):
+        """
+        Record a stage of a source that started at start (monotonic ns)
+        and ended at end, or now.
+        """
+        if end is None:
+            end = monotonic_ns()
+        source_id = self.__get_id(self.__sources, self.__source_ids, source)
+        stage_id = self.__get_id(self.__stages, self.__stage_ids, stage)
+        thread_id = self.__get_id(self.__threads, self.__thread_ids,
+                                  threading.get_ident())
+        with self.__lock:
+            index = next(self.__counter)
+            slot = index % self.__capacity
+            self.__source[slot] = source_id
+            self.__stage[slot] = stage_id
+            self.__thread[slot] = thread_id
+            self.__start[slot] = start
+            self.__duration[slot] = end - start
+            # Only complete events are counted as written
+            self.__written = index + 1
+            histogram = self.__histograms.get((source, stage))
+            if histogram is None:
+                histogram = self.__histograms[(source, stage)] = \
+                    LatencyHistogram()
+            histogram.record(end - start)
+        return
+
+    def clear(self):
+        """Forget the recorded events and histograms."""
+        with self.__lock:
+            self.__counter = itertools.count()
+            self.__written = 0
+            self.__histograms = {}
+        return
+
+    def get_events(self):
+        """
+        Return the events in the ring, oldest first, as (source, stage,
+        thread, start, duration) tuples.
+        """
+        written = self.__written
+        first = max(0, written - self.__capacity)
+        events = []
+        for index in range(first, written):
+            slot = index % self.__capacity
+            events.append((self.__sources[self.__source[slot]],
+                           self.__stages[self.__stage[slot]],
+                           self.__thread[slot],
+                           self.__start[slot],
+                           self.__duration[slot]))
+        return events
+
+    def get_histograms(self):
+        """Return the latency histograms, by (source, stage)."""
+        return dict(self.__histograms)
+
+    def get_summary(self):
+        """Return the latency statistics (ns) of every stage of every
+        source, as {source: {stage: statistics}}."""
+        summary = {}
+        for (source, stage), histogram in self.get_histograms().items():
+            summary.setdefault(source, {})[stage] = histogram.get_summary()
+        return summary
+
+    def export_chrome_trace(self, path):
+        """
+        Write the events in the Chrome trace event format, which can be
+        opened with chrome://tracing or Perfetto. Every source is shown
+        as a process and every thread as a thread of it.
+        """
+        trace = []
+        for source_id, source in enumerate(list(self.__sources)):
+            trace.append({"name": "process_name", "ph": "M",
+                          "pid": source_id, "args": {"name": str(source)}})
+        for source, stage, thread, start, duration in self.get_events():
+            trace.append({
+                "name": stage,
+                "cat": "fetch",
+                "ph": "X",
+                "pid": self.__source_ids[source],
+                "tid": thread,
+                "ts": start / 1000,
+                "dur": duration / 1000,
+            })
+        with open(path, "w") as openfile:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"},
+                      openfile)
+        return len(trace)
+
+
+# Tracer of the application
+tracer = StageTracer()
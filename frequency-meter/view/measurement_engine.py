@@ -1,8 +1,12 @@
 # Standard libraries
 import copy
 import logging
+import math
+import time
 # Third party libraries
 from PyQt5 import QtCore
+# Local libraries
+from view import instrumentation
 
 logger = logging.getLogger("view")
 
@@ -16,6 +20,9 @@ class MeasurementEngine(QtCore.QObject):
     "THREADED" to the initialization function. A threaded timer should
     be less affected by the main thread and should produce more periodic
     sampling.
+    With adaptive scheduling each instrument is fetched when a new sample
+    should be available, according to its gate time and fetch latency,
+    instead of every fetch_time.
     Inheritance from QObject to be able to use Qt signals.
     """
     # Signals (must be non-dynamic class members):
@@ -24,28 +31,44 @@ class MeasurementEngine(QtCore.QObject):
     # Signal to stop the timer inside the new thread
     _stopTimer = QtCore.pyqtSignal()
 
-    def __init__(self, threaded=False):
+    def __init__(self, threaded=False, adaptive=False):
         """
         threaded = "THREADED": launches the timer in different thread.
         threaded = any other value or nothing: launches timer in current thread.
+        adaptive = True: learn the fetch cadence of each instrument.
         """
         QtCore.QObject.__init__(self)
         self.__threaded = threaded
+        self.__adaptive = adaptive
         self.__thread = None
+        self.__devices = []
+        self.__measurement = None
 
-    def start(self, devices, fetch_time):
+    def start(self, devices, fetch_time, periods=None):
         """
         Start periodic measurements with the instruments specified
 
         instr_list: list with the instruments to do the measurements.
-        fetch_time: period in seconds to ask data to the instruments
-        sample_time: gate_time or time used by the instrument to calculate
-            one measurement, in seconds
+        fetch_time: period in seconds to ask data to the instruments. In
+            adaptive mode it is only used for instruments whose gate time
+            is unknown.
+        periods: optional dictionary with the fetch period of the
+            instruments that do not use fetch_time. In adaptive mode
+            only the periods set with FetchTime in the device file are
+            kept, the others are only used while the gate time is not
+            known. The fixed periods are anchored to the same start, so
+            instruments whose periods are multiples of each other are
+            fetched in the same ticks.
         """
-        self.__devices = devices
+        self.__devices = list(devices)
+        # Forget the previous timer, so it is not started again
+        if self.__measurement:
+            self._startTimer.disconnect(self.__measurement.start)
+            self._stopTimer.disconnect(self.__measurement.stop)
 
         # Create a measurement timer object
-        self.__measurement = MeasurementTimer(self.__devices, fetch_time)
+        self.__measurement = MeasurementTimer(self.__devices, fetch_time,
+                                              self.__adaptive, periods)
         # Create a signal/slot connection to start/stop the timer
         self._startTimer.connect(self.__measurement.start)
         self._stopTimer.connect(self.__measurement.stop)
@@ -59,7 +82,16 @@ class MeasurementEngine(QtCore.QObject):
         # Start the timer
         self._startTimer.emit()
 
-        logger.debug("Start sampling every {} seconds".format(fetch_time))
+        for schedule in self.__measurement.schedules:
+            if self.__adaptive and not schedule.adaptive:
+                logger.debug("{} fetched every {} seconds".format(
+                        schedule.device.get_name(), schedule.period))
+
+        if self.__adaptive:
+            logger.debug("Start sampling adaptively, every {} seconds the "
+                         "devices without gate time".format(fetch_time))
+        else:
+            logger.debug("Start sampling every {} seconds".format(fetch_time))
         return
 
     def stop(self):
@@ -77,39 +109,198 @@ class MeasurementEngine(QtCore.QObject):
             self.__thread = None
 
         logger.debug("Sampling finished")
+        for device in self.__devices:
+            logger.info("{}: {} samples at {:.3f} Hz, {} stale fetches "
+                        "dropped".format(device.get_name(),
+                                         device.get_sample_count(),
+                                         device.get_effective_rate(),
+                                         device.get_stale_count()))
+        return
+
+    def hands_over(self, device):
+        """
+        Return True if the device is configured and measured by another
+        process, so it must not be started in the application.
+        """
+        return False
+
+    def get_sample_rates(self):
+        """
+        Return the effective sample rate (Hz) of each device.
+
+        Stale readings, repeated because the fetch period is shorter than
+        the gate time, are not counted.
+        """
+        return {device.get_name(): device.get_effective_rate()
+                for device in self.__devices}
+
+    def get_schedules(self):
+        """Return the fetch schedule of each device in the session."""
+        if not self.__measurement:
+            return []
+        return self.__measurement.schedules
+
+
+class DeviceSchedule(object):
+    """
+    Fetch schedule of a single instrument.
+
+    In fixed mode the instrument is fetched every period seconds, on a
+    grid anchored to the session start. In adaptive mode the schedule
+    plans each fetch for the earliest moment a new sample can exist. It
+    keeps the time interval where the next gate end is expected, and
+    narrows it with the result of every fetch (new sample or stale
+    reading) as a binary search, until the fetches land just after the
+    gate end. The fetch latency is measured and compensated.
+    Buffered and streaming instruments keep the fixed grid, as every
+    fetch drains all their pending samples anyway, and so do the
+    instruments with a FetchTime in their device file, which asks for
+    that period.
+    """
+    # Weight of the last fetch in the latency moving average
+    LATENCY_WEIGHT = 0.1
+    # Resolution of the gate end search, as a fraction of the gate time
+    RESOLUTION = 0.02
+    # Measurements skipped at start, they can be wrong
+    SKIPPED_MEASUREMENTS = 2
+
+    def __init__(self, device, period, adaptive=False):
+        self.device = device
+        self.period = period
+        self.adaptive = self.is_adaptive(device, adaptive)
+        self.latency = None
+        # Distribution of the fetch latencies, in ns
+        self.latencies = instrumentation.LatencyHistogram()
+        # Distribution of the delays of the fetches from their due time
+        self.lateness = instrumentation.LatencyHistogram()
+        self.missed_ticks = 0
+        self.next_due = None
+        self.__epoch = None
+        self.__tick = 0
+        self.__fetches = 0
+        # Interval where the next gate end is expected (monotonic times)
+        self.__gate_end = None
+
+    @staticmethod
+    def is_adaptive(device, adaptive):
+        """Return True if the device is fetched with adaptive planning."""
+        return (adaptive and not device.is_buffered()
+                and not device.is_streaming()
+                and device.get_fetch_time(None) is None)
+
+    def start(self, epoch):
+        """Start the schedule at the given monotonic time."""
+        self.__epoch = epoch
+        self.__tick = 1
+        self.__fetches = 0
+        self.__gate_end = None
+        self.latencies.reset()
+        self.lateness.reset()
+        self.missed_ticks = 0
+        self.next_due = epoch + self.period
+        return
+
+    def get_gate_time(self):
+        return self.device.get_gate_time() or self.period
+
+    def fetch(self):
+        """Fetch the device and plan the next fetch."""
+        self.__fetches += 1
+        if self.__fetches <= self.SKIPPED_MEASUREMENTS:
+            self.__plan_fixed(time.monotonic())
+            return
+        stored = self.device.get_sample_count()
+        start = time.monotonic()
+        self.device.store_freq()
+        end = time.monotonic()
+        self.latencies.record(int((end - start) * 1e9))
+        if self.latency is None:
+            self.latency = end - start
+        else:
+            self.latency += self.LATENCY_WEIGHT * (end - start - self.latency)
+        if self.adaptive:
+            self.__plan_adaptive(start, end,
+                                 self.device.get_sample_count() > stored)
+        else:
+            self.__plan_fixed(end)
+        return
+
+    def __plan_fixed(self, now):
+        tick = math.floor((now - self.__epoch) / self.period) + 1
+        self.missed_ticks += max(0, tick - self.__tick - 1)
+        self.__tick = tick
+        self.next_due = self.__epoch + tick * self.period
+        return
+
+    def __plan_adaptive(self, start, end, new_sample):
+        gate_time = self.get_gate_time()
+        step = max(self.latency, self.RESOLUTION * gate_time)
+        # Time when the fetch reached the device
+        arrival = start + self.latency / 2
+        if self.__gate_end is None:
+            low, high = arrival - gate_time, arrival
+        else:
+            low, high = self.__gate_end
+        width = max(high - low, step)
+        if new_sample:
+            # The gate ended before the arrival
+            if arrival > high + gate_time:
+                self.missed_ticks += int((arrival - high) / gate_time)
+            low, high = max(low, arrival - gate_time), min(high, arrival)
+            if low >= high:
+                # Earlier than expected, widen the search
+                low, high = arrival - min(gate_time, 2 * width), arrival
+            # The next gate ends one gate time later
+            low, high = low + gate_time, high + gate_time
+        else:
+            # The gate was still open at the arrival
+            low = max(low, arrival)
+            if low >= high:
+                # Later than expected, widen the search
+                high = arrival + min(gate_time, 2 * width)
+        self.__gate_end = (low, high)
+        if high - low > step:
+            target = (low + high) / 2
+        else:
+            target = high + step / 2
+        self.next_due = max(target - self.latency / 2, end)
         return
 
 
 class MeasurementTimer(QtCore.QObject):
     """
-    Implements a timer that periodically asks a new sample from instruments.
+    Implements a timer that asks new samples from the instruments when
+    their schedules are due.
     Inherit from QObject to be able to use Qt signals
-    It contains the sampleReady signal that emits every time a new sample is
-    received from instruments
     """
-    # Signals (must be non-dynamic class members):
-    # Flags to the main thread that new samples from instruments are available
+    # Schedules due within this time (s) are fetched in the same tick
+    TOLERANCE = 0.001
 
-    def __init__(self, instr_list, fetch_time):
+    def __init__(self, instr_list, fetch_time, adaptive=False, periods=None):
         super(MeasurementTimer, self).__init__()
         self.instr_list = instr_list
         self.fetch_time = fetch_time
+        periods = periods or {}
+        self.schedules = [
+            DeviceSchedule(instrument, periods.get(instrument, fetch_time),
+                           adaptive)
+            for instrument in instr_list]
         self.__timer = None
-        self.__measurement_counter = 0
         return
 
     def start(self):
         """
         Initialize and starts the measurement timer
         """
-        # Init measurement counter, skip first 2 measurements, they can be wrong
-        self.__measurement_counter = -2
-
-        # Create the timer to fetch measurements periodically
+        # Create a single shot timer, rearmed for the next due schedule
         self.__timer = QtCore.QTimer()
         self.__timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self.__timer.setSingleShot(True)
         self.__timer.timeout.connect(self.__measure)
-        self.__timer.start(self.fetch_time * 1000)
+        epoch = time.monotonic()
+        for schedule in self.schedules:
+            schedule.start(epoch)
+        self.__schedule_next()
         return
 
     def stop(self):
@@ -119,18 +310,26 @@ class MeasurementTimer(QtCore.QObject):
         if self.__timer:
             self.__timer.stop()
             self.__timer = None
-        self.__measurement_counter = 0
+        return
+
+    def __schedule_next(self):
+        if not self.__timer or not self.schedules:
+            return
+        due = min(schedule.next_due for schedule in self.schedules)
+        delay = max(0.0, due - time.monotonic())
+        self.__timer.start(int(round(delay * 1000)))
         return
 
     def __measure(self):
         """
         Function executed when the timer event rises.
-        It asks a new sample to each instrument and sends them back to
-        using a signal.
-        """
-        self.__measurement_counter += 1
-        if self.__measurement_counter > 0:
-            # Store new frequency values for each instrument
-            for instrument in self.instr_list:
-                instrument.store_freq()
+        It asks a new sample to each instrument whose schedule is due.
+        """
+        now = time.monotonic()
+        for schedule in self.schedules:
+            if schedule.next_due <= now + self.TOLERANCE:
+                schedule.lateness.record(
+                        int(max(0.0, now - schedule.next_due) * 1e9))
+                schedule.fetch()
+        self.__schedule_next()
         return
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""HTTP endpoint serving the acquisition metrics in Prometheus format"""
+# Standard libraries
+from collections import OrderedDict
+import http.server
+import logging
+import socketserver
+import threading
+# Local libraries
+from view import instrumentation
+
+logger = logging.getLogger("view")
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = []
+    for name, value in sorted(labels.items()):
+        value = str(value).replace("\\", "\\\\").replace(
+                "\"", "\\\"").replace("\n", "\\n")
+        escaped.append("{}=\"{}\"".format(name, value))
+    return "{{{}}}".format(",".join(escaped))
+
+
+class MetricsWriter(object):
+    """
+    Builder of a Prometheus text format exposition.
+
+    The samples are grouped by metric, as the format requires, whatever
+    the order they are written in.
+    """
+    def __init__(self):
+        self.__metrics = OrderedDict()
+
+    def declare(self, name, metric_type, help_text):
+        if name not in self.__metrics:
+            self.__metrics[name] = [
+                "# HELP {} {}".format(name, help_text),
+                "# TYPE {} {}".format(name, metric_type)]
+        return
+
+    def sample(self, name, value, labels=None, metric=None):
+        """Write a sample of a declared metric (name by default)."""
+        self.__metrics[metric or name].append("{}{} {}".format(
+                name, format_labels(labels), repr(float(value))))
+        return
+
+    def histogram(self, name, histogram, bounds, labels=None):
+        """Write a LatencyHistogram (ns) as a histogram in seconds."""
+        labels = labels or {}
+        counts = histogram.get_cumulative_counts(
+                [int(bound * 1e9) for bound in bounds])
+        for bound, count in zip(bounds, counts):
+            self.sample(name + "_bucket", count,
+                        dict(labels, le=repr(float(bound))), name)
+        self.sample(name + "_bucket", histogram.count,
+                    dict(labels, le="+Inf"), name)
+        self.sample(name + "_sum", histogram.total / 1e9, labels, name)
+        self.sample(name + "_count", histogram.count, labels, name)
+        return
+
+    def get_text(self):
+        lines = []
+        for metric_lines in self.__metrics.values():
+            lines.extend(metric_lines)
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """
+    HTTP server of the acquisition metrics, in a background thread.
+
+    The metrics are built when they are scraped, from the counters the
+    measurement engine and the devices already keep, so serving them
+    adds no work to the sampling.
+    """
+    daemon_threads = True
+    # Upper bounds (s) of the latency histogram buckets
+    BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+               0.05, 0.1, 0.25, 0.5, 1.0, 2.5]
+
+    def __init__(self, address, engine, log_handler=None, publisher=None):
+        http.server.HTTPServer.__init__(self, address, MetricsHandler)
+        self.engine = engine
+        self.log_handler = log_handler
+        self.publisher = publisher
+        self.__thread = None
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.serve_forever,
+                                         daemon=True)
+        self.__thread.start()
+        logger.info("Serving metrics on http://{}:{}/metrics".format(
+                *self.server_address[:2]))
+        return self.__thread
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        return
+
+    def get_metrics(self):
+        """Return the metrics in the Prometheus text format."""
+        writer = MetricsWriter()
+        for schedule in self.engine.get_schedules():
+            device = schedule.device
+            labels = {"device": device.get_name()}
+            writer.declare("freqmeter_samples_total", "counter",
+                           "Samples stored.")
+            writer.sample("freqmeter_samples_total",
+                          device.get_sample_count(), labels)
+            writer.declare("freqmeter_stale_fetches_total", "counter",
+                           "Fetches dropped because they had no new sample.")
+            writer.sample("freqmeter_stale_fetches_total",
+                          device.get_stale_count(), labels)
+            writer.declare("freqmeter_sample_rate_hz", "gauge",
+                           "Effective sample rate.")
+            writer.sample("freqmeter_sample_rate_hz",
+                          device.get_effective_rate(), labels)
+            writer.declare("freqmeter_fetch_period_seconds", "gauge",
+                           "Configured fetch period.")
+            writer.sample("freqmeter_fetch_period_seconds", schedule.period,
+                          labels)
+            writer.declare("freqmeter_fetch_latency_seconds", "histogram",
+                           "Duration of the fetches.")
+            writer.histogram("freqmeter_fetch_latency_seconds",
+                             schedule.latencies, self.BUCKETS, labels)
+            writer.declare("freqmeter_tick_lateness_seconds", "histogram",
+                           "Delay of the fetches from their due time.")
+            writer.histogram("freqmeter_tick_lateness_seconds",
+                             schedule.lateness, self.BUCKETS, labels)
+            writer.declare("freqmeter_missed_ticks_total", "counter",
+                           "Fetch ticks skipped because of late fetches.")
+            writer.sample("freqmeter_missed_ticks_total",
+                          schedule.missed_ticks, labels)
+            writer.declare("freqmeter_reconnects_total", "counter",
+                           "Reconnections to the device.")
+            writer.sample("freqmeter_reconnects_total",
+                          device.get_reconnect_count(), labels)
+            writer.declare("freqmeter_store_bytes", "gauge",
+                           "Memory taken by the stored samples.")
+            writer.sample("freqmeter_store_bytes",
+                          sum(series.get_memory_size() for series
+                              in device.get_measurement_data()), labels)
+            writer.declare("freqmeter_pending_samples", "gauge",
+                           "Streamed samples waiting to be stored.")
+            writer.sample("freqmeter_pending_samples",
+                          device.get_pending_count(), labels)
+        if self.log_handler is not None:
+            writer.declare("freqmeter_log_queue_depth", "gauge",
+                           "Log messages waiting to be shown.")
+            writer.sample("freqmeter_log_queue_depth",
+                          self.log_handler.get_pending_count())
+        if self.publisher is not None:
+            writer.declare("freqmeter_publisher_subscribers", "gauge",
+                           "Subscribers of the live samples.")
+            writer.sample("freqmeter_publisher_subscribers",
+                          len(self.publisher.get_subscribers()))
+            writer.declare("freqmeter_publisher_backlog", "gauge",
+                           "Samples waiting to be sent to the subscribers.")
+            writer.sample("freqmeter_publisher_backlog",
+                          self.publisher.get_backlog())
+            writer.declare("freqmeter_publisher_dropped", "gauge",
+                           "Samples dropped for the current subscribers.")
+            writer.sample("freqmeter_publisher_dropped",
+                          self.publisher.get_dropped_count())
+        writer.declare("process_resident_memory_bytes", "gauge",
+                       "Resident memory size in bytes.")
+        writer.sample("process_resident_memory_bytes",
+                      instrumentation.rss_bytes())
+        return writer.get_text()
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.get_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", self.CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return
+
+    def log_message(self, format, *args):
+        logger.debug("Metrics request from {}: {}".format(
+                self.address_string(), format % args))
+        return
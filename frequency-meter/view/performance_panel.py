@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Performance panel of the main window"""
+# Third party libraries
+from PyQt5 import QtCore, QtWidgets
+
+
+class PerformancePanel(QtWidgets.QDockWidget):
+    """
+    Dock panel with the acquisition performance of every device.
+
+    It shows the counters the measurement engine already keeps: the
+    achieved sample rate against the expected one, the fetch latency
+    percentiles, the missed ticks and the reconnections of every device,
+    together with the plot frame time, the log queue depth and the
+    memory of the process. It is refreshed by the plot timer.
+    """
+    COLUMNS = ["Device", "Fetch period (ms)", "Rate (Hz)", "Expected (Hz)",
+               "Latency p50 (ms)", "Latency p99 (ms)", "Missed ticks",
+               "Reconnects"]
+
+    def __init__(self, parent=None):
+        QtWidgets.QDockWidget.__init__(self, "Performance", parent)
+        self.setObjectName("performance")
+        widget = QtWidgets.QWidget(self)
+        layout = QtWidgets.QVBoxLayout(widget)
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.table = QtWidgets.QTableWidget(0, len(self.COLUMNS), widget)
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(
+                QtWidgets.QHeaderView.ResizeToContents)
+        layout.addWidget(self.table)
+        self.status = QtWidgets.QLabel(widget)
+        layout.addWidget(self.status)
+        self.setWidget(widget)
+
+    @staticmethod
+    def get_expected_rate(schedule):
+        """Return the sample rate (Hz) a device should achieve."""
+        device = schedule.device
+        channels = max(1, len(device.get_active_channels()))
+        gate_time = device.get_gate_time() or schedule.period
+        if device.is_buffered() or device.is_streaming() or schedule.adaptive:
+            return channels / gate_time
+        return channels / max(gate_time, schedule.period)
+
+    def update_stats(self, schedules, frame_time, log_queue, rss):
+        """
+        Show the counters of the device schedules of the engine, the last
+        plot frame time (s), the log queue depth and the RSS (bytes).
+        """
+        if not self.isVisible():
+            return
+        self.table.setRowCount(len(schedules))
+        for row, schedule in enumerate(schedules):
+            device = schedule.device
+            p50 = schedule.latencies.percentile(50)
+            p99 = schedule.latencies.percentile(99)
+            values = [
+                device.get_name(),
+                "{:.1f}".format(schedule.period * 1000),
+                "{:.2f}".format(device.get_effective_rate()),
+                "{:.2f}".format(self.get_expected_rate(schedule)),
+                "{:.2f}".format(p50 / 1e6) if p50 is not None else "-",
+                "{:.2f}".format(p99 / 1e6) if p99 is not None else "-",
+                str(schedule.missed_ticks),
+                str(device.get_reconnect_count()),
+            ]
+            for column, value in enumerate(values):
+                item = self.table.item(row, column)
+                if item is None:
+                    item = QtWidgets.QTableWidgetItem()
+                    if column:
+                        item.setTextAlignment(QtCore.Qt.AlignRight |
+                                              QtCore.Qt.AlignVCenter)
+                    self.table.setItem(row, column, item)
+                item.setText(value)
+        self.status.setText(
+                "Plot frame: {:.1f} ms    Log queue: {}    RSS: {:.1f} MB"
+                "".format(frame_time * 1000, log_queue, rss / 2**20))
+        return
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Rendering of the measurement plot out of the GUI thread"""
+# Standard libraries
+import time
+# Third party libraries
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+
+def setup_figure(figure):
+    """Place the axes of the measurement plot in a figure. Return them."""
+    ax = figure.add_subplot(111)
+    figure.subplots_adjust(top=0.9, bottom=0.13, left=0.13, right=0.95)
+    return ax
+
+
+def draw_plot(ax, lines, xlim=None):
+    """
+    Draw the measurement plot on the axes.
+
+    lines is a list of (label, times, values) with the times (s) and
+    values of every plotted signal, and xlim the limits of the x axis, or
+    None to fit the data.
+    """
+    ax.cla()
+    ax.grid()
+    ax.set_ylabel("F(Hz)", rotation='horizontal')
+    ax.yaxis.set_label_coords(-0.01, 1.04)
+    ax.set_xlabel("Time (s)")
+    # Remove exponential notation in y axis
+    ax.get_yaxis().get_major_formatter().set_useOffset(False)
+    for label, times, values in lines:
+        ax.plot(times, values, label=label)
+    if xlim is not None:
+        ax.set_xlim(*xlim)
+    # Print legends in the plot
+    ax.legend(bbox_to_anchor=(0., 1.02, 1., 0.102), loc=0, ncol=3,
+              mode="expand", borderaxespad=0., fontsize='xx-small')
+    return
+
+
+class PlotRenderer(QtCore.QObject):
+    """
+    Rasterizer of the measurement plot, to be moved to a thread of its
+    own.
+
+    It draws in a figure of its own with the Agg backend, which does not
+    need the GUI thread, and sends every frame as a QImage with the time
+    taken to render it.
+    """
+    frame_ready = QtCore.pyqtSignal(QtGui.QImage, float)
+
+    def __init__(self):
+        QtCore.QObject.__init__(self)
+        self.__figure = None
+        self.__canvas = None
+        self.__ax = None
+
+    @QtCore.pyqtSlot(object, int, int, float)
+    def render(self, frame, width, height, dpi):
+        """
+        Render a frame, a (lines, xlim) tuple as taken by draw_plot, in
+        an image of width x height pixels.
+        """
+        start = time.perf_counter()
+        if self.__figure is None:
+            # Third party libraries
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            from matplotlib.figure import Figure
+
+            self.__figure = Figure()
+            self.__canvas = FigureCanvasAgg(self.__figure)
+            self.__ax = setup_figure(self.__figure)
+        self.__figure.set_dpi(dpi)
+        self.__figure.set_size_inches(width / dpi, height / dpi)
+        draw_plot(self.__ax, *frame)
+        self.__canvas.draw()
+        # Third party libraries
+        import numpy
+
+        buffer = numpy.asarray(self.__canvas.buffer_rgba())
+        image = QtGui.QImage(buffer, buffer.shape[1], buffer.shape[0],
+                             QtGui.QImage.Format_RGBA8888).copy()
+        self.frame_ready.emit(image, time.perf_counter() - start)
+        return
+
+
+class PlotImage(QtWidgets.QWidget):
+    """Widget showing the last frame of the plot renderer."""
+    def __init__(self, parent=None):
+        QtWidgets.QWidget.__init__(self, parent)
+        self.setSizePolicy(QtWidgets.QSizePolicy.Expanding,
+                           QtWidgets.QSizePolicy.Expanding)
+        self.__image = None
+
+    def set_image(self, image):
+        self.__image = image
+        self.update()
+        return
+
+    def get_render_size(self):
+        """Return the size, in pixels of the device, of the frames."""
+        ratio = self.devicePixelRatioF()
+        return (max(1, int(self.width() * ratio)),
+                max(1, int(self.height() * ratio)), ratio)
+
+    def paintEvent(self, event):
+        if self.__image is None:
+            return
+        painter = QtGui.QPainter(self)
+        # Frames rendered before a resize are stretched until the next one
+        painter.drawImage(self.rect(), self.__image)
+        painter.end()
+        return
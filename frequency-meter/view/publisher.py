@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Publisher of the live samples to external consumers over TCP or Unix
+sockets.
+
+Every subscriber receives every new sample, encoded as:
+- json: one JSON object per line, with the device name, the channel
+  (starting at 1), the timestamp (ns since the epoch) and the values.
+- binary: little endian frames of a uint32 length of the rest of the
+  frame, a uint16 length and the UTF-8 device name, a uint8 channel
+  (starting at 1), an int64 timestamp (ns since the epoch), a uint8
+  number of values and the values as float64.
+"""
+# Standard libraries
+import collections
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+import threading
+
+logger = logging.getLogger("view")
+
+ENCODINGS = ["json", "binary"]
+# What is done with a new sample when the queue of a subscriber is full
+DROP_POLICIES = ["oldest", "newest", "disconnect"]
+
+
+def encode_json(device, channel, timestamp, values):
+    return (json.dumps({"device": device, "channel": channel + 1,
+                        "timestamp": timestamp, "values": list(values)},
+                       separators=(",", ":")) + "\n").encode()
+
+
+def encode_binary(device, channel, timestamp, values):
+    name = device.encode()
+    body = (struct.pack("<H", len(name)) + name +
+            struct.pack("<BqB", channel + 1, timestamp, len(values)) +
+            struct.pack("<{}d".format(len(values)), *values))
+    return struct.pack("<I", len(body)) + body
+
+
+def decode_binary(frame):
+    """
+    Decode the body of a binary frame, without its length. Return the
+    device name, channel (starting at 1), timestamp and values.
+    """
+    name_length, = struct.unpack_from("<H", frame)
+    device = frame[2:2+name_length].decode()
+    channel, timestamp, count = struct.unpack_from("<BqB", frame,
+                                                   2 + name_length)
+    values = struct.unpack_from("<{}d".format(count), frame,
+                                2 + name_length + 10)
+    return device, channel, timestamp, list(values)
+
+
+class Subscriber(object):
+    """
+    Bounded queue of the frames waiting to be sent to a subscriber.
+
+    offer never blocks: when the queue is full the oldest frame or the
+    new one is dropped, or the subscriber is disconnected, following the
+    drop policy.
+    """
+    def __init__(self, address, queue_size, drop_policy):
+        self.address = address
+        self.dropped = 0
+        self.closed = False
+        self.__queue_size = queue_size
+        self.__drop_policy = drop_policy
+        self.__frames = collections.deque()
+        self.__ready = threading.Condition()
+
+    def offer(self, frame):
+        with self.__ready:
+            if self.closed:
+                return
+            if len(self.__frames) >= self.__queue_size:
+                self.dropped += 1
+                if self.__drop_policy == "newest":
+                    return
+                elif self.__drop_policy == "disconnect":
+                    self.closed = True
+                    self.__ready.notify()
+                    return
+                self.__frames.popleft()
+            self.__frames.append(frame)
+            self.__ready.notify()
+        return
+
+    def get_pending_count(self):
+        return len(self.__frames)
+
+    def take(self, timeout=None):
+        """Return all the queued frames, waiting for one if none is."""
+        with self.__ready:
+            if not self.__frames and not self.closed:
+                self.__ready.wait(timeout)
+            frames = list(self.__frames)
+            self.__frames.clear()
+        return frames
+
+    def close(self):
+        with self.__ready:
+            self.closed = True
+            self.__ready.notify()
+        return
+
+
+class SubscriberHandler(socketserver.BaseRequestHandler):
+    """
+    Send the published frames to a connected subscriber.
+
+    A subscriber that does not read for SEND_TIMEOUT seconds is
+    disconnected, as a frame may have been sent only in part.
+    """
+    SEND_TIMEOUT = 5.0
+
+    def handle(self):
+        publisher = self.server.publisher
+        subscriber = publisher.subscribe(self.client_address)
+        self.request.settimeout(self.SEND_TIMEOUT)
+        try:
+            while not subscriber.closed:
+                frames = subscriber.take(timeout=0.5)
+                if frames:
+                    self.request.sendall(b"".join(frames))
+        except socket.timeout:
+            logger.warning("Subscriber {} stalled, disconnecting it".format(
+                    subscriber.address))
+        except OSError:
+            pass
+        finally:
+            publisher.unsubscribe(subscriber)
+        return
+
+
+class TCPPublisherServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class UnixPublisherServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+else:
+    UnixPublisherServer = None
+
+
+class SamplePublisher(object):
+    """
+    Publisher of the new samples to any number of subscribers.
+
+    address is a (host, port) tuple for TCP, or a path for a Unix socket.
+    publish is called by the acquisition with every stored sample: it
+    encodes the sample once and offers it to the queue of every
+    subscriber, so a slow subscriber never stalls the acquisition.
+    """
+    def __init__(self, address, encoding="json", queue_size=1000,
+                 drop_policy="oldest"):
+        if encoding not in ENCODINGS:
+            raise ValueError("Unknown encoding {}".format(encoding))
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError("Unknown drop policy {}".format(drop_policy))
+        self.__address = address
+        self.__encode = encode_json if encoding == "json" else encode_binary
+        self.__queue_size = queue_size
+        self.__drop_policy = drop_policy
+        self.__subscribers = []
+        self.__lock = threading.Lock()
+        self.__server = None
+
+    def start(self):
+        """Accept subscribers in a background thread."""
+        if isinstance(self.__address, str):
+            if UnixPublisherServer is None:
+                raise ValueError("Unix sockets are not supported")
+            if os.path.exists(self.__address):
+                os.remove(self.__address)
+            self.__server = UnixPublisherServer(self.__address,
+                                                SubscriberHandler)
+        else:
+            self.__server = TCPPublisherServer(self.__address,
+                                               SubscriberHandler)
+        self.__server.publisher = self
+        thread = threading.Thread(target=self.__server.serve_forever,
+                                  daemon=True)
+        thread.start()
+        logger.info("Publishing samples on {}".format(
+                self.get_address()))
+        return thread
+
+    def stop(self):
+        if not self.__server:
+            return
+        self.__server.shutdown()
+        self.__server.server_close()
+        for subscriber in self.get_subscribers():
+            subscriber.close()
+        if isinstance(self.__address, str) and os.path.exists(self.__address):
+            os.remove(self.__address)
+        self.__server = None
+        return
+
+    def get_address(self):
+        """Return the address the publisher listens on."""
+        if self.__server:
+            return self.__server.server_address
+        return self.__address
+
+    def subscribe(self, address):
+        subscriber = Subscriber(address, self.__queue_size,
+                                self.__drop_policy)
+        with self.__lock:
+            self.__subscribers = self.__subscribers + [subscriber]
+        logger.info("New subscriber {}".format(address))
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        subscriber.close()
+        with self.__lock:
+            self.__subscribers = [s for s in self.__subscribers
+                                  if s is not subscriber]
+        logger.info("Subscriber {} left, {} samples dropped".format(
+                subscriber.address, subscriber.dropped))
+        return
+
+    def get_subscribers(self):
+        return self.__subscribers
+
+    def get_backlog(self):
+        """Return the samples waiting to be sent to the subscribers."""
+        return sum(subscriber.get_pending_count()
+                   for subscriber in self.__subscribers)
+
+    def get_dropped_count(self):
+        """Return the samples dropped for the current subscribers."""
+        return sum(subscriber.dropped for subscriber in self.__subscribers)
+
+    def publish(self, device, channel, timestamp, values):
+        """Offer a new sample to every subscriber."""
+        subscribers = self.__subscribers
+        if not subscribers:
+            return
+        frame = self.__encode(device, channel, timestamp, values)
+        for subscriber in subscribers:
+            subscriber.offer(frame)
+        return
@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+"""
+Remote acquisition: agents measuring the devices of their host, and an
+aggregator receiving their samples in the application.
+
+An AcquisitionAgent runs the measurement engine next to its instruments,
+without user interface, and forwards the stored samples in batches over
+TCP to the Aggregator. Every message is a line of JSON:
+- hello, sent on every connection: the agent name and its devices, with
+  their channels, signals and gate time.
+- batch: the samples of a device channel (starting at 1), as a column of
+  timestamps (ns since the epoch, clock of the agent host) and a column
+  of values per signal.
+The aggregator shows the devices of every agent as RemoteFreqMeter
+devices, named agent/device, which store the received samples as
+streaming devices do. The clocks of the hosts must be synchronized (NTP
+or PTP) for comparing their timestamps.
+"""
+# Standard libraries
+import collections
+import itertools
+import json
+import logging
+import socket
+import socketserver
+import threading
+# Local libraries
+from view import clientprotocol
+from view import freqmeterdevice
+
+logger = logging.getLogger("view")
+
+
+def encode_message(message):
+    return (json.dumps(message, separators=(",", ":")) + "\n").encode()
+
+
+def parse_address(address, default_host="127.0.0.1"):
+    """Return the (host, port) of a HOST:PORT or :PORT address."""
+    host, _, port = address.rpartition(":")
+    return host or default_host, int(port)
+
+
+class AcquisitionAgent(object):
+    """
+    Headless acquisition of the devices of a host, forwarded to an
+    aggregator.
+
+    The samples are queued by the measurement engine and sent in batches
+    by a background thread every batch_interval seconds, so the network
+    never delays the sampling. While the aggregator is unreachable the
+    agent keeps measuring and queues up to backlog samples, dropping the
+    oldest ones, and connects again every RETRY_TIME seconds. Samples
+    sent again after a broken connection are dropped as stale by the
+    aggregator.
+    """
+    # Time (s) between the connection attempts to the aggregator
+    RETRY_TIME = 1.0
+    TIMEOUT = 5.0
+
+    def __init__(self, name, address, engine, batch_interval=0.1,
+                 backlog=100000):
+        """
+        name: agent name, prefix of its devices in the aggregator.
+        address: (host, port) of the aggregator.
+        engine: MeasurementEngine used for sampling the devices.
+        """
+        self.__name = name
+        self.__address = address
+        self.__engine = engine
+        self.__batch_interval = batch_interval
+        self.__backlog = backlog
+        self.__devices = []
+        self.__pending = collections.deque()
+        self.__dropped = 0
+        self.__lock = threading.Lock()
+        self.__stopping = threading.Event()
+        self.__sender = None
+
+    def get_name(self):
+        return self.__name
+
+    def get_dropped_count(self):
+        """Return the samples dropped while the aggregator was away."""
+        return self.__dropped
+
+    def get_pending_count(self):
+        return len(self.__pending)
+
+    def start(self, devices, fetch_time, sample_time, channels=None,
+              impedance=None):
+        """
+        Start measuring the connected devices and forwarding the samples.
+
+        channels: list of the channels measured in every device, the
+            first channel by default.
+        impedance: input impedance, the first of every device by default.
+        """
+        self.__devices = list(devices)
+        for device in self.__devices:
+            device.start_measurement(
+                    device.get_sample_time(sample_time),
+                    channels or [0],
+                    impedance or device.get_impedances()[0])
+            device.add_sample_listener(self.__on_sample)
+        periods = {device: device.get_fetch_time(fetch_time)
+                   for device in self.__devices}
+        self.__engine.start(self.__devices, fetch_time, periods)
+        self.__stopping.clear()
+        self.__sender = threading.Thread(target=self.__send_batches,
+                                         name="agent-sender", daemon=True)
+        self.__sender.start()
+        logger.info("Agent {} forwarding {} devices to {}:{}".format(
+                self.__name, len(self.__devices), *self.__address))
+        return
+
+    def stop(self):
+        """Stop measuring, and send the queued samples."""
+        self.__engine.stop()
+        for device in self.__devices:
+            device.stop_measurement()
+            device.remove_sample_listener(self.__on_sample)
+        self.__stopping.set()
+        if self.__sender:
+            self.__sender.join()
+            self.__sender = None
+        logger.info("Agent {} stopped, {} samples dropped, {} not sent"
+                    "".format(self.__name, self.__dropped,
+                              len(self.__pending)))
+        return
+
+    def __on_sample(self, device, channel, timestamp, values):
+        with self.__lock:
+            if len(self.__pending) >= self.__backlog:
+                self.__pending.popleft()
+                self.__dropped += 1
+            self.__pending.append((device, channel, timestamp, values))
+        return
+
+    def __get_hello(self):
+        return {
+            "type": "hello",
+            "agent": self.__name,
+            "devices": [{
+                "name": device.get_name(),
+                "vendor": device.get_vendor_name(),
+                "channels": device.get_channels(),
+                "signals": list(device.get_signals()),
+                "impedances": list(device.get_impedances()),
+                "gate_time": device.get_gate_time(),
+            } for device in self.__devices],
+        }
+
+    def __take_samples(self):
+        with self.__lock:
+            samples = list(self.__pending)
+            self.__pending.clear()
+        return samples
+
+    def __restore_samples(self, samples):
+        """Queue again samples that could not be sent, before new ones."""
+        with self.__lock:
+            samples.extend(self.__pending)
+            dropped = max(0, len(samples) - self.__backlog)
+            self.__pending = collections.deque(samples[dropped:])
+            self.__dropped += dropped
+        return
+
+    @staticmethod
+    def get_batches(samples):
+        """Group samples by device channel, as batch messages."""
+        batches = collections.OrderedDict()
+        for device, channel, timestamp, values in samples:
+            batch = batches.get((device, channel))
+            if batch is None:
+                batch = batches[(device, channel)] = {
+                    "type": "batch", "device": device, "channel": channel + 1,
+                    "timestamps": [],
+                    "values": [[] for _ in values]}
+            batch["timestamps"].append(timestamp)
+            for column, value in zip(batch["values"], values):
+                column.append(value)
+        return list(batches.values())
+
+    def __send_batches(self):
+        while True:
+            try:
+                connection = socket.create_connection(self.__address,
+                                                      self.TIMEOUT)
+            except OSError as error:
+                if self.__stopping.wait(self.RETRY_TIME):
+                    return
+                logger.debug("Aggregator not reachable: {}".format(error))
+                continue
+            logger.info("Agent {} connected to the aggregator".format(
+                    self.__name))
+            samples = []
+            try:
+                connection.sendall(encode_message(self.__get_hello()))
+                while True:
+                    stopping = self.__stopping.wait(self.__batch_interval)
+                    samples = self.__take_samples()
+                    if samples:
+                        connection.sendall(b"".join(
+                                encode_message(batch)
+                                for batch in self.get_batches(samples)))
+                        samples = []
+                    if stopping:
+                        return
+            except OSError as error:
+                logger.warning("Connection to the aggregator lost: {}".format(
+                        error))
+                self.__restore_samples(samples)
+            finally:
+                connection.close()
+
+
+class RemoteClient(clientprotocol.Client):
+    """
+    Client of a remote device: the link of its agent with the aggregator.
+
+    Commands are not forwarded, as the agent configures the device; they
+    succeed while the agent is connected.
+    """
+    def __init__(self):
+        self.online = False
+
+    def connect(self):
+        return self.online
+
+    def disconnect(self):
+        return True
+
+    def write(self, command):
+        return self.online
+
+    def read(self):
+        return self.online, ""
+
+
+class RemoteFreqMeter(freqmeterdevice.FreqMeter):
+    """
+    Device measured by an agent, whose samples are received by the
+    aggregator. It is stored and plotted as a streaming device.
+
+    The channels, signals and impedances depend on the device of the
+    agent, so every remote device is an instance of a subclass made by
+    create for its description.
+    """
+    configurable = False
+    # Description of the device sent by the agent
+    description = {"channels": 0, "signals": [], "impedances": []}
+
+    @classmethod
+    def create(cls, name, description):
+        """Return a remote device of a new class for the description."""
+        device_class = type(cls.__name__, (cls,),
+                            {"description": description})
+        return device_class(name)
+
+    @classmethod
+    def get_vendor_name(cls):
+        return "Remote"
+
+    @classmethod
+    def get_channels(cls):
+        return cls.description["channels"]
+
+    @classmethod
+    def get_signals(cls):
+        return cls.description["signals"]
+
+    @classmethod
+    def get_protocols(cls):
+        return ["Remote"]
+
+    @classmethod
+    def get_impedances(cls):
+        return cls.description.get("impedances", [])
+
+    def __init__(self, name):
+        self.__client = RemoteClient()
+        self.__receiving = False
+        super(RemoteFreqMeter, self).__init__(None, {
+            "general": {"Name": name, "Vendor": "Remote"},
+            "communications": {"Protocol": "Remote", "Properties": {}},
+            "acquisition": {"Mode": "stream"},
+        })
+
+    def _create_client(self):
+        return self.__client
+
+    def set_online(self, online):
+        """Set if the agent of the device is connected."""
+        self.__client.online = online
+        return
+
+    def is_online(self):
+        return self.__client.online
+
+    def get_description(self):
+        return self.description
+
+    def start_measurement(self, sample_time, channels, impedance):
+        super(RemoteFreqMeter, self).start_measurement(sample_time, channels,
+                                                       impedance)
+        # The agent measures with its own gate time
+        self._gate_time = self.description.get("gate_time") or sample_time
+        self._pending_samples.clear()
+        self.__receiving = True
+        return
+
+    def stop_measurement(self):
+        self.__receiving = False
+        return
+
+    def receive_batch(self, channel, timestamps, columns):
+        """Queue the samples of a batch, until the next fetch stores them."""
+        if not self.__receiving or channel not in self._active_channels:
+            return
+        self._pending_samples.extend(zip(
+                itertools.repeat(channel), timestamps,
+                (list(values) for values in zip(*columns))))
+        return
+
+    def _fetch_freq(self):
+        return False, ""
+
+
+class AgentHandler(socketserver.StreamRequestHandler):
+    """Receive the messages of a connected agent."""
+    def handle(self):
+        aggregator = self.server.aggregator
+        # Devices of the agent, by their name in the agent
+        devices = {}
+        try:
+            for line in self.rfile:
+                message = json.loads(line.decode("utf-8"))
+                if message["type"] == "hello":
+                    aggregator.unregister(devices.values())
+                    devices = aggregator.register(message,
+                                                  self.client_address)
+                elif message["type"] == "batch":
+                    device = devices.get(message["device"])
+                    if device is not None:
+                        device.receive_batch(message["channel"] - 1,
+                                             message["timestamps"],
+                                             message["values"])
+        except (OSError, ValueError, KeyError) as error:
+            logger.warning("Bad connection from agent {}: {}".format(
+                    self.client_address, error))
+        finally:
+            aggregator.unregister(devices.values())
+        return
+
+
+class AggregatorServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class Aggregator(object):
+    """
+    Receiver of the samples of the acquisition agents.
+
+    The devices announced by the agents are kept while the application
+    runs, so a device connected in the application keeps its data when
+    its agent connects again. listeners are called, from the receiving
+    thread, when the devices or their state change.
+    """
+    def __init__(self, address):
+        self.__address = address
+        self.__devices = collections.OrderedDict()
+        self.__lock = threading.Lock()
+        self.__listeners = []
+        self.__server = None
+
+    def start(self):
+        """Accept agents in a background thread."""
+        self.__server = AggregatorServer(self.__address, AgentHandler)
+        self.__server.aggregator = self
+        thread = threading.Thread(target=self.__server.serve_forever,
+                                  daemon=True)
+        thread.start()
+        logger.info("Waiting for acquisition agents on {}:{}".format(
+                *self.get_address()))
+        return thread
+
+    def stop(self):
+        if not self.__server:
+            return
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__server = None
+        return
+
+    def get_address(self):
+        """Return the address the aggregator listens on."""
+        if self.__server:
+            return self.__server.server_address
+        return self.__address
+
+    def add_listener(self, listener):
+        self.__listeners.append(listener)
+        return
+
+    def get_device_names(self):
+        with self.__lock:
+            return list(self.__devices.keys())
+
+    def get_device(self, name):
+        with self.__lock:
+            return self.__devices.get(name)
+
+    def register(self, hello, address):
+        """
+        Register the devices of a connected agent. Return them, by their
+        name in the agent.
+        """
+        devices = {}
+        with self.__lock:
+            for description in hello["devices"]:
+                name = "{}/{}".format(hello["agent"], description["name"])
+                device = self.__devices.get(name)
+                if device is None:
+                    device = RemoteFreqMeter.create(name, description)
+                    self.__devices[name] = device
+                elif device.get_description() != description:
+                    logger.warning("Device {} changed, reconnect it to use "
+                                   "the new configuration".format(name))
+                device.set_online(True)
+                devices[description["name"]] = device
+        logger.info("Agent {} connected from {} with {} devices".format(
+                hello["agent"], address[0], len(devices)))
+        self.__notify()
+        return devices
+
+    def unregister(self, devices):
+        devices = list(devices)
+        for device in devices:
+            device.set_online(False)
+            logger.warning("Remote device {} offline".format(
+                    device.get_name()))
+        if devices:
+            self.__notify()
+        return
+
+    def __notify(self):
+        for listener in self.__listeners:
+            listener()
+        return
@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+"""Uvigo FPGA frequency meter simulator, for working without hardware"""
+# Standard libraries
+import argparse
+import collections
+import logging
+import random
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+logger = logging.getLogger("view")
+
+
+class SimulatedChannel(object):
+    """
+    Behavioural model of a channel of the Uvigo FPGA frequency meter.
+
+    Gate results are derived from the time elapsed since INIT, so the
+    model can be polled at any rate and still behave like the hardware:
+    in SAVELAST mode FETCH returns the last completed gate, and in
+    buffered mode up to buffer_depth gate results are kept, together with
+    their device timestamp, until they are drained with a bulk query.
+    The streaming mode buffers the results too, but they are pushed to
+    the client as they are completed instead of being queried.
+    """
+    STREAM_BUFFER_DEPTH = 1000
+
+    def __init__(self, frequency=10e6, noise=1.0):
+        self.frequency = frequency
+        self.noise = noise
+        self.__lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Go back to the power-on state."""
+        with self.__lock:
+            self.__gate_time = 1.0
+            self.__buffer_depth = 0
+            self.__streaming = False
+            self.__start = None
+            self.__completed = 0
+            self.__last_values = [0.0, 0.0, 0.0]
+            self.__buffer = collections.deque()
+            self.__overflows = 0
+        return
+
+    def configure(self, gate_time=None, buffer_depth=None, streaming=False):
+        """
+        Set the gate time (s) and the number of buffered gate results.
+
+        A buffer depth of 0 means SAVELAST mode, where only the last gate
+        result is kept.
+        """
+        with self.__lock:
+            if gate_time is not None:
+                self.__gate_time = gate_time
+            if buffer_depth is not None:
+                self.__buffer_depth = buffer_depth
+                self.__buffer = collections.deque(maxlen=buffer_depth or None)
+                self.__streaming = streaming
+        return
+
+    def init(self):
+        """Start measuring, as the INIT command."""
+        with self.__lock:
+            self.__start = time.monotonic()
+            self.__completed = 0
+            self.__buffer.clear()
+            self.__overflows = 0
+        return
+
+    def abort(self):
+        """Stop measuring, as the ABOR command."""
+        with self.__lock:
+            self.__start = None
+        return
+
+    def is_running(self):
+        return self.__start is not None
+
+    def is_streaming(self):
+        return self.__streaming
+
+    def get_gate_time(self):
+        return self.__gate_time
+
+    def get_overflows(self):
+        """Return the number of gate results lost due to a full buffer."""
+        return self.__overflows
+
+    def __gate_values(self):
+        values = []
+        for index in range(3):
+            values.append(random.gauss(self.frequency,
+                                       self.noise * (1 + index)))
+        return values
+
+    def __update(self):
+        """Generate the gate results completed since the last update."""
+        if self.__start is None:
+            return
+        completed = int((time.monotonic() - self.__start) / self.__gate_time)
+        if completed <= self.__completed:
+            return
+        if self.__buffer_depth:
+            pending = len(self.__buffer) + completed - self.__completed
+            self.__overflows += max(0, pending - self.__buffer_depth)
+            # Gates older than the buffer depth would be overwritten anyway
+            first = max(self.__completed, completed - self.__buffer_depth)
+            for gate in range(first, completed):
+                self.__buffer.append(((gate+1) * self.__gate_time,
+                                      self.__gate_values()))
+        else:
+            self.__last_values = self.__gate_values()
+        self.__completed = completed
+        return
+
+    def fetch_last(self):
+        """Return the values of the last completed gate."""
+        with self.__lock:
+            self.__update()
+            if self.__buffer_depth and len(self.__buffer):
+                return list(self.__buffer[-1][1])
+            return list(self.__last_values)
+
+    def fetch_buffer(self):
+        """
+        Drain the buffered gate results.
+
+        Return a list of (device_time, values) tuples, where device_time
+        is the end of the gate in seconds since INIT.
+        """
+        with self.__lock:
+            self.__update()
+            records = list(self.__buffer)
+            self.__buffer.clear()
+        return records
+
+    def handle(self, header, argument):
+        """Execute a channel command. Return the reply."""
+        if header == "SENS:MODE:SAVELAST":
+            self.configure(buffer_depth=0)
+        elif header == "SENS:MODE:BUFFER":
+            self.configure(buffer_depth=int(argument))
+        elif header == "SENS:MODE:STREAM":
+            self.configure(buffer_depth=self.STREAM_BUFFER_DEPTH,
+                           streaming=True)
+        elif header == "SENS:FREQ:ALL:ARM:TIM":
+            self.configure(gate_time=float(argument))
+        elif header == "INIT":
+            self.init()
+        elif header == "FETCH:FREQ:ALL":
+            return format_values(self.fetch_last())
+        elif header == "FETCH:FREQ:BUFF?":
+            return format_block(self.fetch_buffer())
+        elif header.startswith("INPUT:") or header.startswith("CAL:"):
+            pass
+        else:
+            return "ERROR"
+        return "OK"
+
+
+class SimulatedFreqMeter(object):
+    """
+    Behavioural model of the Uvigo FPGA frequency meter.
+
+    The channels measure independently; CHANNEL selects the channel the
+    next commands apply to. Channel n measures n times the base frequency.
+    """
+    IDN = "Uvigo,FPGA-freq-meter-simulator,0,0.1.0"
+
+    def __init__(self, frequency=10e6, noise=1.0, channels=2):
+        self.channels = [SimulatedChannel(frequency * (index+1), noise)
+                         for index in range(channels)]
+        self.__selected = self.channels[0]
+
+    def reset(self):
+        for channel in self.channels:
+            channel.reset()
+        self.__selected = self.channels[0]
+        return
+
+    def abort(self):
+        for channel in self.channels:
+            channel.abort()
+        return
+
+    def is_running(self):
+        return any(channel.is_running() for channel in self.channels)
+
+    def is_streaming(self):
+        """Return True if any channel is configured in streaming mode."""
+        return any(channel.is_streaming() for channel in self.channels)
+
+    def handle(self, command):
+        """
+        Execute a SCPI command and return the reply.
+
+        Commands without reply (*RST, ABOR, EXIT) return None.
+        """
+        command = command.strip()
+        header, _, argument = command.partition(" ")
+        header = header.upper()
+        if header == "*IDN?":
+            return self.IDN
+        elif header == "*RST":
+            self.reset()
+            return None
+        elif header in ("ABOR", "EXIT"):
+            self.abort()
+            return None
+        elif header == "CHANNEL":
+            index = int(argument) - 1
+            if not 0 <= index < len(self.channels):
+                return "ERROR"
+            self.__selected = self.channels[index]
+            return "OK"
+        return self.__selected.handle(header, argument)
+
+
+def format_values(values):
+    return ",".join(repr(value) for value in values)
+
+
+def format_block(records):
+    """
+    Pack buffered records in an IEEE 488.2 definite length block.
+
+    Records are separated by semicolons and each one holds the device
+    time followed by the signal values.
+    """
+    data = ";".join("{!r},{}".format(device_time, format_values(values))
+                    for device_time, values in records)
+    length = str(len(data.encode()))
+    return "#{}{}{}".format(len(length), length, data)
+
+
+def format_record(channel, device_time, values):
+    """
+    Frame a pushed record in one line: the channel number (starting at
+    1), the device time and the signal values.
+    """
+    return "{},{!r},{}\n".format(channel, device_time,
+                                  format_values(values))
+
+
+def split_commands(data):
+    """
+    Split a received chunk into commands.
+
+    The client does not wait for a reply after *RST or ABOR, so they
+    usually arrive glued to the next command.
+    """
+    commands = []
+    glued = True
+    while glued:
+        glued = False
+        for command in ("*RST", "ABOR"):
+            if data.upper().startswith(command) and len(data) > len(command):
+                commands.append(command)
+                data = data[len(command):]
+                glued = True
+    commands.append(data)
+    return commands
+
+
+class SimulatorHandler(socketserver.BaseRequestHandler):
+    """Serve one client connection of a simulated frequency meter."""
+    def setup(self):
+        # Replies and pushed records are sent from different threads
+        self.__send_lock = threading.Lock()
+        self.__pusher = None
+        self.server.add_client(self.request)
+
+    def handle(self):
+        meter = self.server.meter
+        while True:
+            try:
+                data = self.request.recv(4000)
+            except ConnectionError:
+                break
+            if not data:
+                break
+            for command in split_commands(data.decode('utf-8')):
+                if command.strip().upper() == "EXIT":
+                    meter.abort()
+                    return
+                reply = meter.handle(command)
+                if reply is not None:
+                    if self.server.latency:
+                        time.sleep(self.server.latency)
+                    if meter.is_streaming():
+                        # Terminated as the pushed records, so the client
+                        # can tell them apart
+                        reply += "\n"
+                    self.__send(reply)
+                if command.strip().upper() == "INIT":
+                    self.__start_pusher()
+        meter.abort()
+        return
+
+    def finish(self):
+        self.server.remove_client(self.request)
+        return
+
+    def __send(self, message):
+        with self.__send_lock:
+            self.request.sendall(message.encode())
+        return
+
+    def __start_pusher(self):
+        meter = self.server.meter
+        if not meter.is_streaming():
+            return
+        if self.__pusher and self.__pusher.is_alive():
+            return
+        self.__pusher = threading.Thread(target=self.__push_records,
+                                         daemon=True)
+        self.__pusher.start()
+        return
+
+    def __push_records(self):
+        """Push every completed gate result until the measurement stops."""
+        meter = self.server.meter
+        while meter.is_running():
+            streaming = [(index, channel)
+                         for index, channel in enumerate(meter.channels)
+                         if channel.is_running() and channel.is_streaming()]
+            if not streaming:
+                break
+            time.sleep(max(min(channel.get_gate_time()
+                               for _, channel in streaming), 0.001))
+            records = []
+            for index, channel in streaming:
+                records.extend(format_record(index+1, device_time, values)
+                               for device_time, values
+                               in channel.fetch_buffer())
+            if not records:
+                continue
+            try:
+                self.__send("".join(records))
+            except OSError:
+                break
+        return
+
+
+class SimulatorServer(socketserver.ThreadingTCPServer):
+    """TCP server exposing a SimulatedFreqMeter on a local port."""
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, frequency=10e6, noise=1.0):
+        socketserver.ThreadingTCPServer.__init__(self, address,
+                                                 SimulatorHandler)
+        self.meter = SimulatedFreqMeter(frequency, noise)
+        self.latency = latency
+        # Sockets of the connected clients
+        self.__clients = set()
+        self.__clients_lock = threading.Lock()
+
+    def start(self):
+        """Serve requests in a background thread."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def add_client(self, request):
+        with self.__clients_lock:
+            self.__clients.add(request)
+        return
+
+    def remove_client(self, request):
+        with self.__clients_lock:
+            self.__clients.discard(request)
+        return
+
+    def drop_clients(self):
+        """
+        Close the connections of all the clients, as a meter that is
+        restarted or unplugged.
+        """
+        with self.__clients_lock:
+            clients = list(self.__clients)
+        for request in clients:
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                # Already closed by the client
+                pass
+        return
+
+
+def start_simulators(count, host="127.0.0.1", port=33001, latency=0.0):
+    """
+    Launch count simulators in consecutive ports, in background threads.
+
+    Port 0 lets the OS choose a free port for each simulator; the actual
+    addresses are available in the server_address of the returned servers.
+    """
+    servers = []
+    for index in range(count):
+        server = SimulatorServer((host, port + index if port else 0), latency)
+        server.start()
+        logger.info("Simulated frequency meter listening on {}:{}".format(
+                *server.server_address))
+        servers.append(server)
+    return servers
+
+
+def run(argv=None):
+    parser = argparse.ArgumentParser(
+            description="Simulate Uvigo FPGA frequency meters over TCP/IP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=33001,
+                        help="port of the first simulator")
+    parser.add_argument("--count", type=int, default=1,
+                        help="number of simulated meters")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="reply latency in seconds")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    servers = start_simulators(args.count, args.host, args.port, args.latency)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    for server in servers:
+        server.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run())
@@ -1,23 +1,27 @@
 #!/usr/bin/env python3
 """Application main executable, for initializing the whole program"""
 # Standard libraries
+import collections
 import glob
+from html import escape as html_escape
 import json
 import logging
 import os
 import sys
+import time
 # Third party libraries
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavTbar
-import matplotlib.pyplot as plt
-from PyQt5 import QtGui, QtWidgets
-from PyQt5.QtCore import QRegularExpression, QTimer
+from PyQt5 import QtCore, QtGui, QtWidgets
+from PyQt5.QtCore import QTimer
 # Local libraries
-from view import device_manager
-from view import calibration
+from model import measurement_store
+from view import connection_manager
+from view import device_slot
 from view import freqmeterdevice
+from view import instrumentation
 from view import measurement_engine
 from view import interface
+from view import performance_panel
+from view import plot_renderer
 
 # Create the application logger, with a previously defined configuration.
 logger = logging.getLogger('view')
@@ -26,7 +30,22 @@ logger = logging.getLogger('view')
 class AppLogHandler(logging.Handler):
     """
     Customized logging handler class, for printing on a PyQt Widget.
+
+    Records may come from any thread; they are formatted and queued by
+    emit, and a timer of the GUI thread writes them to the widget in
+    batches, at most FLUSH_RATE times per second. The widget keeps the
+    last MAX_LINES messages; if the queue fills up faster than it is
+    flushed, the oldest queued messages are dropped and counted.
     """
+    # Maximum number of widget updates per second
+    FLUSH_RATE = 10
+    # Messages written to the widget in a single update
+    MAX_BATCH = 200
+    # Messages waiting to be written to the widget
+    MAX_PENDING = 5000
+    # Messages kept in the widget
+    MAX_LINES = 2000
+
     def __init__(self, widget):
         logging.Handler.__init__(self)
         self.widget = widget
@@ -45,9 +64,9 @@ class AppLogHandler(logging.Handler):
         parent_path = os.path.dirname(__file__)
         self.logsymbols = {
             logging.DEBUG: "{}/icons/debug.png".format(parent_path),
-            logging.INFO: "{}/icons//info.png".format(parent_path),
-            logging.WARN: "{}/icons//warning.png".format(parent_path),
-            logging.ERROR: "{}/icons//error.png".format(parent_path),
+            logging.INFO: "{}/icons/info.png".format(parent_path),
+            logging.WARN: "{}/icons/warning.png".format(parent_path),
+            logging.ERROR: "{}/icons/error.png".format(parent_path),
         }
         # The True levels are the ones that are printed on the log.
         self.enabled = {
@@ -56,22 +75,73 @@ class AppLogHandler(logging.Handler):
             logging.WARN: True,
             logging.ERROR: True,
         }
+        self.__pending = collections.deque(maxlen=self.MAX_PENDING)
+        self.__dropped = 0
+        # The icons are loaded once, as resources of the widget document
+        document = self.widget.document()
+        document.setMaximumBlockCount(self.MAX_LINES)
+        self.__icons = {}
+        for level, path in self.logsymbols.items():
+            image = QtGui.QImage(path)
+            if image.isNull():
+                continue
+            url = "log-icon-{}".format(logging.getLevelName(level).lower())
+            document.addResource(QtGui.QTextDocument.ImageResource,
+                                 QtCore.QUrl(url), image)
+            self.__icons[level] = url
+        self.__flush_timer = QTimer(self.widget)
+        self.__flush_timer.timeout.connect(self.__write_pending)
+        self.__flush_timer.start(1000 // self.FLUSH_RATE)
+
+    def get_pending_count(self):
+        """Return the number of messages waiting to be printed."""
+        return len(self.__pending)
 
     def emit(self, record):
         """Override the logging.Handler.emit method.
 
-        The received log message will be printed on the specified
-        widget, typically a TextBox.
+        The received log message is queued, to be printed on the
+        specified widget, typically a TextBox, by the flush timer.
         """
         # Only print on the log the enabled log levels.
-        if not self.enabled[record.levelno]:
+        if not self.enabled.get(record.levelno, True):
+            return
+        try:
+            new_log = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self.__pending) == self.MAX_PENDING:
+            self.__dropped += 1
+        self.__pending.append((record.levelno, new_log))
+        return
+
+    def __write_pending(self):
+        """Write a batch of the queued messages on the widget."""
+        if not self.__pending and not self.__dropped:
             return
-        new_log = self.format(record)
-        self.widget.insertHtml('<img src={img} height="14" width="14"/>'
-                               '<font color="{colour}">{log_msg}</font><br />'
-                               .format(img=self.logsymbols[record.levelno],
-                                       colour=self.levelcolours[record.levelno],
-                                       log_msg=new_log))
+        lines = []
+        if self.__dropped:
+            lines.append((logging.WARN, " {} log messages dropped".format(
+                    self.__dropped)))
+            self.__dropped = 0
+        while self.__pending and len(lines) < self.MAX_BATCH:
+            lines.append(self.__pending.popleft())
+        cursor = QtGui.QTextCursor(self.widget.document())
+        cursor.movePosition(QtGui.QTextCursor.End)
+        cursor.beginEditBlock()
+        for level, log_msg in lines:
+            if not cursor.atStart():
+                cursor.insertBlock()
+            icon = self.__icons.get(level)
+            html = '<font color="{colour}">{log_msg}</font>'.format(
+                    colour=self.levelcolours.get(level, 'black'),
+                    log_msg=html_escape(log_msg))
+            if icon:
+                html = '<img src="{img}" height="14" width="14"/>{html}'.format(
+                        img=icon, html=html)
+            cursor.insertHtml(html)
+        cursor.endEditBlock()
         self.widget.moveCursor(QtGui.QTextCursor.End)
         return
 
@@ -80,12 +150,50 @@ class MainWindow(QtWidgets.QMainWindow, interface.Ui_MainWindow):
     """
     Class for defining the behaviour of the User Interface main window.
     """
-    def __init__(self):
+    # Number of device slots at start-up
+    DEFAULT_SLOTS = 2
+    # Device slots per row in the devices area
+    SLOT_COLUMNS = 2
+    # Maximum fraction of the time spent rendering the plot
+    RENDER_LOAD = 0.25
+    # Plot timer period (ms) while the plot cannot be seen
+    IDLE_PERIOD = 1000
+    # Emitted when the plot has been built, after the window is shown
+    canvas_ready = QtCore.pyqtSignal()
+    # Emitted, from any thread, when the remote devices change
+    remote_devices_changed = QtCore.pyqtSignal()
+    # Asks the plot renderer for a frame: plot, width, height and dpi
+    render_requested = QtCore.pyqtSignal(object, int, int, float)
+
+    def __init__(self, metrics_address=None, publisher=None,
+                 aggregator=None, engine="timer"):
+        """
+        metrics_address: optional (host, port) where the acquisition
+            metrics are served, in Prometheus format.
+        publisher: optional SamplePublisher, where every stored sample is
+            published.
+        aggregator: optional Aggregator, whose remote devices can be
+            selected as the local ones.
+        engine: "timer" fetches the devices on the main thread, "threaded"
+            on a thread of their own and "process" in worker processes.
+        """
         QtWidgets.QMainWindow.__init__(self)
         # Run the windows initialization routines.
         self.setupUi(self)
         # Instrument devices list.
         self.__devices = {}
+        # Device slot panels
+        self.__slots = []
+        # Names of the devices being connected, by slot
+        self.__connecting = {}
+        # Connects the devices in the background and keeps them connected
+        self.__connections = connection_manager.ConnectionManager(self)
+        self.__connections.device_connected.connect(self.__on_device_connected)
+        self.__connections.connect_failed.connect(self.__on_connect_failed)
+        self.__connections.device_state_changed.connect(
+                self.__on_device_state_changed)
+        # Receiver of the devices of the acquisition agents
+        self.__aggregator = aggregator
         self.popup = None
         # Configure the logger, assigning an instance of AppLogHandler.
         self.log_handler = AppLogHandler(self.LoggerBrowser)
@@ -95,6 +203,9 @@ class MainWindow(QtWidgets.QMainWindow, interface.Ui_MainWindow):
         self.__setup_menu()
         # Setup device control area
         self.__setup_device_controls()
+        if aggregator:
+            self.remote_devices_changed.connect(self.__fill_device_selectors)
+            aggregator.add_listener(self.remote_devices_changed.emit)
 
         # Log console level selection buttons
         self.DebugCheck.clicked.connect(self.update_logger_level)
@@ -107,10 +218,68 @@ class MainWindow(QtWidgets.QMainWindow, interface.Ui_MainWindow):
         self.__plot_update = QTimer()
         self.__plot_update.timeout.connect(self.__update_plot)
         # Measurement engine
-        self.m_engine = measurement_engine.MeasurementEngine(threaded=False)
+        if engine == "process":
+            # Local libraries
+            from view import worker_engine
+
+            self.m_engine = worker_engine.ProcessMeasurementEngine(
+                    adaptive=True)
+        else:
+            self.m_engine = measurement_engine.MeasurementEngine(
+                    threaded=engine == "threaded", adaptive=True)
+        # Performance panel, refreshed with the plot
+        self.__frame_time = 0.0
+        # A frame is being rendered, and the frames dropped meanwhile
+        self.__rendering = False
+        self.__dropped_frames = 0
+        # Plot timer period (ms) requested at start, and what was shown in
+        # the last frame, to skip the frames that would show nothing new
+        self.__plot_period = 0
+        self.__plot_state = None
+        self.__skipped_frames = 0
+        self.performance = performance_panel.PerformancePanel(self)
+        self.addDockWidget(QtCore.Qt.BottomDockWidgetArea, self.performance)
+        self.performance.hide()
+        self.tools.addSeparator()
+        self.tools.addAction(self.performance.toggleViewAction())
+        # Live samples publisher
+        self.__publisher = publisher
+        # Metrics endpoint
+        self.metrics_server = None
+        if metrics_address:
+            # Local libraries
+            from view import metrics
+
+            self.metrics_server = metrics.MetricsServer(
+                    metrics_address, self.m_engine, self.log_handler,
+                    publisher)
+            self.metrics_server.start()
+
+        # The plot is built once the window is shown, as loading
+        # matplotlib takes a noticeable time.
+        self.figure = None
+        self.canvas = None
+        self.ax = None
+        self.start.setEnabled(False)
+        QTimer.singleShot(0, self.__setup_canvas)
 
-        # plot layout set-up.
-        self.figure = plt.figure()
+        # Plot data
+        # list of InstrumentData
+        self.data = []
+        # list (channel) of lists (signal)
+        self.cboxes = [[], []]
+        self.sample_counter = 0
+
+    def __setup_canvas(self):
+        """Build the plot layout."""
+        # Third party libraries
+        from matplotlib.backends.backend_qt5agg import (
+                FigureCanvasQTAgg as FigureCanvas)
+        from matplotlib.backends.backend_qt5agg import (
+                NavigationToolbar2QT as NavTbar)
+        from matplotlib.figure import Figure
+
+        self.figure = Figure()
         self.figure.patch.set_alpha(0)
         self.canvas = FigureCanvas(self.figure)
         self.toolbar = NavTbar(self.canvas, self)
@@ -119,18 +288,27 @@ class MainWindow(QtWidgets.QMainWindow, interface.Ui_MainWindow):
                                         QtWidgets.QSizePolicy.Minimum)
         self.plot_control.addItem(spacer1)
         self.plot.addWidget(self.canvas)
-        self.ax = self.figure.add_subplot(111)
-        self.figure.subplots_adjust(top=0.9, bottom=0.1, left=0.13, right=0.95)
+        self.ax = plot_renderer.setup_figure(self.figure)
         self.ax.grid()
         self.ax.set_ylabel("F(Hz)", rotation='horizontal')
         self.ax.yaxis.set_label_coords(-0.01, 1.04)
-
-        # Plot data
-        # list of InstrumentData
-        self.data = []
-        # list (channel) of lists (signal)
-        self.cboxes = [[], []]
-        self.sample_counter = 0
+        self.canvas.draw_idle()
+        # While measuring, the plot is rasterized in a thread of its own
+        # and shown as an image, so drawing never blocks the controls.
+        # The interactive canvas shows the data when measuring stops.
+        self.plot_image = plot_renderer.PlotImage(self)
+        self.plot_image.hide()
+        self.plot.addWidget(self.plot_image)
+        self.__renderer = plot_renderer.PlotRenderer()
+        self.__render_thread = QtCore.QThread(self)
+        self.__renderer.moveToThread(self.__render_thread)
+        self.render_requested.connect(self.__renderer.render)
+        self.__renderer.frame_ready.connect(self.__show_frame)
+        self.__render_thread.start()
+        self.start.setEnabled(True)
+        logger.debug("Plot canvas ready")
+        self.canvas_ready.emit()
+        return
 
     def __setup_menu(self):
         # File
@@ -138,11 +316,28 @@ class MainWindow(QtWidgets.QMainWindow, interface.Ui_MainWindow):
         # Tools
         self.device_manager.triggered.connect(self.__open_device_manager)
         self.fpga_calibration.triggered.connect(self.__open_calibration_window)
+        self.tools.addSeparator()
+        self.add_slot = self.tools.addAction("Add device slot")
+        self.add_slot.triggered.connect(self.__add_device_slot)
+        self.remove_slot = self.tools.addAction("Remove device slot")
+        self.remove_slot.triggered.connect(self.__remove_device_slot)
+        self.tools.addSeparator()
+        self.record_latencies = self.tools.addAction("Record latencies")
+        self.record_latencies.setCheckable(True)
+        self.record_latencies.toggled.connect(self.__record_latencies)
+        self.show_latencies = self.tools.addAction("Latency statistics")
+        self.show_latencies.triggered.connect(self.__show_latencies)
+        self.export_latencies = self.tools.addAction(
+                "Export latency trace...")
+        self.export_latencies.triggered.connect(self.__export_latencies)
         # Help
         # TODO [floonone-20170906] help actions
         return
 
     def __open_device_manager(self):
+        # Local libraries
+        from view import device_manager
+
         logger.debug("Opening Device Manager pop-up window")
         self.popup = device_manager.DevManagerWindow()
         self.popup.exec_()
@@ -152,201 +347,221 @@ class MainWindow(QtWidgets.QMainWindow, interface.Ui_MainWindow):
         return
 
     def __open_calibration_window(self):
+        # Local libraries
+        from view import calibration
+
         logger.debug("Opening FPGA device Calibration pop-up window")
         self.popup = calibration.CalibWindow()
         self.popup.exec_()
         self.popup = None
         return
 
+    def __record_latencies(self, enabled):
+        if enabled:
+            instrumentation.tracer.clear()
+        instrumentation.tracer.enabled = enabled
+        logger.info("Latency recording {}".format(
+                "enabled" if enabled else "disabled"))
+        return
+
+    def __show_latencies(self):
+        """Print the latency statistics of every stage on the log."""
+        summary = instrumentation.tracer.get_summary()
+        if not summary:
+            logger.info("No latencies recorded")
+            return
+        for source, stages in sorted(summary.items()):
+            for stage, stats in sorted(stages.items()):
+                logger.info("{} {}: {} calls, p50 {:.1f} us, p99 {:.1f} us, "
+                            "max {:.1f} us".format(
+                                    source, stage, stats["count"],
+                                    stats["p50"] / 1000, stats["p99"] / 1000,
+                                    stats["max"] / 1000))
+        return
+
+    def __export_latencies(self):
+        file = QtWidgets.QFileDialog.getSaveFileName(
+                self, "Export latency trace", "trace.json",
+                "Chrome trace (*.json)")[0]
+        if not file:
+            logger.warning("No file selected")
+            return
+        events = instrumentation.tracer.export_chrome_trace(file)
+        logger.info("Exported {} trace events to {}".format(events, file))
+        return
+
     def __setup_device_controls(self):
-        self.__fill_device_selectors()
-        self.__setup_measurement_selectors()
-        self.__setup_device_selection_button()
+        # The device panels of the interface are replaced by slots built
+        # at runtime, placed in a scrollable grid.
+        for group in (self.device0, self.device1):
+            self.devices.removeWidget(group)
+            group.setParent(None)
+            group.deleteLater()
+        self.__slot_area = QtWidgets.QScrollArea(self.centralwidget)
+        self.__slot_area.setWidgetResizable(True)
+        self.__slot_area.setFrameShape(QtWidgets.QFrame.NoFrame)
+        self.__slot_area.setHorizontalScrollBarPolicy(
+                QtCore.Qt.ScrollBarAlwaysOff)
+        slot_container = QtWidgets.QWidget(self.__slot_area)
+        self.__slot_layout = QtWidgets.QGridLayout(slot_container)
+        self.__slot_layout.setContentsMargins(0, 0, 0, 0)
+        self.__slot_area.setWidget(slot_container)
+        self.devices.addWidget(self.__slot_area)
+        for _ in range(self.DEFAULT_SLOTS):
+            self.__add_device_slot()
+        # Show a whole row of slots
+        self.__slot_area.setMinimumHeight(
+                self.__slots[0].sizeHint().height())
+
+    def __add_device_slot(self):
+        slot = device_slot.DeviceSlot(len(self.__slots))
+        self.__slot_layout.addWidget(slot,
+                                     slot.index // self.SLOT_COLUMNS,
+                                     slot.index % self.SLOT_COLUMNS)
+        slot.selector.addItems(self.__get_device_names())
+        slot.connect_button.pressed.connect(
+                lambda index=slot.index:
+                self.__on_device_control_button_press(index))
+        self.__slots.append(slot)
+        self.remove_slot.setEnabled(len(self.__slots) > 1)
+        logger.debug("Added device slot {}".format(slot.index+1))
+        return
 
-    def __fill_device_selectors(self):
-        devices_list = [os.path.basename(match)[:-4]
-                        for match in glob.glob('resources/devices/*yml')]
-        device_selectors = self.findChildren(
-                QtWidgets.QComboBox, QRegularExpression("\\d_selector"))
-        for selector in device_selectors:
-            selector.clear()
-            selector.addItems(devices_list)
+    def __remove_device_slot(self):
+        """Remove the last device slot, if it has no device connected."""
+        slot = self.__slots[-1]
+        if slot.index in self.__devices or slot.index in self.__connecting:
+            logger.warning("Disconnect the device of slot {} before removing "
+                           "it".format(slot.index+1))
+            return
+        self.__slots.pop()
+        self.__slot_layout.removeWidget(slot)
+        slot.setParent(None)
+        slot.deleteLater()
+        self.remove_slot.setEnabled(len(self.__slots) > 1)
+        logger.debug("Removed device slot {}".format(slot.index+1))
         return
 
-    def __setup_measurement_selectors(self):
-        channel_controls = self.findChildren(
-                QtWidgets.QRadioButton,
-                QRegularExpression("device\\d_channel\\d"))
-        for control in channel_controls:
-            policy = control.sizePolicy()
-            policy.setRetainSizeWhenHidden(True)
-            control.setSizePolicy(policy)
-            control.setEnabled(False)
-            control.setVisible(False)
-
-        impedance_controls = self.findChildren(
-                QtWidgets.QRadioButton,
-                QRegularExpression("device\\d_impedance\\d"))
-        for control in impedance_controls:
-            policy = control.sizePolicy()
-            policy.setRetainSizeWhenHidden(True)
-            control.setSizePolicy(policy)
-            control.setEnabled(False)
-            control.setVisible(False)
-
-        signal_controls = self.findChildren(
-                QtWidgets.QCheckBox,
-                QRegularExpression("device\\d_signal\\d"))
-        for control in signal_controls:
-            policy = control.sizePolicy()
-            policy.setRetainSizeWhenHidden(True)
-            control.setSizePolicy(policy)
-            control.setEnabled(False)
-            control.setVisible(False)
-
-    def __setup_device_selection_button(self):
-        device_connects = self.findChildren(
-                QtWidgets.QPushButton, QRegularExpression("\\d_connect"))
-        for i, connect in enumerate(device_connects):
-            connect.pressed.connect(
-                    lambda slot=i: self.__on_device_control_button_press(slot))
+    def __get_device_names(self):
+        names = [os.path.basename(match)[:-4]
+                 for match in glob.glob('resources/devices/*yml')]
+        if self.__aggregator:
+            names.extend(self.__aggregator.get_device_names())
+        return names
+
+    def __fill_device_selectors(self):
+        devices_list = self.__get_device_names()
+        for slot in self.__slots:
+            # Keep the selection of every slot
+            selected = slot.selector.currentText()
+            slot.selector.clear()
+            slot.selector.addItems(devices_list)
+            if selected in devices_list:
+                slot.selector.setCurrentText(selected)
         return
 
     def __on_device_control_button_press(self, slot):
-        device_group = self.findChild(QtWidgets.QGroupBox,
-                                      "device{}".format(slot))
-        if device_group.property("name"):
+        if self.__slots[slot].get_device_name():
             self.__disconnect_device(slot)
         else:
             self.__connect_device(slot)
 
     def __connect_device(self, slot):
-        device_group = self.findChild(QtWidgets.QGroupBox,
-                                      "device{}".format(slot))
-        name = device_group.findChild(QtWidgets.QComboBox).currentText()
+        name = self.__slots[slot].selector.currentText()
         # Check rest of slots to see if device is already loaded
         checks = [checked for checked in filter(
-                lambda child: child.property("name") == name,
-                self.findChildren(QtWidgets.QGroupBox,
-                                  QRegularExpression("device\\d$")))]
-        if len(checks):
+                lambda child: child.get_device_name() == name, self.__slots)]
+        if len(checks) or name in self.__connecting.values():
             logger.warning("Device {} is already selected in the other slot"
                            "".format(name))
             return False
 
-        # path join
-        dev_dir = "{}/resources/devices/".format(os.getcwd())
-        dev_path = "{}{}.yml".format(dev_dir, name)
-        if not glob.glob(dev_path):
-            logger.warning("Selected device does not longer exist")
-            return
-
-        # Create a new device and try to connect to it
-        new_device = freqmeterdevice.FreqMeter.get_freq_meter(dev_path)
-        if not new_device.connect():
-            logger.error("Unable to connect to device {}".format(name))
-            return
-        if not new_device.is_ready():
-            logger.error("Device {} connected but not responding ACK".format(
-                    name))
-            return
+        if self.__aggregator and self.__aggregator.get_device(name):
+            # Device of an acquisition agent
+            new_device = self.__aggregator.get_device(name)
+        else:
+            # path join
+            dev_dir = "{}/resources/devices/".format(os.getcwd())
+            dev_path = "{}{}.yml".format(dev_dir, name)
+            if not glob.glob(dev_path):
+                logger.warning("Selected device does not longer exist")
+                return
+
+            # Create a new device and try to connect to it
+            new_device = freqmeterdevice.FreqMeter.get_freq_meter(dev_path)
+        # Connected in the background, not to freeze the window while an
+        # unreachable device times out
+        self.__connecting[slot] = name
+        self.__slots[slot].show_connecting()
+        self.__connections.connect_device(slot, new_device)
+        return
 
+    def __on_device_connected(self, slot, new_device):
+        name = self.__connecting.pop(slot)
         logger.info("Connected to device {}".format(name))
 
         # Add device to the list of available devices to do measurements
         self.__devices[slot] = new_device
+        self.__connections.watch(slot, new_device)
+
+        if self.__publisher:
+            new_device.add_sample_listener(self.__publisher.publish)
+        self.__slots[slot].show_device(name, new_device)
+        # Devices connected while measuring are measured from the next start
+        self.__slots[slot].set_locked(self.__plot_update.isActive())
+        return
+
+    def __on_connect_failed(self, slot, name, reason):
+        self.__connecting.pop(slot)
+        if reason == "not ready":
+            logger.error("Device {} connected but not responding ACK".format(
+                    name))
+        else:
+            logger.error("Unable to connect to device {} ({})".format(
+                    name, reason))
+        self.__slots[slot].clear_device()
+        self.__slots[slot].set_locked(self.__plot_update.isActive())
+        return
 
-        # Change the button text to Disconnect
-        device_group.findChild(QtWidgets.QPushButton).setText("Disconnect")
-        # Disable selector
-        device_group.findChild(QtWidgets.QComboBox).setEnabled(False)
-        # Enable signal and channel controls
-        for control in device_group.findChildren(QtWidgets.QGroupBox):
-            control.setEnabled(True)
-        # Show available channels
-        channel_controls = [channel for channel in device_group.findChildren(
-                QtWidgets.QRadioButton, QRegularExpression("channel\\d"))]
-        channels = new_device.get_channels()
-        for i in range(channels):
-            channel_controls[i].setEnabled(True)
-            channel_controls[i].setVisible(True)
-        for i in range(channels, 4):
-            channel_controls[i].setEnabled(False)
-            channel_controls[i].setVisible(False)
-        # Select the first channel by default
-        channel_controls[0].setChecked(True)
-        # Show available impedances
-        impedance_controls = [channel for channel in device_group.findChildren(
-                QtWidgets.QRadioButton, QRegularExpression("impedance\\d"))]
-        impedances = new_device.get_impedances()
-        for i in range(len(impedances)):
-            impedance_controls[i].setText(impedances[i])
-            impedance_controls[i].setEnabled(True)
-            impedance_controls[i].setVisible(True)
-        for i in range(len(impedances), 4):
-            impedance_controls[i].setText("")
-            impedance_controls[i].setEnabled(False)
-            impedance_controls[i].setVisible(False)
-        impedance_controls[0].setChecked(True)
-        # Show available signals
-        signal_controls = [signal for signal in device_group.findChildren(
-                QtWidgets.QCheckBox)]
-        signals = new_device.get_signals()
-        for i in range(len(signals)):
-            signal_controls[i].setText(signals[i])
-            signal_controls[i].setEnabled(True)
-            signal_controls[i].setVisible(True)
-        for i in range(len(signals), 4):
-            signal_controls[i].setText("")
-            signal_controls[i].setEnabled(False)
-            signal_controls[i].setVisible(False)
-
-        device_group.setProperty("name", name)
+    def __on_device_state_changed(self, slot, device, online):
+        if self.__devices.get(slot) is device:
+            self.__slots[slot].show_online(online)
         return
 
     def __disconnect_device(self, slot):
-        device_group = self.findChild(QtWidgets.QGroupBox,
-                                      "device{}".format(slot))
+        panel = self.__slots[slot]
+        self.__connections.forget(self.__devices[slot])
         # Remove device from the list of available devices
+        if self.__publisher:
+            self.__devices[slot].remove_sample_listener(
+                    self.__publisher.publish)
+        self.__devices[slot].close_shared_rings()
         del self.__devices[slot]
-        # Change the button text to Connect
-        device_group.findChild(QtWidgets.QPushButton).setText("Connect")
-        # Enable selector
-        device_group.findChild(QtWidgets.QComboBox).setEnabled(True)
-        # Disable signal and channel controls
-        for control in device_group.findChildren(QtWidgets.QGroupBox):
-            control.setEnabled(False)
-        channel_controls = [
-            channel for channel in device_group.findChildren(
-                QtWidgets.QRadioButton,
-                QRegularExpression("channel\\d"))]
-        for control in channel_controls:
-            control.setChecked(False)
-            control.setEnabled(False)
-            control.setVisible(False)
-        impedance_controls = [
-            impedance for impedance in device_group.findChildren(
-                    QtWidgets.QRadioButton,
-                    QRegularExpression("impedance\\d"))]
-        for control in impedance_controls:
-            control.setChecked(False)
-            control.setEnabled(False)
-            control.setVisible(False)
-        signal_controls = [signal for signal in device_group.findChildren(
-                QtWidgets.QCheckBox)]
-        for control in signal_controls:
-            control.setChecked(False)
-            control.setEnabled(False)
-            control.setVisible(False)
-            control.setText("")
-
         logger.info("Disconnected from device {}".format(
-                device_group.property("name")))
+                panel.get_device_name()))
+        panel.clear_device()
+        return
 
-        device_group.setProperty("name", None)
+    def close_devices(self):
+        """Release the resources of the connected devices, on exit."""
+        self.__connections.shutdown()
+        for device in self.__devices.values():
+            device.close_shared_rings()
         return
 
     def __setup_plot(self):
+        # Length of the time window shown with autoscroll
+        self.scroll_window = QtWidgets.QSpinBox(self.measurement)
+        self.scroll_window.setRange(1, 24*3600)
+        self.scroll_window.setValue(60)
+        self.scroll_window.setSuffix(" s")
+        self.scroll_window.setToolTip("Time shown with autoscroll")
+        self.plot_control.insertWidget(
+                self.plot_control.indexOf(self.autoscroll) + 1,
+                self.scroll_window)
+        self.autoscroll.toggled.connect(self.scroll_window.setEnabled)
+        # Time origin of the plot, the start of the measurement (ns)
+        self.__plot_origin = measurement_store.now_ns()
         self.start.pressed.connect(self.__start_plot)
         self.stop.pressed.connect(self.__stop_plot)
         self.save.pressed.connect(self.__save_data)
@@ -354,49 +569,58 @@ class MainWindow(QtWidgets.QMainWindow, interface.Ui_MainWindow):
     def __start_plot(self):
         # Get general measuring parameters
         fetch_time = self.fetch_time.value()
-        sample_time = self.fetch_time.value()
-        plot_time = min(500, fetch_time*1000)
+        sample_time = self.sample_time.value()
+        # Devices may override the times in their configuration file
+        periods = {device: device.get_fetch_time(fetch_time)
+                   for device in self.__devices.values()}
+        plot_time = min([500, fetch_time*1000] +
+                        [period*1000 for period in periods.values()])
 
         # Block controls
         self.start.setEnabled(False)
         self.stop.setEnabled(True)
         self.save.setEnabled(False)
         self.measurement_configuration.setEnabled(False)
+        self.add_slot.setEnabled(False)
+        self.remove_slot.setEnabled(False)
 
-        for i, device in enumerate(self.findChildren(
-                QtWidgets.QGroupBox, QRegularExpression("device\\d$"))):
-            device.findChild(QtWidgets.QComboBox).setEnabled(False)
-            device.findChild(QtWidgets.QPushButton).setEnabled(False)
-            device.findChild(QtWidgets.QGroupBox,
-                             "device{}_channels".format(i)).setEnabled(False)
-            device.findChild(QtWidgets.QGroupBox,
-                             "device{}_impedances".format(i)).setEnabled(False)
+        for panel in self.__slots:
+            panel.set_locked(True)
 
         # Start devices measurement
         for i, device in self.__devices.items():
-            # Obtain selected channel
-            channel_controls = self.findChild(
-                    QtWidgets.QGroupBox, "device{}_channels".format(i))
-            channel_controls = channel_controls.findChildren(
-                    QtWidgets.QRadioButton)
-            selected_channel = [c for c in filter(
-                    lambda c: c.isChecked(), channel_controls)][0]
-            channel = int(selected_channel.text()) - 1
-            # Obtain selected impedance
-            impedance_controls = self.findChild(
-                    QtWidgets.QGroupBox, "device{}_impedances".format(i))
-            impedance_controls = impedance_controls.findChildren(
-                    QtWidgets.QRadioButton)
-            selected_impedance = [c for c in filter(
-                    lambda c: c.isChecked(), impedance_controls)][0]
-            impedance = selected_impedance.text()
-            # Start measurement
-            device.start_measurement(sample_time, channel, impedance)
+            # Obtain selected channels and impedance
+            channels = self.__slots[i].get_channels()
+            if not channels:
+                logger.warning("No channel selected in device {}, measuring "
+                               "channel 1".format(device.get_name()))
+                channels = [0]
+            impedance = self.__slots[i].get_impedance()
+            # Start measurement, unless the engine hands the device over to
+            # a worker process, which configures it
+            if self.m_engine.hands_over(device):
+                device.prepare_measurement(
+                        device.get_sample_time(sample_time), channels,
+                        impedance)
+            else:
+                device.start_measurement(device.get_sample_time(sample_time),
+                                         channels, impedance)
 
         # Start the measurement engine
-        self.m_engine.start(self.__devices.values(), fetch_time)
+        self.m_engine.start(self.__devices.values(), fetch_time, periods)
+        self.__connections.set_measuring(True)
         logger.debug("Measurement started")
 
+        # Show the rendered frames instead of the interactive plot
+        self.__dropped_frames = 0
+        self.__skipped_frames = 0
+        self.__plot_state = None
+        self.__plot_period = int(plot_time)
+        self.__frame_time = 0.0
+        self.__plot_origin = measurement_store.now_ns()
+        self.toolbar.setEnabled(False)
+        self.canvas.hide()
+        self.plot_image.show()
         # Start the timer to update plots
         self.__plot_update.start(plot_time)
         logger.debug("Plotting started")
@@ -404,116 +628,234 @@ class MainWindow(QtWidgets.QMainWindow, interface.Ui_MainWindow):
 
     def __stop_plot(self):
         self.m_engine.stop()
+        self.__connections.set_measuring(False)
+        for device in self.__devices.values():
+            # Devices handed over were stopped by their worker
+            if not self.m_engine.hands_over(device):
+                device.stop_measurement()
         logger.debug("Measurement stopped")
         self.__plot_update.stop()
-        logger.debug("Plotting stopped")
+        logger.debug("Plotting stopped, {} frames dropped while rendering, "
+                     "{} skipped".format(self.__dropped_frames,
+                                         self.__skipped_frames))
+        # Show the whole session in the interactive plot
+        self.__draw_canvas()
+        self.plot_image.hide()
+        self.canvas.show()
+        self.toolbar.setEnabled(True)
 
         # Unlock controls
         self.start.setEnabled(True)
         self.stop.setEnabled(False)
         self.save.setEnabled(True)
         self.measurement_configuration.setEnabled(True)
+        self.add_slot.setEnabled(True)
+        self.remove_slot.setEnabled(len(self.__slots) > 1)
+
+        for panel in self.__slots:
+            panel.set_locked(False)
+        for slot in self.__connecting:
+            self.__slots[slot].show_connecting()
+        # Show the final counters of the session
+        self.__update_performance()
+        return
 
-        for i, device in enumerate(self.findChildren(
-                QtWidgets.QGroupBox, QRegularExpression("device\\d$"))):
-            device.findChild(QtWidgets.QPushButton).setEnabled(True)
-            device.findChild(QtWidgets.QGroupBox,
-                             "device{}_channels".format(i)).setEnabled(True)
-            device.findChild(QtWidgets.QGroupBox,
-                             "device{}_impedances".format(i)).setEnabled(True)
-            if not device.property("name"):
-                device.findChild(QtWidgets.QComboBox).setEnabled(True)
-
-    def __update_plot(self):
-        # Clear plot
-        self.ax.cla()
-        self.ax.grid()
-        self.ax.set_ylabel("F(Hz)", rotation='horizontal')
-        self.ax.yaxis.set_label_coords(-0.01, 1.04)
-        # Remove exponential notation in y axis
-        self.ax.get_yaxis().get_major_formatter().set_useOffset(False)
-        measurement_size = 0
+    def __get_plot_frame(self, whole=False):
+        """
+        Return the lines to plot, with their times in seconds since the
+        start of the measurement, and the x axis limits.
+
+        With autoscroll only the samples of the last scroll window are
+        taken, found with a binary search on their timestamps, so the
+        cost of a frame does not grow with the measurement. If whole is
+        True every sample is taken, and the scroll window is only the
+        initial x axis limits, so the whole session can be panned.
+        """
+        lines = []
+        window_start = None
+        xlim = None
+        if self.autoscroll.isChecked():
+            last = [device.get_last_timestamp()
+                    for device in self.__devices.values()]
+            last = [timestamp for timestamp in last if timestamp is not None]
+            if last:
+                window_end = max(last)
+                window_start = window_end - int(
+                        self.scroll_window.value() * 1e9)
+                xlim = ((window_start - self.__plot_origin) / 1e9,
+                        (window_end - self.__plot_origin) / 1e9)
         for i, device in self.__devices.items():
             measurements = device.get_measurement_data()
-            device_control = self.findChild(
-                    QtWidgets.QGroupBox, "device{}".format(i))
-            name = device_control.property("name")
-            selected_channel = None
-            for j, channel in enumerate(device_control.findChildren(
-                    QtWidgets.QRadioButton,
-                    QRegularExpression("channel\\d"))):
-                if channel.isChecked():
-                    selected_channel = j
-            channel_measurements = measurements[selected_channel]
-            for signal in filter(
-                    lambda x: x.isChecked(),
-                    device_control.findChildren(QtWidgets.QCheckBox)):
-                signal_values = [
-                    measurement[signal.text()]
-                    for measurement in channel_measurements.values()]
-                # Draw the plot
-                self.ax.plot(signal_values, label="{} Ch-{} {}".format(
-                        name, selected_channel+1, signal.text()))
-
-        if self.autoscroll.isChecked() and measurement_size > 100:
-            self.ax.set_xlim(measurement_size - 100, measurement_size)
-
-        # Print legends in the plot
-        handles, labels = self.ax.get_legend_handles_labels()
-        plt.legend(bbox_to_anchor=(0., 1.02, 1., 0.102), loc=0, ncol=3,
-                   mode="expand", borderaxespad=0., fontsize='xx-small')
+            panel = self.__slots[i]
+            name = panel.get_device_name()
+            signals = panel.get_signals()
+            for channel in device.get_active_channels():
+                channel_measurements = measurements[channel]
+                if not signals:
+                    continue
+                if window_start is None or whole:
+                    start, stop = 0, len(channel_measurements)
+                else:
+                    start, stop = channel_measurements.get_window(
+                            window_start)
+                times = [(timestamp - self.__plot_origin) / 1e9
+                         for timestamp in channel_measurements.get_timestamps(
+                                 start, stop)]
+                for signal in signals:
+                    lines.append(("{} Ch-{} {}".format(name, channel+1,
+                                                       signal),
+                                  times,
+                                  channel_measurements.get_signal(
+                                          signal, start, stop)))
+        return lines, xlim
+
+    def __get_plot_state(self):
+        """Return what a frame would show: samples, signals and size."""
+        return (tuple((i, device.get_sample_count())
+                      for i, device in self.__devices.items()),
+                tuple(tuple(panel.get_signals()) for panel in self.__slots),
+                self.autoscroll.isChecked(),
+                self.scroll_window.value(),
+                self.plot_image.size())
+
+    def __is_plot_visible(self):
+        return (not self.isMinimized() and self.plot_image.isVisible() and
+                not self.plot_image.visibleRegion().isEmpty())
+
+    def __get_frame_period(self):
+        """
+        Return the plot timer period (ms): slow frames lower the frame
+        rate, so the rendering takes at most RENDER_LOAD of the time.
+        """
+        return max(self.__plot_period,
+                   self.__frame_time * 1000 / self.RENDER_LOAD)
+
+    def __set_plot_period(self, period):
+        """Change the plot timer period (ms), if it changes noticeably."""
+        period = int(period)
+        if abs(period - self.__plot_update.interval()) > 0.1 * period:
+            self.__plot_update.setInterval(period)
+        return
+
+    def __update_plot(self):
+        if not self.__is_plot_visible():
+            # Nothing is rendered until the plot can be seen again
+            self.__set_plot_period(self.IDLE_PERIOD)
+            return
+        self.__set_plot_period(self.__get_frame_period())
+        if self.__rendering:
+            # The previous frame is not finished, skip this one
+            self.__dropped_frames += 1
+            return
+        state = self.__get_plot_state()
+        if state == self.__plot_state:
+            # No new samples
+            self.__skipped_frames += 1
+            self.__update_performance()
+            return
+        self.__plot_state = state
+        self.__rendering = True
+        width, height, ratio = self.plot_image.get_render_size()
+        self.render_requested.emit(self.__get_plot_frame(), width, height,
+                                   self.figure.dpi * ratio)
+        return
+
+    def __show_frame(self, image, render_time):
+        self.__rendering = False
+        image.setDevicePixelRatio(self.plot_image.devicePixelRatioF())
+        self.plot_image.set_image(image)
+        self.__frame_time = render_time
+        self.__set_plot_period(self.__get_frame_period())
+        self.__update_performance()
+        return
+
+    def changeEvent(self, event):
+        if (event.type() == QtCore.QEvent.WindowStateChange and
+                not self.isMinimized() and self.__plot_update.isActive()):
+            # Show the current data as soon as the window is restored
+            QTimer.singleShot(0, self.__update_plot)
+        QtWidgets.QMainWindow.changeEvent(self, event)
+        return
+
+    def __draw_canvas(self):
+        """Draw the whole session on the interactive plot, in the GUI."""
+        start = time.perf_counter()
+        plot_renderer.draw_plot(self.ax, *self.__get_plot_frame(whole=True))
         self.canvas.draw()
+        self.__frame_time = time.perf_counter() - start
+        return
+
+    def stop_rendering(self):
+        """Stop the plot renderer thread, on exit."""
+        if self.canvas is not None:
+            self.__render_thread.quit()
+            self.__render_thread.wait()
+        return
+
+    def __update_performance(self):
+        self.performance.update_stats(
+                self.m_engine.get_schedules(), self.__frame_time,
+                self.log_handler.get_pending_count(),
+                instrumentation.rss_bytes())
         return
 
     def __save_data(self):
         # Create data to export
         measurements = []
         measurement_counts = []
+        signal_counts = []
         file_header = ""
         data_header = ""
         for key, device in self.__devices.items():
-            # Only one channel has measurement data
-            device_data = [fd for fd in filter(
-                    lambda md: len(md) > 0, device.get_measurement_data())]
+            # Only the measured channels have measurement data
+            device_data = [(channel, series) for channel, series in filter(
+                    lambda cs: len(cs[1]) > 0,
+                    enumerate(device.get_measurement_data()))]
             # If there is no data, stop processing device
             if not len(device_data):
                 continue
             # If there is data, add signals to data_header and save measurements
             file_header += "Device {}: {}\n".format(key+1, device.get_name())
 
-            device_data = device_data[0]
-            if len(data_header) > 0:
-                data_header += "\t"
-            data_header += "timestamp{}".format(key+1)
             signals = device.get_signals()
-            for signal in signals:
-                data_header += "\t"
-                data_header += signal
-            device_measurements = []
-            for t, m in device_data.items():
-                measurement = t.strftime("%Y-%m-%d_%H:%M:%S.%f")
+            for channel, series in device_data:
+                if len(data_header) > 0:
+                    data_header += "\t"
+                data_header += "timestamp{}".format(key+1)
+                if len(device_data) > 1:
+                    data_header += "_ch{}".format(channel+1)
                 for signal in signals:
-                    measurement += "\t"
-                    measurement += str(m[signal])
-                device_measurements.append(measurement)
-            measurements.append(device_measurements)
-            measurement_counts.append(len(device_measurements))
+                    data_header += "\t"
+                    data_header += signal
+                columns = [series.get_signal(signal) for signal in signals]
+                device_measurements = []
+                for i, t in enumerate(series.get_timestamps()):
+                    measurement = measurement_store.to_datetime(t).strftime(
+                            "%Y-%m-%d_%H:%M:%S.%f")
+                    for column in columns:
+                        measurement += "\t"
+                        measurement += str(column[i])
+                    device_measurements.append(measurement)
+                measurements.append(device_measurements)
+                measurement_counts.append(len(device_measurements))
+                signal_counts.append(len(signals))
 
         if not len(measurement_counts):
             logger.info("No data to save")
             return
-        elif any(map(lambda n: n != measurement_counts[0], measurement_counts)):
-            logger.error("Not the same measurement count")
-            return
 
-        # If everything is all right, build measurement rows
+        # Build measurement rows. Devices sampled at different rates have
+        # different measurement counts, shorter columns are left empty.
         data_lines = [file_header, data_header]
-        for i in range(measurement_counts[0]):
-            measurement = measurements[0][i]
-            for j in range(1, len(measurements)):
-                measurement += "\t"
-                measurement += measurements[j][i]
-            data_lines.append(measurement)
+        for i in range(max(measurement_counts)):
+            row = []
+            for j, device_measurements in enumerate(measurements):
+                if i < measurement_counts[j]:
+                    row.append(device_measurements[i])
+                else:
+                    # Empty timestamp and signal values
+                    row.append("\t" * signal_counts[j])
+            data_lines.append("\t".join(row))
 
         # Obtain file to save the data
         file = QtWidgets.QFileDialog.getSaveFileName(self, "Save file", "")[0]
@@ -531,11 +873,31 @@ class MainWindow(QtWidgets.QMainWindow, interface.Ui_MainWindow):
         self.log_handler.enabled[logging.ERROR] = self.ErrorCheck.isChecked()
         return
 
-def run():
+def run(startup_hook=None, metrics_address=None, publisher=None,
+        aggregator=None, engine="timer"):
+    """
+    Start the application.
+
+    startup_hook, if given, is called with the name of every startup
+    stage as it is completed, for profiling the startup time.
+    metrics_address, if given, is the (host, port) where the metrics are
+    served. publisher, if given, is a started SamplePublisher, and
+    aggregator a started Aggregator. engine is the measurement engine
+    mode of the MainWindow.
+    """
+    if startup_hook is None:
+        def startup_hook(stage):
+            return
     # The QApplication object manages the application control flow and settings.
     app = QtWidgets.QApplication(sys.argv)
     # Set to a GTK allowed style in order to avoid annoying errors on Ubuntu.
     app.setStyle(QtWidgets.QStyleFactory.create("plastique"))
-    form = MainWindow()
+    startup_hook("application created")
+    form = MainWindow(metrics_address, publisher, aggregator, engine)
+    startup_hook("main window built")
+    form.canvas_ready.connect(lambda: startup_hook("plot canvas built"))
+    app.aboutToQuit.connect(form.close_devices)
+    app.aboutToQuit.connect(form.stop_rendering)
     form.show()
+    startup_hook("main window shown")
     sys.exit(app.exec_())
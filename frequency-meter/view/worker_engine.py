@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Measurement engine fetching the devices in worker processes.
+
+Every worker process opens its own connection to its devices, from their
+device files, and fetches them on their schedules, so the sampling does
+not share the interpreter with the plot and the user interface, and the
+devices run on several cores. The stored samples are sent in batches
+through a pipe, and stored in the devices of the application by a
+receiving thread. Only the messages of the workers are pickled: the
+samples of a batch as (channel, timestamp, values) tuples, and the fetch
+statistics every STATS_INTERVAL seconds.
+"""
+# Standard libraries
+from collections import OrderedDict
+import logging
+import multiprocessing
+import threading
+import time
+# Local libraries
+from view import instrumentation
+from view import measurement_engine
+
+logger = logging.getLogger("view")
+
+# Time (s) between the fetch statistics sent by the workers
+STATS_INTERVAL = 1.0
+
+
+class PipeLogHandler(logging.Handler):
+    """Send the log records of a worker to the application."""
+    def __init__(self, connection, lock):
+        logging.Handler.__init__(self)
+        self.__connection = connection
+        self.__lock = lock
+
+    def emit(self, record):
+        try:
+            message = self.format(record)
+            with self.__lock:
+                self.__connection.send(("log", record.levelno, message))
+        except Exception:
+            self.handleError(record)
+        return
+
+
+def run_worker(name, group, connection, adaptive, batch_interval):
+    """
+    Main function of a worker process.
+
+    group is a list with the device file, the measurement settings and
+    the fetch period of every device of the worker. The devices are
+    fetched until a message is received from the application.
+    """
+    # Local libraries
+    from view import freqmeterdevice
+
+    # Sends through the pipe, from the main thread and from the log
+    # records of any thread
+    lock = threading.Lock()
+    logger.setLevel(logging.INFO)
+    logger.addHandler(PipeLogHandler(connection, lock))
+
+    def send(message):
+        with lock:
+            connection.send(message)
+        return
+
+    devices = []
+    schedules = []
+    batches = []
+    for path, settings, period in group:
+        device = freqmeterdevice.FreqMeter.get_freq_meter(path)
+        # The application mirrors the samples it receives
+        device.set_shared_memory(False)
+        if not device.connect():
+            logger.error("Worker {} unable to connect to device {}".format(
+                    name, device.get_name()))
+            devices.append(None)
+            schedules.append(None)
+            batches.append(None)
+            continue
+        device.start_measurement(*settings)
+        batch = []
+        device.add_sample_listener(
+                lambda device, channel, timestamp, values, batch=batch:
+                batch.append((channel, timestamp, values)))
+        devices.append(device)
+        schedules.append(measurement_engine.DeviceSchedule(device, period,
+                                                           adaptive))
+        batches.append(batch)
+    running = [schedule for schedule in schedules if schedule]
+
+    def flush(stats):
+        for index, batch in enumerate(batches):
+            if batch:
+                send(("samples", index, list(batch)))
+                del batch[:]
+            if stats and schedules[index]:
+                schedule = schedules[index]
+                send(("stats", index, schedule.missed_ticks,
+                      schedule.latencies, schedule.lateness))
+        return
+
+    epoch = time.monotonic()
+    for schedule in running:
+        schedule.start(epoch)
+    next_flush = epoch + batch_interval
+    next_stats = epoch + STATS_INTERVAL
+    tolerance = measurement_engine.MeasurementTimer.TOLERANCE
+    try:
+        while True:
+            due = min([schedule.next_due for schedule in running] +
+                      [next_flush])
+            # Any message, or the end of the application, stops the worker
+            if connection.poll(max(0.0, due - time.monotonic())):
+                break
+            now = time.monotonic()
+            for schedule in running:
+                if schedule.next_due <= now + tolerance:
+                    schedule.lateness.record(
+                            int(max(0.0, now - schedule.next_due) * 1e9))
+                    schedule.fetch()
+            if now >= next_flush:
+                flush(now >= next_stats)
+                next_flush = now + batch_interval
+                if now >= next_stats:
+                    next_stats = now + STATS_INTERVAL
+        for device in devices:
+            if device:
+                device.stop_measurement()
+        flush(True)
+        for device in devices:
+            if device:
+                device.disconnect()
+        send(("done",))
+    except (EOFError, OSError):
+        # The application is gone
+        pass
+    return
+
+
+class WorkerSchedule(object):
+    """
+    Fetch schedule of a device fetched by a worker process, with the
+    statistics last reported by the worker.
+    """
+    def __init__(self, device, period, adaptive=False):
+        self.device = device
+        self.period = period
+        self.adaptive = measurement_engine.DeviceSchedule.is_adaptive(
+                device, adaptive)
+        self.latencies = instrumentation.LatencyHistogram()
+        self.lateness = instrumentation.LatencyHistogram()
+        self.missed_ticks = 0
+
+
+class Worker(object):
+    """
+    Worker process fetching a group of devices, and the thread storing
+    the samples it sends in the devices of the application.
+
+    The devices are handed over to the process: their connection is
+    closed in the application while the worker runs, and opened again
+    when it stops. They are only configured and measured by the worker.
+    """
+    # Time (s) waited for the worker to end before terminating it
+    STOP_TIMEOUT = 5.0
+
+    def __init__(self, context, name, devices, periods, adaptive,
+                 batch_interval):
+        self.name = name
+        self.devices = list(devices)
+        self.schedules = [WorkerSchedule(device, period, adaptive)
+                          for device, period in zip(self.devices, periods)]
+        group = [(device.get_device_path(),
+                  device.get_measurement_settings(), period)
+                 for device, period in zip(self.devices, periods)]
+        self.__connection, child = context.Pipe()
+        self.__child = child
+        self.__process = context.Process(
+                target=run_worker, name="worker-{}".format(name),
+                args=(name, group, child, adaptive, batch_interval),
+                daemon=True)
+        self.__receiver = None
+
+    def start(self):
+        for device in self.devices:
+            device.detach()
+        self.__process.start()
+        # The pipe end of the worker is only kept open by the worker
+        self.__child.close()
+        self.__receiver = threading.Thread(
+                target=self.__receive, name="receiver-{}".format(self.name),
+                daemon=True)
+        self.__receiver.start()
+        logger.info("Worker {} fetching {} (pid {})".format(
+                self.name, ", ".join(device.get_name()
+                                     for device in self.devices),
+                self.__process.pid))
+        return
+
+    def request_stop(self):
+        try:
+            self.__connection.send(("stop",))
+        except OSError:
+            pass
+        return
+
+    def join(self):
+        """Wait for the worker to end, and take the devices back."""
+        self.__receiver.join(self.STOP_TIMEOUT)
+        self.__process.join(self.STOP_TIMEOUT)
+        if self.__process.is_alive():
+            logger.warning("Worker {} did not stop, terminating it".format(
+                    self.name))
+            self.__process.terminate()
+            self.__process.join()
+        self.__connection.close()
+        for device in self.devices:
+            if not device.attach():
+                logger.error("Unable to connect again to device {}".format(
+                        device.get_name()))
+        return
+
+    def __receive(self):
+        while True:
+            try:
+                message = self.__connection.recv()
+            except (EOFError, OSError):
+                logger.error("Worker {} ended unexpectedly".format(
+                        self.name))
+                break
+            kind = message[0]
+            if kind == "samples":
+                self.devices[message[1]].store_samples(message[2])
+            elif kind == "stats":
+                schedule = self.schedules[message[1]]
+                (schedule.missed_ticks, schedule.latencies,
+                 schedule.lateness) = message[2:]
+            elif kind == "log":
+                logger.log(message[1], message[2])
+            elif kind == "done":
+                break
+        return
+
+
+class ProcessMeasurementEngine(measurement_engine.MeasurementEngine):
+    """
+    Measurement engine that fetches every device in a worker process.
+
+    Devices with the same Worker in the acquisition section of their
+    device file share a process. Devices without device file, such as
+    the remote ones, are fetched in the application, as the timer engine
+    does.
+    """
+    # Maximum time (s) a sample waits in a worker
+    BATCH_INTERVAL = 0.05
+
+    def __init__(self, adaptive=False, batch_interval=BATCH_INTERVAL):
+        measurement_engine.MeasurementEngine.__init__(self, threaded=False,
+                                                      adaptive=adaptive)
+        self.__adaptive = adaptive
+        self.__batch_interval = batch_interval
+        # Workers are started from scratch, not forked from a process
+        # running Qt threads
+        self.__context = multiprocessing.get_context("spawn")
+        self.__workers = []
+
+    def hands_over(self, device):
+        return device.get_device_path() is not None
+
+    def start(self, devices, fetch_time, periods=None):
+        periods = periods or {}
+        local = []
+        groups = OrderedDict()
+        for device in devices:
+            if not self.hands_over(device):
+                local.append(device)
+            else:
+                groups.setdefault(device.get_worker() or device.get_name(),
+                                  []).append(device)
+        self.__workers = []
+        for name, group in groups.items():
+            worker = Worker(self.__context, name, group,
+                            [periods.get(device, fetch_time)
+                             for device in group],
+                            self.__adaptive, self.__batch_interval)
+            worker.start()
+            self.__workers.append(worker)
+        measurement_engine.MeasurementEngine.start(self, local, fetch_time,
+                                                   periods)
+        return
+
+    def stop(self):
+        for worker in self.__workers:
+            worker.request_stop()
+        for worker in self.__workers:
+            worker.join()
+            for device in worker.devices:
+                logger.info("{}: {} samples at {:.3f} Hz in worker {}".format(
+                        device.get_name(), device.get_sample_count(),
+                        device.get_effective_rate(), worker.name))
+        measurement_engine.MeasurementEngine.stop(self)
+        return
+
+    def get_sample_rates(self):
+        rates = measurement_engine.MeasurementEngine.get_sample_rates(self)
+        for worker in self.__workers:
+            for device in worker.devices:
+                rates[device.get_name()] = device.get_effective_rate()
+        return rates
+
+    def get_schedules(self):
+        schedules = list(
+                measurement_engine.MeasurementEngine.get_schedules(self))
+        for worker in self.__workers:
+            schedules.extend(worker.schedules)
+        return schedules